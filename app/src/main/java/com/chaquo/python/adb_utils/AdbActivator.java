@@ -6,8 +6,10 @@ import android.content.ActivityNotFoundException;
 import android.content.ContentResolver;
 import android.content.Context;
 import android.content.Intent;
+import android.content.SharedPreferences;
 import android.content.pm.PackageManager;
 import android.os.Build;
+import android.os.SystemClock;
 import android.provider.Settings;
 import android.util.Log;
 
@@ -16,6 +18,14 @@ import androidx.annotation.RequiresApi;
 import com.elvishew.xlog.Logger;
 import com.elvishew.xlog.XLog;
 
+import java.io.DataInputStream;
+import java.io.IOException;
+import java.io.OutputStream;
+import java.net.InetSocketAddress;
+import java.net.Socket;
+import java.nio.ByteBuffer;
+import java.nio.ByteOrder;
+import java.nio.charset.StandardCharsets;
 import java.util.Arrays;
 import java.util.List;
 import java.util.Map;
@@ -28,6 +38,16 @@ import java.util.concurrent.TimeUnit;
 public class AdbActivator
 {
     private final Logger logger = XLog.tag(this.getClass().getName()).build();
+    // Last wireless debugging port that worked, probed before mDNS discovery on the next launch
+    private static final String PREFS_NAME = "adb_endpoint";
+    private static final String PREF_LAST_PORT = "last_port";
+    private static final int PROBE_TIMEOUT_MS = 500;
+    // adb wire protocol (system/core/adb/protocol.txt)
+    private static final int A_CNXN = 0x4e584e43;
+    private static final int A_AUTH = 0x48545541;
+    private static final int A_STLS = 0x534c5453;
+    private static final int A_VERSION = 0x01000001;
+    private static final int MAX_PAYLOAD = 256 * 1024;
     private Context context = null;
     private AdbProcessManager adbProcess = null;
 
@@ -130,6 +150,8 @@ public class AdbActivator
             } catch (InterruptedException e) {
                 e.printStackTrace();
             }
+            // Without this the caller's get() would wait forever
+            result.completeExceptionally(new SecurityException("Fail to find wireless ADB service"));
         });
 
         executor.shutdown();
@@ -137,14 +159,88 @@ public class AdbActivator
     }
 
     // Returns adb port number
+    // The last known port is probed while mDNS discovery runs; whichever confirms a port first wins
     public CompletableFuture<Integer> enableAndDiscoverAdbPort() throws SecurityException, UnsupportedOperationException
     {
-        if (Build.VERSION.SDK_INT >= Build.VERSION_CODES.TIRAMISU) {
-            enableWirelessAdb();
-            return discoverAdbService();
-        } else {
+        if (Build.VERSION.SDK_INT < Build.VERSION_CODES.TIRAMISU) {
             throw new UnsupportedOperationException("Android version is too old");
         }
+        enableWirelessAdb();
+
+        final long startedAt = SystemClock.elapsedRealtime();
+        final CompletableFuture<Integer> result = new CompletableFuture<>();
+        final CompletableFuture<Integer> mdns = discoverAdbService();
+        final int cachedPort = loadCachedPort();
+
+        final CompletableFuture<Integer> cached = cachedPort <= 0
+                ? CompletableFuture.completedFuture(-1)
+                : CompletableFuture.supplyAsync(() -> probeAdbPort(cachedPort, PROBE_TIMEOUT_MS) ? cachedPort : -1);
+        cached.thenAccept(port -> {
+            long elapsed = SystemClock.elapsedRealtime() - startedAt;
+            if (port > 0) {
+                logger.d("Cached ADB port " + port + " verified in " + elapsed + " ms");
+                result.complete(port);
+            } else if (cachedPort > 0) {
+                logger.d("Cached ADB port " + cachedPort + " did not answer (" + elapsed + " ms), waiting for mDNS");
+            }
+        });
+        mdns.whenComplete((port, error) -> {
+            long elapsed = SystemClock.elapsedRealtime() - startedAt;
+            if (error == null) {
+                logger.d("mDNS discovery found ADB port " + port + " in " + elapsed + " ms");
+                saveCachedPort(port);
+                result.complete(port);
+            } else {
+                logger.d("mDNS discovery failed after " + elapsed + " ms: " + error.getMessage());
+                cached.thenAccept(cachedResult -> {
+                    if (cachedResult <= 0) {
+                        result.completeExceptionally(error);
+                    }
+                });
+            }
+        });
+        return result;
+    }
+
+    private int loadCachedPort() {
+        return context.getSharedPreferences(PREFS_NAME, Context.MODE_PRIVATE).getInt(PREF_LAST_PORT, -1);
+    }
+
+    private void saveCachedPort(int port) {
+        SharedPreferences prefs = context.getSharedPreferences(PREFS_NAME, Context.MODE_PRIVATE);
+        if (prefs.getInt(PREF_LAST_PORT, -1) != port) {
+            prefs.edit().putInt(PREF_LAST_PORT, port).apply();
+        }
+    }
+
+    // True if adbd answers on the port: TCP connect, send CNXN, expect CNXN/AUTH/STLS back
+    protected boolean probeAdbPort(int port, int timeoutMs) {
+        try (Socket socket = new Socket()) {
+            socket.connect(new InetSocketAddress("127.0.0.1", port), timeoutMs);
+            socket.setSoTimeout(timeoutMs);
+
+            byte[] payload = "host::\0".getBytes(StandardCharsets.UTF_8);
+            int checksum = 0;
+            for (byte b : payload) {
+                checksum += b & 0xff;
+            }
+            ByteBuffer header = ByteBuffer.allocate(24).order(ByteOrder.LITTLE_ENDIAN);
+            header.putInt(A_CNXN).putInt(A_VERSION).putInt(MAX_PAYLOAD)
+                  .putInt(payload.length).putInt(checksum).putInt(~A_CNXN);
+            OutputStream out = socket.getOutputStream();
+            out.write(header.array());
+            out.write(payload);
+            out.flush();
+
+            byte[] reply = new byte[24];
+            new DataInputStream(socket.getInputStream()).readFully(reply);
+            ByteBuffer replyHeader = ByteBuffer.wrap(reply).order(ByteOrder.LITTLE_ENDIAN);
+            int command = replyHeader.getInt(0);
+            int magic = replyHeader.getInt(20);
+            return magic == ~command && (command == A_CNXN || command == A_AUTH || command == A_STLS);
+        } catch (IOException e) {
+            return false;
+        }
     }
 
     // Enter Wireless ADB settings page
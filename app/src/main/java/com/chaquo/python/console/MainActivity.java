@@ -177,8 +177,10 @@ public class MainActivity extends PythonConsoleActivity {
                     adbActivator.pairDevice(6555, "924621");
 
                     // After pairing, ADB is auto connected to the device.
+                    long discoveryStart = android.os.SystemClock.elapsedRealtime();
                     adbPort = adbActivator.enableAndDiscoverAdbPort().get();
-                    print("Wireless ADB service found. ADB port: " + adbPort);
+                    print("Wireless ADB service found. ADB port: " + adbPort + " (in "
+                            + (android.os.SystemClock.elapsedRealtime() - discoveryStart) + " ms)");
                 } catch (SecurityException | ExecutionException | InterruptedException | UnsupportedOperationException e) {
                     print("Fail to attach to wireless ADB: " + e.getMessage());
                     return;
@@ -1,15 +1,22 @@
 from io import TextIOBase
-from queue import Queue
+from collections import deque
+from queue import Empty, Queue
 
 
 class ConsoleInputStream(TextIOBase):
     """Receives input in on_input in one thread (non-blocking), and provides a read interface
     in another thread (blocking).
+
+    Input is kept as a deque of chunks with a read offset into the first one, so reads and
+    lines are sliced out of what is pending without rebuilding a buffer string, and the task
+    is only told about the input state when the reader actually has to wait.
     """
     def __init__(self, task):
         self.task = task
         self.queue = Queue()
-        self.buffer = ""
+        self.chunks = deque()
+        self.offset = 0   # characters of chunks[0] already returned
+        self.pending = 0  # characters in chunks not yet returned
         self.eof = False
 
     @property
@@ -30,37 +37,71 @@ class ConsoleInputStream(TextIOBase):
             self.eof = True
         self.queue.put(input)
 
-    def read(self, size=None):
-        if size is not None and size < 0:
-            size = None
-        buffer = self.buffer
-        while (self.queue is not None) and ((size is None) or (len(buffer) < size)):
-            if self.queue.empty():
-                self.task.onInputState(True)
-            input = self.queue.get()
+    def _fill(self):
+        """Waits for the next input, then takes everything else already queued without
+        blocking."""
+        blocked = self.queue.empty()
+        if blocked:
+            self.task.onInputState(True)
+        input = self.queue.get()
+        if blocked:
             self.task.onInputState(False)
+        while True:
             if input is None:  # EOF
                 self.queue = None
+                return
+            if input:
+                self.chunks.append(input)
+                self.pending += len(input)
+            try:
+                input = self.queue.get_nowait()
+            except Empty:
+                return
+
+    def _take(self, size):
+        """Removes and returns the first `size` pending characters."""
+        pieces = []
+        while size > 0:
+            chunk = self.chunks[0]
+            start = self.offset
+            end = min(len(chunk), start + size)
+            pieces.append(chunk[start:end] if (start or end < len(chunk)) else chunk)
+            size -= end - start
+            self.pending -= end - start
+            if end == len(chunk):
+                self.chunks.popleft()
+                self.offset = 0
             else:
-                buffer += input
+                self.offset = end
+        return "".join(pieces)
 
-        result = buffer if (size is None) else buffer[:size]
-        self.buffer = buffer[len(result):]
-        return result
+    def read(self, size=None):
+        if size is not None and size < 0:
+            size = None
+        while (self.queue is not None) and ((size is None) or (self.pending < size)):
+            self._fill()
+        return self._take(self.pending if (size is None) else min(size, self.pending))
 
     def readline(self, size=None):
         if size is not None and size < 0:
             size = None
-        chars = []
-        while (size is None) or (len(chars) < size):
-            c = self.read(1)
-            if not c:
-                break
-            chars.append(c)
-            if c == "\n":
-                break
-
-        return "".join(chars)
+        # Scan each chunk for a newline once: `scanned` pending characters are known to have
+        # none, and `index`, `start` locate where the scan continues.
+        scanned = 0
+        index, start = 0, self.offset
+        while True:
+            limit = self.pending if (size is None) else min(size, self.pending)
+            while scanned < limit:
+                chunk = self.chunks[index]
+                end = min(len(chunk), start + limit - scanned)
+                newline = chunk.find("\n", start, end)
+                if newline >= 0:
+                    return self._take(scanned + newline + 1 - start)
+                scanned += end - start
+                index, start = index + 1, 0
+            if (self.queue is None) or ((size is not None) and (scanned >= size)):
+                return self._take(limit)
+            self._fill()
 
 
 class ConsoleOutputStream(TextIOBase):
@@ -0,0 +1,117 @@
+import re
+import threading
+import time
+
+# Event kinds the watcher can produce. The gateway tells the bridge which ones
+# have subscribers ("watch" message) and only those probes run.
+EVENT_KINDS = ("app", "toast", "dialog", "screen")
+
+_UNSET = object()
+_FOCUS_RE = re.compile(r"mCurrentFocus=Window\{\S+ \S+ ([^}]+)\}")
+
+
+def parse_focus_window(dumpsys_output: str):
+    """Return the focused window title from `dumpsys window` output, or None"""
+    match = _FOCUS_RE.search(dumpsys_output or "")
+    return match.group(1).strip() if match else None
+
+
+class DeviceEventWatcher:
+    """Polls cheap device state in a background thread and emits compact
+    `event` messages through `send` when something changes.
+
+    The thread only runs while at least one event kind is watched.
+    """
+
+    def __init__(self, get_device, send, interval: float = 1.0, shell=None):
+        self.get_device = get_device
+        self.send = send
+        self.shell = shell  # shell(cmd) -> response with .output; defaults to d.shell
+        self.interval = interval
+        self.kinds = frozenset()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.last = {}
+
+    def set_kinds(self, kinds):
+        kinds = frozenset(k for k in (kinds or ()) if k in EVENT_KINDS)
+        with self.lock:
+            if kinds == self.kinds:
+                return
+            print(f"MCP Events: Watching {sorted(kinds) or 'nothing'}")
+            # Forget state of kinds that are no longer watched so re-subscribing starts fresh
+            for kind in self.kinds - kinds:
+                self.last.pop(kind, None)
+            self.kinds = kinds
+            if kinds and self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.set_kinds(())
+
+    def _emit(self, kind: str, data: dict):
+        self.send({"type": "event", "kind": kind, "ts": round(time.time(), 3), "data": data})
+
+    def _changed(self, kind: str, value) -> bool:
+        """Record the latest value; True if it differs from a previously seen one"""
+        previous = self.last.get(kind, _UNSET)
+        self.last[kind] = value
+        return previous is not _UNSET and previous != value
+
+    def _run(self):
+        while True:
+            with self.lock:
+                kinds = self.kinds
+                if not kinds:
+                    self.thread = None
+                    break
+            try:
+                d = self.get_device()
+                if "app" in kinds:
+                    self._poll_app(d)
+                if "screen" in kinds:
+                    self._poll_screen(d)
+                if "toast" in kinds:
+                    self._poll_toast(d)
+                if "dialog" in kinds:
+                    self._poll_dialog(d)
+            except Exception as e:
+                print(f"MCP Events: Poll failed: {e}")
+            time.sleep(self.interval)
+        print("MCP Events: Watcher stopped, no subscribers")
+
+    def _poll_app(self, d):
+        current = d.app_current()
+        value = (current.get("package"), current.get("activity"))
+        if self._changed("app", value):
+            self._emit("app", {"package": value[0], "activity": value[1]})
+
+    def _poll_screen(self, d):
+        screen_on = bool(d.info.get("screenOn"))
+        if self._changed("screen", screen_on):
+            self._emit("screen", {"on": screen_on})
+
+    def _poll_toast(self, d):
+        # uiautomator2 >= 3 exposes last_toast/clear_toast, 2.x has d.toast
+        if hasattr(d, "last_toast"):
+            message = d.last_toast
+            if message:
+                d.clear_toast()
+        else:
+            message = d.toast.get_message(0, 1.5, None)
+            if message:
+                d.toast.reset()
+        if message:
+            self._emit("toast", {"text": message})
+
+    def _poll_dialog(self, d):
+        shell = self.shell or d.shell
+        focus = parse_focus_window(shell("dumpsys window | grep mCurrentFocus").output)
+        if not self._changed("dialog", focus) or not focus:
+            return
+        # Activity windows are "package/activity"; anything else with focus (popup,
+        # system alert, ANR prompt) is reported as a dialog
+        if "/" not in focus:
+            self._emit("dialog", {"window": focus})
+
@@ -0,0 +1,237 @@
+import os
+import re
+import zlib
+import base64
+import shutil
+import time
+import hashlib
+import threading
+
+CHUNK_SIZE = 64 * 1024  # Suggested to the sender; one chunk per rpc.call
+MAX_CHUNK_SIZE = 1024 * 1024
+KEEP_BLOBS = 20  # Completed uploads kept for hash-based skipping
+STAGING_MAX_AGE = 6 * 3600  # seconds an untouched .part upload or pull-* copy is kept for resuming
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _chunk_bytes(data) -> bytes:
+    # Socket.IO delivers binary attachments as bytes; JSON-only senders may use base64
+    if isinstance(data, str):
+        return base64.b64decode(data)
+    return bytes(data or b"")
+
+
+class TransferStore:
+    """Files moved through the bridge in checksummed chunks.
+
+    Uploads are assembled in `root` as <sha256>.part, so a transfer cut by a
+    disconnect (or an app restart) resumes from the bytes already written.
+    Finished uploads are kept as <sha256>; pushing content the device already
+    has, there or at the destination path, skips the transfer.
+
+    Paths the app cannot write or read directly (e.g. /data/local/tmp) go
+    through adb push/pull on the device's own adb connection.
+    """
+
+    def __init__(self, root: str, get_device, run_shell):
+        self.root = root
+        self.get_device = get_device
+        self.run_shell = run_shell
+        self.lock = threading.Lock()
+        self.hashes = {}  # path -> ((size, mtime), sha256) for files offered to pull
+        self.pull_sources = {}  # requested path -> local readable copy
+        os.makedirs(root, exist_ok=True)
+        with self.lock:
+            self._prune()  # leftovers of transfers cut short before the app restarted
+
+    def _blob(self, sha256: str) -> str:
+        sha256 = (sha256 or "").lower()
+        if not _SHA256_RE.match(sha256):
+            raise ValueError(f"invalid sha256: {sha256!r}")
+        return os.path.join(self.root, sha256)
+
+    def _cached_sha256(self, path: str) -> str:
+        st = os.stat(path)
+        key = (st.st_size, st.st_mtime)
+        cached = self.hashes.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        sha256 = file_sha256(path)
+        self.hashes[path] = (key, sha256)
+        return sha256
+
+    def push_file(self, params: dict) -> dict:
+        op = params.get("op")
+        if op == "begin":
+            return self._push_begin(params)
+        if op == "chunk":
+            return self._push_chunk(params)
+        if op == "end":
+            return self._push_end(params)
+        return {"success": False, "error": f"Unknown push_file op: {op}"}
+
+    def _push_begin(self, params: dict) -> dict:
+        sha256 = params.get("sha256", "").lower()
+        size = int(params.get("size", 0))
+        dest = params.get("path")
+        blob = self._blob(sha256)
+
+        if dest and os.path.isfile(dest) and os.path.getsize(dest) == size and self._cached_sha256(dest) == sha256:
+            print(f"MCP Transfer: {dest} already has {sha256[:12]}, skipping push")
+            return {"success": True, "skipped": True, "offset": size, "path": dest}
+        if os.path.isfile(blob) and os.path.getsize(blob) == size:
+            print(f"MCP Transfer: {sha256[:12]} already on device, skipping push")
+            return {"success": True, "skipped": True, "offset": size, "path": self._place(blob, dest)}
+
+        part = blob + ".part"
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        if offset > size:
+            os.remove(part)
+            offset = 0
+        if offset:
+            print(f"MCP Transfer: Resuming push of {sha256[:12]} at {offset}/{size}")
+        return {"success": True, "skipped": False, "offset": offset, "chunk_size": CHUNK_SIZE}
+
+    def _push_chunk(self, params: dict) -> dict:
+        part = self._blob(params.get("sha256")) + ".part"
+        offset = int(params.get("offset", 0))
+        data = _chunk_bytes(params.get("data"))
+        with self.lock:
+            current = os.path.getsize(part) if os.path.exists(part) else 0
+            if len(data) > MAX_CHUNK_SIZE:
+                return {"success": False, "error": f"Chunk larger than {MAX_CHUNK_SIZE} bytes", "offset": current}
+            if zlib.crc32(data) != params.get("crc32"):
+                return {"success": False, "error": "Chunk checksum mismatch", "offset": current}
+            if offset != current:
+                # Lost ack or duplicate: tell the sender where to continue
+                return {"success": False, "error": f"Expected offset {current}", "offset": current}
+            with open(part, "ab") as f:
+                f.write(data)
+            return {"success": True, "offset": current + len(data)}
+
+    def _push_end(self, params: dict) -> dict:
+        sha256 = params.get("sha256", "").lower()
+        blob = self._blob(sha256)
+        part = blob + ".part"
+        with self.lock:
+            if not os.path.exists(blob):
+                if not os.path.exists(part):
+                    return {"success": False, "error": "No upload in progress", "offset": 0}
+                actual = file_sha256(part)
+                if actual != sha256:
+                    os.remove(part)
+                    return {"success": False, "error": f"Content hash mismatch ({actual[:12]})", "offset": 0}
+                os.replace(part, blob)
+            self._prune()
+        path = self._place(blob, params.get("path"))
+        print(f"MCP Transfer: Push of {sha256[:12]} complete -> {path}")
+        return {"success": True, "path": path, "sha256": sha256, "size": os.path.getsize(blob)}
+
+    def _place(self, blob: str, dest: str) -> str:
+        """Copy a finished upload to `dest`; adb push when the app may not write there"""
+        if not dest or dest == blob:
+            return blob
+        try:
+            os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+            shutil.copyfile(blob, dest)
+        except OSError:
+            self.get_device().push(blob, dest)
+        return dest
+
+    def _prune(self):
+        """Keep the newest KEEP_BLOBS uploads; drop .part uploads and pull-* copies untouched for STAGING_MAX_AGE"""
+        blobs, staging = [], []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if _SHA256_RE.match(name):
+                blobs.append(path)
+            elif name.endswith(".part") or name.startswith("pull-"):
+                staging.append(path)
+        blobs.sort(key=os.path.getmtime, reverse=True)
+        cutoff = time.time() - STAGING_MAX_AGE
+        stale = blobs[KEEP_BLOBS:] + [path for path in staging if os.path.getmtime(path) < cutoff]
+        for path in stale:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def pull_file(self, params: dict) -> dict:
+        op = params.get("op")
+        path = params.get("path")
+        if not path:
+            return {"success": False, "error": "Missing path"}
+        if op == "begin":
+            # A resuming receiver keeps using the copy it started from
+            source = self._pull_source(path, refresh=not params.get("resume"))
+            size = os.path.getsize(source)
+            return {"success": True, "size": size, "sha256": self._cached_sha256(source), "chunk_size": CHUNK_SIZE}
+        if op == "chunk":
+            source = self._pull_source(path)
+            offset = int(params.get("offset", 0))
+            length = min(int(params.get("length") or CHUNK_SIZE), MAX_CHUNK_SIZE)
+            with open(source, "rb") as f:
+                f.seek(offset)
+                data = f.read(length)
+            return {"success": True, "offset": offset, "data": data, "crc32": zlib.crc32(data),
+                    "eof": offset + len(data) >= os.path.getsize(source)}
+        return {"success": False, "error": f"Unknown pull_file op: {op}"}
+
+    def _pull_source(self, path: str, refresh: bool = False) -> str:
+        """A readable file with the contents of `path`; adb pull into the store if needed"""
+        if os.access(path, os.R_OK):
+            return path
+        source = self.pull_sources.get(path)
+        if source is None or refresh or not os.path.exists(source):
+            source = os.path.join(self.root, "pull-" + hashlib.sha1(path.encode()).hexdigest())
+            self.get_device().pull(path, source)
+            self.pull_sources[path] = source
+            with self.lock:
+                self._prune()
+        return source
+
+    def install_apk(self, params: dict, timeout: float = None) -> dict:
+        """Install a pushed APK (by sha256) or an APK already on the device (by path)"""
+        if params.get("sha256"):
+            local = self._blob(params["sha256"])
+            if not os.path.isfile(local):
+                return {"success": False, "error": "APK not on device, push it first"}
+            name = params["sha256"][:16]
+        elif params.get("path"):
+            local = params["path"]
+            name = hashlib.sha1(local.encode()).hexdigest()[:16]
+        else:
+            return {"success": False, "error": "Missing sha256 or path"}
+        # pm runs as the shell user, which cannot read the app's private files
+        remote = f"/data/local/tmp/mcp_{name}.apk"
+        self.get_device().push(local, remote)
+        try:
+            flags = "-r -t" + (" -d" if params.get("downgrade") else "")
+            res = self.run_shell(f"pm install {flags} {remote}", timeout)
+        finally:
+            self.run_shell(f"rm -f {remote}")
+        output = res.output.strip()
+        return {"success": "Success" in output, "output": output}
+
+
+def loggable(msg):
+    """`msg` with bulky "data" payloads (chunks, screenshots, hierarchies) replaced by their size, at any depth"""
+    if not isinstance(msg, dict):
+        return msg
+    shown = {}
+    for key, value in msg.items():
+        if key == "data" and isinstance(value, (bytes, bytearray, str)) and len(value) > 64:
+            shown[key] = f"<{len(value)} bytes>"
+        else:
+            shown[key] = loggable(value)
+    changed = any(shown[key] is not msg[key] for key in msg)
+    return shown if changed else msg
@@ -0,0 +1,130 @@
+import time
+import hashlib
+
+# Coordinates are pixels, or fractions of the screen when below 1 (uiautomator2 converts them)
+GESTURE_TYPES = ("swipe", "drag", "pinch", "multi", "pause")
+MAX_GESTURES = 50
+SCROLL_MAX_SWIPES = 15
+SCROLL_TIMEOUT = 60.0   # used when the call carries no deadline
+SCROLL_SPAN = 0.5       # fraction of the container swiped per step
+SETTLE = 0.3            # seconds for the list to settle after a swipe
+
+
+def _gesture(d, spec: dict) -> dict:
+    kind = spec.get("type")
+    duration = float(spec.get("duration", 0.3))
+    if kind == "swipe":
+        points = [tuple(p) for p in spec.get("points") or ()]
+        if len(points) < 2:
+            raise ValueError("swipe needs at least two points")
+        if len(points) == 2:
+            d.swipe(*points[0], *points[1], duration=duration)
+        else:
+            d.swipe_points(points, duration=duration)
+    elif kind == "drag":
+        d.drag(*spec["from"], *spec["to"], duration=float(spec.get("duration", 0.5)))
+    elif kind in ("pinch", "multi"):
+        selector = spec.get("selector")
+        if not selector:
+            raise ValueError(f"{kind} needs the selector of the element to gesture on")
+        element = d(**selector)
+        steps = int(spec.get("steps", 50))
+        if kind == "pinch":
+            pinch = element.pinch_out if spec.get("direction") == "out" else element.pinch_in
+            pinch(percent=int(spec.get("percent", 50)), steps=steps)
+        else:
+            # Two fingers: [[start, end], [start, end]]
+            (start1, end1), (start2, end2) = spec["fingers"]
+            element.gesture(tuple(start1), tuple(start2), tuple(end1), tuple(end2), steps=steps)
+    elif kind == "pause":
+        time.sleep(float(spec.get("seconds", 0.2)))
+    else:
+        raise ValueError(f"Unknown gesture type: {kind}, available: {list(GESTURE_TYPES)}")
+    return {"type": kind, "ok": True}
+
+
+def run_gestures(d, params: dict) -> dict:
+    """The gesture RPC: one gesture (its fields in params) or a list under "gestures", run in order"""
+    specs = params.get("gestures") or [params]
+    if len(specs) > MAX_GESTURES:
+        return {"success": False, "error": f"At most {MAX_GESTURES} gestures per call"}
+    started = time.perf_counter()
+    done = []
+    for index, spec in enumerate(specs):
+        try:
+            done.append(_gesture(d, spec))
+        except Exception as e:
+            return {"success": False, "error": f"Gesture {index} ({spec.get('type')}) failed: {e}",
+                    "completed": done}
+    return {"success": True, "completed": done, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+def _screen_signature(d) -> str:
+    return hashlib.sha1(d.dump_hierarchy().encode("utf-8")).hexdigest()
+
+
+def _swipe_vector(d, container: dict, direction: str):
+    """Start and end points moving the content in `direction` ("down" shows what is below)"""
+    if container:
+        bounds = d(**container).info["bounds"]
+        left, top, right, bottom = bounds["left"], bounds["top"], bounds["right"], bounds["bottom"]
+    else:
+        width, height = d.window_size()
+        left, top, right, bottom = 0, 0, width, height
+    cx, cy = (left + right) // 2, (top + bottom) // 2
+    dx = int((right - left) * SCROLL_SPAN / 2)
+    dy = int((bottom - top) * SCROLL_SPAN / 2)
+    return {
+        "down": ((cx, cy + dy), (cx, cy - dy)),
+        "up": ((cx, cy - dy), (cx, cy + dy)),
+        "right": ((cx + dx, cy), (cx - dx, cy)),
+        "left": ((cx - dx, cy), (cx + dx, cy)),
+    }[direction]
+
+
+def scroll_until(d, params: dict, timeout: float = None) -> dict:
+    """The scroll_until RPC: swipe until the selector's element exists, the list stops moving,
+    max_swipes is reached or the deadline passes; optionally click the element.
+
+    Every check runs on the device, so the caller waits for a single result.
+    """
+    selector = params.get("selector")
+    if not selector:
+        return {"success": False, "error": "Missing selector"}
+    direction = params.get("direction") or "down"
+    if direction not in ("down", "up", "left", "right"):
+        return {"success": False, "error": f"Unknown direction: {direction}"}
+    max_swipes = int(params.get("max_swipes") or SCROLL_MAX_SWIPES)
+    deadline = time.time() + (timeout or SCROLL_TIMEOUT) * 0.9
+    container = params.get("container")
+    target = d(**selector)
+
+    swipes = 0
+    exhausted = False
+    signature = None
+    while not target.exists:
+        if swipes >= max_swipes or time.time() >= deadline:
+            break
+        if signature is None:
+            signature = _screen_signature(d)
+        start, end = _swipe_vector(d, container, direction)
+        d.swipe(*start, *end, duration=float(params.get("duration", 0.2)))
+        swipes += 1
+        time.sleep(SETTLE)
+        after = _screen_signature(d)
+        if after == signature:
+            exhausted = True  # Nothing moved: end of the list
+            break
+        signature = after
+
+    result = {"success": True, "found": False, "swipes": swipes, "exhausted": exhausted}
+    if target.exists:
+        result["found"] = True
+        bounds = target.info["bounds"]
+        result["bounds"] = [bounds["left"], bounds["top"], bounds["right"], bounds["bottom"]]
+        if params.get("click"):
+            target.click()
+            result["clicked"] = True
+    elif not exhausted and swipes < max_swipes:
+        result["deadline"] = True
+    return result
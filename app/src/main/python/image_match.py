@@ -0,0 +1,189 @@
+import io
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# numpy and PIL are imported on the first search, not when the bridge starts
+np = None
+Image = None
+
+SCALES = (0.8, 0.9, 1.0, 1.12, 1.25)  # template sizes tried, for density differences
+COARSE_WIDTH = 270       # screenshots are block-averaged down to about this width first
+MATCH_THRESHOLD = 0.8    # normalized cross-correlation needed for a hit
+UNCHANGED_DIFF = 1.5     # mean absolute difference (0-255) of coarse frames treated as the same screen
+MAX_TEMPLATES = 32
+
+
+def _load_numpy() -> bool:
+    global np, Image
+    if np is None:
+        try:
+            import numpy
+            from PIL import Image as pil_image
+        except ImportError:  # find_image / click_image report it instead of breaking the bridge
+            return False
+        np, Image = numpy, pil_image
+    return True
+
+
+def to_gray(image):
+    """float32 luminance array of a PIL image"""
+    return np.asarray(image.convert("L"), dtype=np.float32)
+
+
+def downsample(gray, factor: int):
+    """Block mean over factor x factor tiles"""
+    if factor <= 1:
+        return gray
+    h, w = gray.shape[0] // factor, gray.shape[1] // factor
+    return gray[:h * factor, :w * factor].reshape(h, factor, w, factor).mean(axis=(1, 3))
+
+
+def ncc_map(image, template):
+    """Normalized cross-correlation of `template` at every position where it fits in `image`.
+
+    The correlation term uses one FFT product and the per-window image
+    statistics come from integral images, so the cost does not grow with
+    the template size.
+    """
+    h, w = template.shape
+    H, W = image.shape
+    if h > H or w > W:
+        return None
+    t = template - template.mean()
+    t_norm = float(np.sqrt((t * t).sum()))
+    if t_norm == 0:
+        return None
+    spectrum = np.fft.rfft2(image) * np.conj(np.fft.rfft2(t, s=image.shape))
+    numerator = np.fft.irfft2(spectrum, s=image.shape)[:H - h + 1, :W - w + 1]
+
+    def window_sums(a):
+        s = np.zeros((H + 1, W + 1), dtype=np.float64)
+        s[1:, 1:] = a.cumsum(0).cumsum(1)
+        return s[h:, w:] - s[:-h, w:] - s[h:, :-w] + s[:-h, :-w]
+
+    n = h * w
+    sums = window_sums(image)
+    variance = np.maximum(window_sums(image * image) - sums * sums / n, 0)
+    denominator = np.sqrt(variance) * t_norm
+    return np.where(denominator > 1e-3, numerator / np.maximum(denominator, 1e-3), 0.0)
+
+
+class TemplatePyramid:
+    """A template resized to every scale, as full-size and coarse float32 gray arrays"""
+
+    def __init__(self, data: bytes, factor: int):
+        image = Image.open(io.BytesIO(data))
+        self.size = image.size
+        self.factor = factor
+        self.levels = []  # (scale, full gray, coarse gray)
+        for scale in SCALES:
+            w, h = max(1, round(image.width * scale)), max(1, round(image.height * scale))
+            gray = to_gray(image.resize((w, h), Image.BILINEAR))
+            coarse = downsample(gray, factor)
+            if min(coarse.shape) >= 3:
+                self.levels.append((scale, gray, coarse))
+
+
+class ImageMatcher:
+    """The find_image / click_image RPCs: template matching on the current screenshot.
+
+    Templates arrive as image bytes and are cached by content hash as
+    pyramids of scaled grayscale arrays. Each search block-averages the
+    screenshot, finds the best scale and position on the coarse image,
+    then refines around it at full resolution. When the coarse frame is
+    practically identical to the previous one, the last result for the
+    template is returned without matching again.
+    """
+
+    def __init__(self, get_device):
+        self.get_device = get_device
+        self.templates = OrderedDict()  # sha1 -> TemplatePyramid
+        self.last_frame = None          # coarse gray of the previous screenshot
+        self.last_hits = {}             # sha1 -> result on last_frame
+        self.lock = threading.Lock()
+
+    def _template(self, params: dict, factor: int) -> tuple:
+        data = params.get("template")
+        if not data:
+            raise ValueError("Missing template image")
+        data = bytes(data)
+        sha = hashlib.sha1(data).hexdigest()
+        pyramid = self.templates.get(sha)
+        if pyramid is None or pyramid.factor != factor:
+            pyramid = TemplatePyramid(data, factor)
+            self.templates[sha] = pyramid
+            while len(self.templates) > MAX_TEMPLATES:
+                self.templates.popitem(last=False)
+        self.templates.move_to_end(sha)
+        return sha, pyramid
+
+    def find(self, params: dict) -> dict:
+        if not _load_numpy():
+            return {"success": False, "error": "find_image needs numpy and Pillow on the device"}
+        threshold = float(params.get("threshold") or MATCH_THRESHOLD)
+        started = time.perf_counter()
+        screen = to_gray(self.get_device().screenshot())
+        factor = max(1, screen.shape[1] // COARSE_WIDTH)
+        coarse = downsample(screen, factor)
+
+        with self.lock:
+            sha, pyramid = self._template(params, factor)
+            unchanged = self.last_frame is not None and self.last_frame.shape == coarse.shape \
+                and float(np.abs(self.last_frame - coarse).mean()) < UNCHANGED_DIFF
+            if unchanged and sha in self.last_hits:
+                hit = dict(self.last_hits[sha], cached=True)
+                hit["found"] = hit["score"] >= threshold
+                hit["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                return hit
+            if not unchanged:
+                self.last_frame = coarse
+                self.last_hits = {}
+            frame = self.last_frame
+
+        best = None  # (score, x, y, level)
+        for level in pyramid.levels:
+            scores = ncc_map(coarse, level[2])
+            if scores is None:
+                continue
+            y, x = np.unravel_index(int(np.argmax(scores)), scores.shape)
+            if best is None or scores[y, x] > best[0]:
+                best = (float(scores[y, x]), int(x), int(y), level)
+        if best is None:
+            return {"success": False, "error": "Template is larger than the screen or has no contrast"}
+
+        # Refine around the coarse hit at full resolution
+        _, x, y, (scale, full, _) = best
+        h, w = full.shape
+        left, top = max(0, (x - 1) * factor), max(0, (y - 1) * factor)
+        region = screen[top:top + h + 2 * factor, left:left + w + 2 * factor]
+        scores = ncc_map(region, full)
+        if scores is not None:
+            ry, rx = np.unravel_index(int(np.argmax(scores)), scores.shape)
+            score, x, y = float(scores[ry, rx]), left + int(rx), top + int(ry)
+        else:
+            score, x, y = best[0], x * factor, y * factor
+
+        hit = {
+            "success": True,
+            "found": score >= threshold,
+            "score": round(score, 4),
+            "x": x + w // 2,
+            "y": y + h // 2,
+            "bounds": [x, y, x + w, y + h],
+            "scale": scale,
+            "cached": False,
+        }
+        with self.lock:
+            if self.last_frame is frame:
+                self.last_hits[sha] = dict(hit)
+        hit["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return hit
+
+    def click(self, params: dict) -> dict:
+        hit = self.find(params)
+        if hit.get("found"):
+            self.get_device().click(hit["x"], hit["y"])
+            hit["clicked"] = True
+        return hit
@@ -0,0 +1,69 @@
+import sys
+import time
+import builtins
+import threading
+
+# Modules whose first import took longer than this are listed in the report
+REPORT_MIN_MS = 20.0
+REPORT_TOP = 12
+
+
+class ImportProfiler:
+    """Times first imports while installed, like `python -X importtime` (which
+    cannot be passed to the embedded interpreter).
+
+    Wraps builtins.__import__, so `import x` statements are covered on every
+    thread; each module gets its cumulative time and its self time (without
+    the modules it imported in turn).
+    """
+
+    def __init__(self):
+        self.cumulative = {}
+        self.self_time = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.original = None
+        self.started = None
+
+    def install(self):
+        if self.original is None:
+            self.original = builtins.__import__
+            self.started = time.perf_counter()
+            builtins.__import__ = self._import
+
+    def uninstall(self):
+        # Bound methods compare equal but are not identical
+        if self.original is not None and builtins.__import__ == self._import:
+            builtins.__import__ = self.original
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self.original
+        if level or name in sys.modules:
+            return original(name, globals, locals, fromlist, level)
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        stack.append(0.0)  # time spent in nested first imports
+        started = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self.lock:
+                self.cumulative[name] = self.cumulative.get(name, 0.0) + elapsed
+                self.self_time[name] = self.self_time.get(name, 0.0) + elapsed - children
+
+    def report(self, top: int = REPORT_TOP) -> str:
+        with self.lock:
+            slow = sorted(self.cumulative.items(), key=lambda item: item[1], reverse=True)
+        lines = [f"Import profile ({len(self.cumulative)} modules, "
+                 f"{(time.perf_counter() - self.started) * 1000:.0f} ms since start):"]
+        lines.append(f"  {'cumulative':>11} {'self':>8}  module")
+        for name, elapsed in slow[:top]:
+            if elapsed * 1000 < REPORT_MIN_MS:
+                break
+            lines.append(f"  {elapsed * 1000:>8.0f} ms {self.self_time[name] * 1000:>5.0f} ms  {name}")
+        return "\n".join(lines)
@@ -0,0 +1,161 @@
+import re
+import zlib
+import time
+import base64
+import threading
+import subprocess
+from collections import deque
+
+LEVELS = "VDIWEF"
+RING_SIZE = 2000     # recent lines replayed to a newly added filter
+BATCH_INTERVAL = 1.0  # seconds between batches
+MAX_BATCH_LINES = 500
+
+# logcat -v threadtime: "MM-DD HH:MM:SS.mmm  PID  TID L TAG     : message"
+_LINE_RE = re.compile(r"^\d\d-\d\d \d\d:\d\d:\d\d\.\d+\s+\d+\s+\d+\s+([VDIWEFA])\s+(.*?)\s*: ?(.*)$")
+
+
+class LogcatFilter:
+    """Device-side line filter: {"tags": [...], "level": "W", "regex": "..."}, all optional"""
+
+    def __init__(self, spec: dict):
+        spec = spec or {}
+        self.tags = frozenset(spec.get("tags") or ())
+        level = (spec.get("level") or "V")[:1].upper()
+        self.min_level = LEVELS.index(level) if level in LEVELS else 0
+        self.regex = re.compile(spec["regex"]) if spec.get("regex") else None
+
+    def match(self, line: str) -> bool:
+        parsed = _LINE_RE.match(line)
+        if parsed is None:
+            # "--------- beginning of main" and continuation lines only pass unfiltered specs
+            return not self.tags and not self.min_level and (self.regex is None or bool(self.regex.search(line)))
+        level, tag, message = parsed.groups()
+        if self.tags and tag not in self.tags:
+            return False
+        if LEVELS.find(level) < self.min_level and level != "A":
+            return False
+        return self.regex is None or bool(self.regex.search(message))
+
+
+class LogcatTail:
+    """Tails logcat while at least one filter is active and sends matching lines
+    as compressed `event` batches, one stream per filter key.
+
+    The gateway assigns each distinct subscriber filter a key and sends the
+    current set in "watch"; an empty set stops the logcat process. The last
+    RING_SIZE lines are kept so a newly added filter starts with recent history.
+    """
+
+    def __init__(self, command, send, interval: float = BATCH_INTERVAL):
+        self.command = command  # callable returning the logcat argv without options
+        self.send = send
+        self.interval = interval
+        self.filters = {}  # key -> LogcatFilter
+        self.pending = {}  # key -> lines waiting for the next batch
+        self.ring = deque(maxlen=RING_SIZE)
+        self.proc = None
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.last_seen = None  # epoch of the newest line read, for restarts
+
+    def set_filters(self, specs: dict):
+        specs = specs or {}
+        with self.lock:
+            if set(specs) == set(self.filters):
+                return
+            added = [key for key in specs if key not in self.filters]
+            filters = {}
+            for key, spec in specs.items():
+                try:
+                    filters[key] = self.filters.get(key) or LogcatFilter(spec)
+                except (re.error, TypeError, ValueError, AttributeError) as e:
+                    # One bad spec must not stop the other subscribers' filters from updating
+                    print(f"MCP Logcat: Dropping filter {key} {spec!r}: {e}")
+            self.filters = filters
+            added = [key for key in added if key in filters]
+            self.pending = {key: self.pending.get(key, []) for key in self.filters}
+            print(f"MCP Logcat: {len(self.filters)} active filters")
+            # Late subscribers start with whatever the ring buffer holds
+            for key in added:
+                self.pending[key].extend(line for line in self.ring if self.filters[key].match(line))
+            if self.filters and self.proc is None:
+                self._start()
+            elif not self.filters and self.proc is not None:
+                self._stop()
+
+    def stop(self):
+        self.set_filters({})
+
+    def _start(self):
+        # First start replays the last RING_SIZE lines; a restart continues from the last line seen
+        since = f"{self.last_seen:.3f}" if self.last_seen else str(RING_SIZE)
+        argv = self.command() + ["-v", "threadtime", "-T", since]
+        try:
+            self.proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            print(f"MCP Logcat: Failed to start {argv}: {e}")
+            return
+        print(f"MCP Logcat: Started {' '.join(argv)}")
+        threading.Thread(target=self._read, args=(self.proc,), daemon=True).start()
+        threading.Thread(target=self._flush_loop, args=(self.proc,), daemon=True).start()
+
+    def _stop(self):
+        proc, self.proc = self.proc, None
+        self.ring.clear()
+        self.last_seen = None
+        try:
+            proc.kill()
+        except OSError:
+            pass
+        print("MCP Logcat: Stopped, no subscribers")
+
+    def _read(self, proc):
+        for raw in iter(proc.stdout.readline, b""):
+            line = raw.decode("utf-8", "replace").rstrip("\r\n")
+            with self.lock:
+                if proc is not self.proc:
+                    break
+                self.ring.append(line)
+                self.last_seen = time.time()
+                for key, line_filter in self.filters.items():
+                    if line_filter.match(line):
+                        batch = self.pending[key]
+                        batch.append(line)
+                        if len(batch) > MAX_BATCH_LINES * 10:
+                            # Sender cannot keep up; keep the newest lines
+                            del batch[:MAX_BATCH_LINES]
+                            self.dropped += MAX_BATCH_LINES
+        with self.lock:
+            if proc is not self.proc:
+                return
+            self.proc = None
+        print("MCP Logcat: logcat exited, restarting")
+        time.sleep(1)
+        with self.lock:
+            if self.filters and self.proc is None:
+                self._start()
+
+    def _flush_loop(self, proc):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                if proc is not self.proc:
+                    return
+                batches = []
+                for key, lines in self.pending.items():
+                    if lines:
+                        batches.append((key, lines[:MAX_BATCH_LINES]))
+                        del lines[:MAX_BATCH_LINES]
+            for key, lines in batches:
+                self._emit(key, lines)
+
+    def _emit(self, key: str, lines: list):
+        # zlib + base64 keeps the batch small on the wire and JSON-safe in the outbox
+        payload = base64.b64encode(zlib.compress("\n".join(lines).encode("utf-8"))).decode("ascii")
+        self.send({
+            "type": "event",
+            "kind": "logcat",
+            "ts": round(time.time(), 3),
+            "data": {"filter": key, "count": len(lines), "encoding": "zlib+base64", "lines": payload},
+        })
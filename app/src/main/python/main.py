@@ -1,13 +1,20 @@
 import os
 import sys
+import time
 import warnings
+import threading
 
-import uiautomator2
-import asyncio
-from reverse_mcp_bridge import start_reverse_mcp_from_env
+from import_profile import ImportProfiler
 
 warnings.filterwarnings("ignore", category=ResourceWarning)
 
+# Heavy modules (uiautomator2, socketio) are imported where they are used, on
+# background threads, and timed until the bridge is ready or this many seconds pass
+STARTUP_PROFILE_TIMEOUT = 60.0
+
+profiler = ImportProfiler()
+profiler.install()
+
 context = None
 adb_address = ""
 
@@ -30,18 +37,31 @@ def print_to_console(text: str, end="\n"):
     print(text, end=end)
 
 
-def main():
-    print(f"Connecting to uiautomator2 server...\n")
-    
+def probe_local_server():
     # Try to connect to local uiautomator2 server (port 9008)
     try:
+        import uiautomator2
         print("Trying local uiautomator2 server connection...")
         d = uiautomator2.connect("127.0.0.1:5555")
         print(f"✅ Real device connected via uiautomator2 server: {d.info}")
     except Exception as e:
         print(f"❌ Failed to connect to uiautomator2 server: {e}")
-        print("Continuing with MCP bridge setup...\n")
-        d = None
+
+
+def report_startup(bridge, started: float):
+    """Print how long the bridge took to become ready and where import time went"""
+    if bridge is not None:
+        if bridge.wait_ready(STARTUP_PROFILE_TIMEOUT):
+            print(f"MCP bridge ready {time.time() - started:.2f}s after main()")
+        else:
+            print(f"MCP bridge not ready after {STARTUP_PROFILE_TIMEOUT:.0f}s")
+    print(profiler.report())
+    profiler.uninstall()
+
+
+def main():
+    started = time.time()
+    print(f"Connecting to uiautomator2 server...\n")
 
     # Start reverse MCP bridge in background
     print("Starting MCP bridge connection...")
@@ -52,10 +72,18 @@ def main():
     
     os.environ.setdefault("MCP_GATEWAY_WS_URL", gateway_url)
     os.environ.setdefault("MCP_GATEWAY_TOKEN", "devtoken")
+    # Undelivered results survive disconnects (and app restarts) in the app's files dir
+    os.environ.setdefault("MCP_OUTBOX_PATH", os.path.join(os.environ.get("HOME", "."), "mcp_outbox.db"))
     
     print(f"MCP Gateway URL: {os.environ['MCP_GATEWAY_WS_URL']}")
     print(f"MCP Gateway Token: {os.environ['MCP_GATEWAY_TOKEN']}")
     
-    # Start MCP bridge in background
-    start_reverse_mcp_from_env(adb_address)
+    # Start MCP bridge in background; it opens the device session and the
+    # gateway connection in parallel
+    from reverse_mcp_bridge import start_reverse_mcp_from_env
+    bridge = start_reverse_mcp_from_env(adb_address)
     print("MCP bridge started in background thread")
+
+    # The local server probe no longer holds up the bridge
+    threading.Thread(target=probe_local_server, daemon=True).start()
+    threading.Thread(target=report_startup, args=(bridge, started), daemon=True).start()
@@ -0,0 +1,79 @@
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from compact_hierarchy import compact_hierarchy
+
+# Facets the observe RPC can gather; "app" and "hierarchy" when none are requested
+FACETS = ("app", "info", "hierarchy", "screenshot")
+DEFAULT_FACETS = ("app", "hierarchy")
+OBSERVE_TIMEOUT = 20.0  # used when the call carries no deadline
+
+
+def content_version(data) -> str:
+    """Short id that changes whenever the facet's content does"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    elif not isinstance(data, (bytes, bytearray)):
+        data = repr(sorted(data.items()) if isinstance(data, dict) else data).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()[:12]
+
+
+class Observer:
+    """The observe RPC: several views of the current screen in one round trip.
+
+    Facets are read concurrently on a dedicated pool (observe itself may run on
+    a bridge worker). Each comes back with a content version; facets whose
+    version matches the one the caller passes in `since` are returned without
+    their data.
+    """
+
+    def __init__(self, get_device):
+        self.get_device = get_device
+        self.executor = ThreadPoolExecutor(max_workers=len(FACETS))
+        self.readers = {
+            "app": lambda d, params: d.app_current(),
+            "info": lambda d, params: d.info,
+            "hierarchy": self._hierarchy,
+            # Raw JPEG bytes go out as a binary attachment
+            "screenshot": lambda d, params: d.screenshot(format="raw"),
+        }
+
+    @staticmethod
+    def _hierarchy(d, params: dict) -> str:
+        xml = d.dump_hierarchy()
+        return compact_hierarchy(xml) if params.get("hierarchy_format") == "compact" else xml
+
+    def observe(self, params: dict, timeout: float = None) -> dict:
+        facets = params.get("facets") or DEFAULT_FACETS
+        unknown = [facet for facet in facets if facet not in self.readers]
+        if unknown:
+            return {"success": False, "error": f"Unknown facets: {unknown}, available: {list(FACETS)}"}
+        since = params.get("since") or {}
+        d = self.get_device()
+
+        started = time.time()
+        futures = {self.executor.submit(self.readers[facet], d, params): facet for facet in facets}
+        # Stop a little before the deadline so the facets that did finish still reach the caller
+        done, _ = wait(futures, timeout=(timeout or OBSERVE_TIMEOUT) * 0.9)
+
+        result = {}
+        for future, facet in futures.items():
+            if future not in done:
+                future.cancel()
+                result[facet] = {"error": "Deadline exceeded"}
+                continue
+            try:
+                data = future.result()
+            except Exception as e:
+                result[facet] = {"error": str(e)}
+                continue
+            version = content_version(data)
+            if since.get(facet) == version:
+                result[facet] = {"version": version, "unchanged": True}
+            else:
+                result[facet] = {"version": version, "data": data}
+        return {"success": True, "facets": result, "elapsed_ms": round((time.time() - started) * 1000, 1)}
+
+    def close(self):
+        self.executor.shutdown(wait=False)
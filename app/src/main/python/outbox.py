@@ -0,0 +1,141 @@
+import json
+import base64
+import threading
+from collections import deque
+
+
+def _encode(value):
+    """json.dumps default: bytes (screenshots, transfer chunks) survive the SQLite spill"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"__b64__": base64.b64encode(bytes(value)).decode("ascii")}
+    return str(value)
+
+
+def _decode(obj: dict):
+    if len(obj) == 1 and "__b64__" in obj:
+        return base64.b64decode(obj["__b64__"])
+    return obj
+
+
+def _estimate_size(value) -> int:
+    """Rough serialized size of a message, counted against the memory limit"""
+    if isinstance(value, dict):
+        return 2 + sum(_estimate_size(k) + _estimate_size(v) + 2 for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 2 + sum(_estimate_size(v) + 1 for v in value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value) + 2
+    return 8
+
+
+class Outbox:
+    """Bounded FIFO of outgoing bridge messages kept while the gateway is unreachable.
+
+    Messages live in memory first; when the memory limits are hit the oldest
+    ones spill to SQLite (if `spill_path` is set) or are dropped. Spilled
+    messages are always older than in-memory ones, so reading SQLite first and
+    memory second preserves send order. In-memory messages are kept as the
+    original objects; spilled ones are JSON with bytes values tagged as base64.
+    """
+
+    def __init__(self, max_messages: int = 500, max_bytes: int = 1024 * 1024,
+                 spill_path: str = None, spill_max_messages: int = 10000):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.spill_path = spill_path
+        self.spill_max_messages = spill_max_messages
+        self.memory = deque()  # (seq, msg, estimated_bytes)
+        self.memory_bytes = 0
+        self.spilled = 0
+        self.dropped = 0
+        self.next_seq = 0
+        self.lock = threading.Lock()
+        self.db = None
+        if spill_path:
+            self._open_spill()
+
+    def _open_spill(self):
+        import sqlite3
+        try:
+            self.db = sqlite3.connect(self.spill_path, check_same_thread=False, isolation_level=None)
+            self.db.execute("CREATE TABLE IF NOT EXISTS outbox (seq INTEGER PRIMARY KEY, payload TEXT NOT NULL)")
+            # Resume numbering after messages left over from a previous run
+            row = self.db.execute("SELECT COUNT(*), MAX(seq) FROM outbox").fetchone()
+            self.spilled = row[0]
+            self.next_seq = (row[1] + 1) if row[1] is not None else 0
+            if self.spilled:
+                print(f"MCP Outbox: Restored {self.spilled} undelivered messages from {self.spill_path}")
+        except Exception as e:
+            print(f"MCP Outbox: SQLite spill disabled ({e})")
+            self.db = None
+
+    @property
+    def pending(self) -> int:
+        return len(self.memory) + self.spilled
+
+    def put(self, msg: dict):
+        size = _estimate_size(msg)
+        with self.lock:
+            self.memory.append((self.next_seq, msg, size))
+            self.next_seq += 1
+            self.memory_bytes += size
+            while len(self.memory) > self.max_messages or self.memory_bytes > self.max_bytes:
+                seq, oldest, oldest_size = self.memory.popleft()
+                self.memory_bytes -= oldest_size
+                if not self._spill(seq, oldest):
+                    self.dropped += 1
+                    print(f"MCP Outbox: Full, dropped message {seq} ({self.dropped} dropped so far)")
+
+    def _spill(self, seq: int, msg: dict) -> bool:
+        if self.db is None:
+            return False
+        try:
+            payload = json.dumps(msg, separators=(",", ":"), default=_encode)
+            self.db.execute("INSERT INTO outbox (seq, payload) VALUES (?, ?)", (seq, payload))
+            self.spilled += 1
+            if self.spilled > self.spill_max_messages:
+                self.db.execute("DELETE FROM outbox WHERE seq = (SELECT MIN(seq) FROM outbox)")
+                self.spilled -= 1
+                self.dropped += 1
+            return True
+        except Exception as e:
+            print(f"MCP Outbox: Failed to spill message {seq}: {e}")
+            return False
+
+    def peek(self, limit: int) -> list:
+        """Return up to `limit` of the oldest messages without removing them"""
+        with self.lock:
+            batch = []
+            if self.spilled and self.db is not None:
+                rows = self.db.execute("SELECT payload FROM outbox ORDER BY seq LIMIT ?", (limit,)).fetchall()
+                batch.extend(json.loads(row[0], object_hook=_decode) for row in rows)
+            for _, msg, _ in self.memory:
+                if len(batch) >= limit:
+                    break
+                batch.append(msg)
+            return batch
+
+    def ack(self, count: int):
+        """Remove the `count` oldest messages once they were sent"""
+        with self.lock:
+            if self.spilled and self.db is not None and count > 0:
+                removed = self.db.execute(
+                    "DELETE FROM outbox WHERE seq IN (SELECT seq FROM outbox ORDER BY seq LIMIT ?)", (count,)
+                ).rowcount
+                self.spilled -= removed
+                count -= removed
+            while count > 0 and self.memory:
+                _, _, size = self.memory.popleft()
+                self.memory_bytes -= size
+                count -= 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "memory": len(self.memory),
+                "memory_bytes": self.memory_bytes,
+                "spilled": self.spilled,
+                "dropped": self.dropped,
+            }
@@ -0,0 +1,160 @@
+import os
+import re
+import time
+import threading
+from array import array
+
+# One row per sample; every column is an integer so it fits an array("q")
+FIELDS = ("ts_ms", "pid", "cpu_ticks", "pss_kb", "frames", "janky", "frame_p90_ms")
+MIN_INTERVAL = 0.5      # seconds between samples
+BATCH_INTERVAL = 10.0   # seconds between batches sent to the gateway
+MAX_BATCH = 600         # samples per batch
+MAX_PACKAGES = 4
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100  # cpu_ticks per second
+
+_PACKAGE_RE = re.compile(r"^[A-Za-z0-9_.]+$")
+_PID_RE = re.compile(r"^@pid (\d+)", re.M)
+_STAT_RE = re.compile(r"^\d+ \(.*\) (.+)$", re.M)
+_FRAMES_RE = re.compile(r"Total frames rendered: (\d+)")
+_JANKY_RE = re.compile(r"Janky frames: (\d+)")
+_P90_RE = re.compile(r"90th percentile: (\d+)ms")
+_PSS_RE = re.compile(r"TOTAL(?: PSS:)?\s+(\d+)")
+
+
+def sample_command(package: str) -> str:
+    """One shell round trip per sample: pid, /proc stat, frame stats since the last reset, PSS"""
+    return (f"pid=$(pidof {package} | cut -d' ' -f1); echo \"@pid $pid\"; "
+            f"[ -n \"$pid\" ] && cat /proc/$pid/stat; "
+            f"dumpsys gfxinfo {package} reset | grep -E 'Total frames|Janky frames|90th percentile'; "
+            f"dumpsys meminfo {package} | grep TOTAL")
+
+
+def parse_sample(output: str):
+    """Row of FIELDS (without ts_ms) from sample_command output, None if the app is not running"""
+    pid = _PID_RE.search(output or "")
+    stat = _STAT_RE.search(output)
+    if pid is None or stat is None:
+        return None
+    # Fields after "(comm)" start at state (3); utime and stime are fields 14 and 15
+    stat_fields = stat.group(1).split()
+    cpu_ticks = int(stat_fields[11]) + int(stat_fields[12])
+    values = []
+    for regex in (_PSS_RE, _FRAMES_RE, _JANKY_RE, _P90_RE):
+        match = regex.search(output)
+        values.append(int(match.group(1)) if match else 0)
+    return [int(pid.group(1)), cpu_ticks] + values
+
+
+def delta_encode(column) -> list:
+    """First value absolute, then differences to the previous value"""
+    return [column[0]] + [column[i] - column[i - 1] for i in range(1, len(column))]
+
+
+class PerfSampler:
+    """Samples CPU, memory and frame stats of one package on a background thread.
+
+    Samples accumulate in one array per field and go out as `perf` events
+    with delta-encoded columns every BATCH_INTERVAL seconds.
+    """
+
+    def __init__(self, package: str, run_shell, send, interval: float):
+        self.package = package
+        self.run_shell = run_shell
+        self.send = send
+        self.interval = max(float(interval), MIN_INTERVAL)
+        self.columns = {field: array("q") for field in FIELDS}
+        self.lock = threading.Lock()
+        self.running = True
+        self.samples = 0
+        self.missed = 0  # samples taken while the app was not running
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.flush()
+
+    def _run(self):
+        last_flush = time.time()
+        next_at = time.time()
+        while self.running:
+            try:
+                row = parse_sample(self.run_shell(sample_command(self.package), self.interval * 2).output)
+            except Exception as e:
+                print(f"MCP Perf: Sampling {self.package} failed: {e}")
+                row = None
+            with self.lock:
+                if row is None:
+                    self.missed += 1
+                else:
+                    self.samples += 1
+                    for field, value in zip(FIELDS, [int(time.time() * 1000)] + row):
+                        self.columns[field].append(value)
+                full = len(self.columns["ts_ms"]) >= MAX_BATCH
+            if full or time.time() - last_flush >= BATCH_INTERVAL:
+                self.flush()
+                last_flush = time.time()
+            next_at += self.interval
+            time.sleep(max(0.0, next_at - time.time()))
+            next_at = max(next_at, time.time())
+        self.flush()  # A sample finished after stop() still goes out
+
+    def flush(self):
+        with self.lock:
+            if not len(self.columns["ts_ms"]):
+                return
+            columns = [delta_encode(self.columns[field]) for field in FIELDS]
+            for field in FIELDS:
+                del self.columns[field][:]
+            missed, self.missed = self.missed, 0
+        self.send({
+            "type": "event",
+            "kind": "perf",
+            "ts": round(time.time(), 3),
+            "data": {"package": self.package, "fields": list(FIELDS), "encoding": "delta",
+                     "columns": columns, "missed": missed, "clk_tck": CLK_TCK},
+        })
+
+
+class PerfSamplers:
+    """The start_perf / stop_perf RPCs: at most MAX_PACKAGES samplers at a time"""
+
+    def __init__(self, run_shell, send):
+        self.run_shell = run_shell
+        self.send = send
+        self.samplers = {}
+        self.lock = threading.Lock()
+
+    def start(self, params: dict) -> dict:
+        package = params.get("package", "")
+        if not _PACKAGE_RE.match(package):
+            return {"success": False, "error": f"Invalid package: {package!r}"}
+        with self.lock:
+            old = self.samplers.pop(package, None)
+            if old is None and len(self.samplers) >= MAX_PACKAGES:
+                return {"success": False, "error": f"Already sampling {MAX_PACKAGES} packages"}
+            sampler = PerfSampler(package, self.run_shell, self.send, params.get("interval") or 1.0)
+            self.samplers[package] = sampler
+        if old is not None:
+            old.stop()
+        sampler.start()
+        print(f"MCP Perf: Sampling {package} every {sampler.interval}s")
+        return {"success": True, "package": package, "interval": sampler.interval, "fields": list(FIELDS)}
+
+    def stop(self, params: dict) -> dict:
+        package = params.get("package")
+        with self.lock:
+            sampler = self.samplers.pop(package, None)
+        if sampler is None:
+            return {"success": False, "error": f"Not sampling {package}"}
+        sampler.stop()
+        print(f"MCP Perf: Stopped sampling {package} after {sampler.samples} samples")
+        return {"success": True, "package": package, "samples": sampler.samples}
+
+    def stop_all(self):
+        with self.lock:
+            samplers, self.samplers = list(self.samplers.values()), {}
+        for sampler in samplers:
+            sampler.stop()
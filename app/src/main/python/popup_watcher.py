@@ -0,0 +1,197 @@
+import re
+import time
+import threading
+from collections import deque
+
+WATCH_INTERVAL = 1.0   # seconds between hierarchy checks while watchers are registered
+MAX_HANDLED = 200      # most recent handled popups kept for list_watchers
+ACTIONS = ("click", "back", "home")
+
+# Rule sets a client can enable by name instead of writing the xpaths
+PRESETS = {
+    "permission": [
+        {"name": "permission_foreground", "when": '//*[@resource-id="com.android.permissioncontroller:id/permission_allow_foreground_only_button"]'},
+        {"name": "permission_allow", "when": '//*[@resource-id="com.android.permissioncontroller:id/permission_allow_button"]'},
+        {"name": "permission_allow_legacy", "when": '//*[@resource-id="com.android.packageinstaller:id/permission_allow_button"]'},
+    ],
+    "anr": [
+        {"name": "anr_wait", "when": '//*[@resource-id="android:id/aerr_wait"]'},
+    ],
+    "crash": [
+        {"name": "crash_close", "when": '//*[@resource-id="android:id/aerr_close"]'},
+    ],
+    "update": [
+        {"name": "update_later", "when": '//*[@clickable="true"][@text="Not now" or @text="Later" or '
+                                          '@text="Remind me later" or @text="No thanks" or @text="以后再说" or '
+                                          '@text="稍后再说" or @text="暂不更新"]'},
+    ],
+}
+
+# uiautomator2 selector keys and the hierarchy attributes they match
+_SELECTOR_ATTRS = {
+    "text": "text", "resourceId": "resource-id", "description": "content-desc",
+    "className": "class", "packageName": "package",
+}
+_NAME_RE = re.compile(r"^[\w.:-]{1,64}$")
+
+
+def selector_xpath(selector: dict) -> str:
+    """XPath matching a uiautomator2 selector (exact text, resourceId, description, className, packageName)"""
+    conditions = []
+    for key, value in selector.items():
+        if key.endswith("Contains") and key[:-len("Contains")] in _SELECTOR_ATTRS:
+            conditions.append(f"contains(@{_SELECTOR_ATTRS[key[:-len('Contains')]]}, {_quote(value)})")
+        elif key in _SELECTOR_ATTRS:
+            conditions.append(f"@{_SELECTOR_ATTRS[key]}={_quote(value)}")
+        else:
+            raise ValueError(f"Unsupported selector key for a watcher: {key}")
+    if not conditions:
+        raise ValueError("Empty selector")
+    return "//*[" + " and ".join(conditions) + "]"
+
+
+def _quote(value) -> str:
+    value = str(value)
+    if '"' not in value:
+        return f'"{value}"'
+    if "'" not in value:
+        return f"'{value}'"
+    return "concat(" + ", '\"', ".join(f'"{part}"' for part in value.split('"')) + ")"
+
+
+def _rule(spec: dict) -> dict:
+    name = spec.get("name")
+    if not name or not _NAME_RE.match(str(name)):
+        raise ValueError(f"Watcher rules need a name (letters, digits, . : _ -), got {name!r}")
+    when = spec.get("when")
+    if spec.get("selector"):
+        when = [selector_xpath(spec["selector"])]
+    elif isinstance(when, str):
+        when = [when]
+    if not when:
+        raise ValueError(f"Watcher {name} needs when (xpath or list of xpaths, all must match) or selector")
+    action = spec.get("action") or "click"
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown watcher action: {action}, available: {list(ACTIONS)}")
+    target = spec.get("target")
+    if isinstance(target, dict):
+        target = selector_xpath(target)
+    return {"name": str(name), "when": [str(xpath) for xpath in when], "action": action, "target": target,
+            "limit": int(spec.get("limit") or 0)}
+
+
+class PopupWatchers:
+    """The set_watchers / remove_watchers / list_watchers RPCs: dismiss interruptions on the device.
+
+    Rules (all `when` xpaths present -> click the match or `target`, or
+    press back/home) are registered with uiautomator2's watcher, which checks
+    the hierarchy on its own thread every `interval` seconds. Each handled
+    popup is recorded with a sequence number; list_watchers returns the ones
+    after the caller's `since`, so every client reads them without taking
+    them away from the others. A rule with a `limit`
+    is removed after that many triggers, so a popup that does not go away
+    cannot keep the watcher clicking forever.
+    """
+
+    def __init__(self, get_device):
+        self.get_device = get_device
+        self.rules = {}      # name -> rule, in registration order
+        self.triggers = {}   # name -> times handled
+        self.handled = deque(maxlen=MAX_HANDLED)
+        self.handled_seq = 0
+        self.lock = threading.Lock()
+        self.interval = WATCH_INTERVAL
+
+    def _callback(self, d, rule: dict):
+        def handle(selector):
+            entry = {"name": rule["name"], "action": rule["action"], "ts": round(time.time(), 3)}
+            try:
+                match = selector.get_last_match()
+                entry["text"] = match.text or match.attrib.get("content-desc") or ""
+                if rule["target"]:
+                    entry["clicked"] = d.xpath(rule["target"]).click_exists(timeout=0.5)
+                elif rule["action"] == "click":
+                    match.click()
+                else:
+                    d.press(rule["action"])
+            except Exception as e:
+                entry["error"] = str(e)
+            with self.lock:
+                count = self.triggers[rule["name"]] = self.triggers.get(rule["name"], 0) + 1
+                if rule["limit"] and count >= rule["limit"]:
+                    entry["disabled"] = True
+                self.handled_seq += 1
+                entry["seq"] = self.handled_seq
+                self.handled.append(entry)
+            print(f"MCP Watcher: Handled {rule['name']} ({entry.get('text')!r}, {rule['action']})")
+            if entry.get("disabled"):
+                print(f"MCP Watcher: {rule['name']} reached its limit of {rule['limit']}, removed")
+                # This runs on uiautomator2's watcher thread, which stop() waits for
+                self._unregister(d, [rule["name"]], stop_later=True)
+        return handle
+
+    def _unregister(self, d, names, stop_later: bool = False):
+        with self.lock:
+            for name in names:
+                self.rules.pop(name, None)
+                d.watcher.remove(name)
+            empty = not self.rules
+        if empty and d.watcher.running():
+            if stop_later:
+                threading.Thread(target=d.watcher.stop, daemon=True).start()
+            else:
+                d.watcher.stop()
+
+    def set(self, params: dict) -> dict:
+        rules = [_rule(spec) for spec in params.get("rules") or []]
+        for preset in params.get("presets") or []:
+            if preset not in PRESETS:
+                return {"success": False, "error": f"Unknown preset: {preset}, available: {sorted(PRESETS)}"}
+            rules.extend(_rule(spec) for spec in PRESETS[preset])
+        d = self.get_device()
+        interval = float(params.get("interval") or self.interval)
+        with self.lock:
+            if params.get("replace"):
+                self.rules.clear()
+                d.watcher.remove()
+            for rule in rules:
+                d.watcher.remove(rule["name"])  # same name replaces the old rule
+                watcher = d.watcher(rule["name"])
+                for xpath in rule["when"]:
+                    watcher = watcher.when(xpath)
+                watcher.call(self._callback(d, rule))
+                self.rules[rule["name"]] = rule
+            restart = d.watcher.running() and interval != self.interval
+            self.interval = interval
+            active = bool(self.rules)
+        if restart or not active:
+            if d.watcher.running():
+                d.watcher.stop()
+        if active and not d.watcher.running():
+            d.watcher.start(interval)
+        print(f"MCP Watcher: {len(self.rules)} rules active, checking every {interval}s")
+        return self.list()
+
+    def remove(self, params: dict) -> dict:
+        names = params.get("names")
+        d = self.get_device()
+        self._unregister(d, list(self.rules) if names is None else names)
+        return self.list()
+
+    def list(self, since: int = None) -> dict:
+        """Rules with trigger counts; with `since`, also the popups handled after that sequence number"""
+        with self.lock:
+            result = {
+                "success": True,
+                "interval": self.interval,
+                "watchers": [dict(rule, triggers=self.triggers.get(name, 0)) for name, rule in self.rules.items()],
+            }
+            if since is not None:
+                result["handled"] = [entry for entry in self.handled if entry["seq"] > since]
+                result["last_seq"] = self.handled_seq
+            return result
+
+    def stop(self):
+        d = self.get_device() if self.rules else None
+        if d is not None and d.watcher.running():
+            d.watcher.stop()
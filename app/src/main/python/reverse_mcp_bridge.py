@@ -1,20 +1,54 @@
 import os
 import uuid
 import json
-import socketio
-import uiautomator2 as u2
 import threading
 import time
 import signal
 import sys
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from outbox import Outbox
+from device_events import DeviceEventWatcher
+from shell_pool import ShellSessionPool, adb_shell_argv
+from file_transfer import TransferStore, loggable
+from logcat_tail import LogcatTail
+from perf_sampler import PerfSamplers
+from observe import Observer
+from compact_hierarchy import dump_hierarchy
+from image_match import ImageMatcher
+from text_input import input_text
+from gestures import run_gestures, scroll_until
+from popup_watcher import PopupWatchers
+
+# Messages the gateway must eventually see; kept in the outbox while disconnected
+OUTBOX_MESSAGE_TYPES = ("rpc.result", "rpc.error", "event")
+
+# RPC methods handled by handle_call, announced to the gateway in hello
+SUPPORTED_METHODS = ["get_device_info", "start_app", "click_text", "shell", "ping",
+                     "push_file", "pull_file", "install_apk", "start_perf", "stop_perf",
+                     "observe", "dump_hierarchy", "find_image", "click_image", "input_text",
+                     "gesture", "scroll_until", "set_watchers", "remove_watchers", "list_watchers"]
+
+# Worker threads executing RPC calls that carry a deadline
+RPC_WORKERS = 4
+
+# File transfer calls run on their own small pool so chunk I/O never occupies
+# the workers interactive calls need
+TRANSFER_METHODS = ("push_file", "pull_file", "install_apk")
+TRANSFER_WORKERS = 1
 
 
 class ReverseMcpBridge:
-    def __init__(self, ws_url: str, token: str, adb_address: str):
+    def __init__(self, ws_url: str, token: str, adb_address: str, outbox_path: str = None, tags=None,
+                 shell_sessions: int = 0, transfer_dir: str = None):
         self.ws_url = ws_url
         self.token = token
         self.adb_address = adb_address
+        self.tags = list(tags or [])  # Used by the gateway to target fanout calls
         self.device = None
+        self.device_lock = threading.Lock()
+        self.device_ready = threading.Event()   # set once prewarm() has a working device session
+        self.gateway_ready = threading.Event()  # set on the first successful gateway connect
         self.session_id = str(uuid.uuid4())
         self.connected = False
         self.reconnect_count = 0
@@ -23,34 +57,151 @@ class ReverseMcpBridge:
         self.connection_lock = threading.Lock()
         self.last_heartbeat = time.time()
         self.heartbeat_interval = 30  # Send heartbeat every 30 seconds
+        self.outbox = Outbox(spill_path=outbox_path)
+        self.outbox_batch_size = 50
+        self.flushing = False
+        self.shell_sessions = shell_sessions  # Persistent adb shell sessions for the shell RPC, 0 = off
+        self.shell_pool = None
+        self.events = DeviceEventWatcher(self.get_device, self.send, shell=self.run_shell)
+        self.logcat = LogcatTail(self.logcat_command, self.send)
+        self.perf = PerfSamplers(self.run_shell, self.send)
+        self.observer = Observer(self.get_device)
+        self.matcher = ImageMatcher(self.get_device)
+        self.popups = PopupWatchers(self.get_device)
+        self.executor = ThreadPoolExecutor(max_workers=RPC_WORKERS)
+        self.transfer_executor = ThreadPoolExecutor(max_workers=TRANSFER_WORKERS)
+        self.transfer_dir = transfer_dir or os.path.join(os.environ.get("HOME", "."), "mcp_transfers")
+        self.transfers = None
 
     def connect_device(self):
-        if self.device is None:
+        with self.device_lock:
+            if self.device is None:
+                # Imported here: uiautomator2 (with requests, adbutils, PIL) is the slowest import at startup
+                import uiautomator2 as u2
+                try:
+                    self.device = u2.connect(self.adb_address)
+                    print(f"MCP Bridge: Connected to device at {self.adb_address}")
+                except Exception as e:
+                    print(f"MCP Bridge: Failed to connect to device: {e}")
+                    raise
+
+    def prewarm(self):
+        """Open the device session (uiautomator2 server handshake) and the shell sessions
+        in the background, while run() imports socketio and connects to the gateway"""
+        def warm():
+            started = time.time()
             try:
-                self.device = u2.connect(self.adb_address)
-                print(f"MCP Bridge: Connected to device at {self.adb_address}")
+                self.connect_device()
+                self.device.info  # First call starts the uiautomator2 server if it is not running
+                device_at = time.time()
+                pool = self.get_shell_pool()
+                if pool is not None:
+                    pool.run("true")
+                self.device_ready.set()
+                print(f"MCP Bridge: Device ready in {device_at - started:.2f}s, "
+                      f"shell sessions in {time.time() - device_at:.2f}s")
             except Exception as e:
-                print(f"MCP Bridge: Failed to connect to device: {e}")
-                raise
+                print(f"MCP Bridge: Prewarm failed ({e}), connecting on the first call instead")
+        threading.Thread(target=warm, daemon=True).start()
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """True once both the device session and the gateway connection are up"""
+        deadline = None if timeout is None else time.time() + timeout
+        if not self.device_ready.wait(timeout):
+            return False
+        return self.gateway_ready.wait(None if deadline is None else max(0.0, deadline - time.time()))
+
+    def get_device(self):
+        self.connect_device()
+        return self.device
+
+    def get_shell_pool(self):
+        if self.shell_pool is None and self.shell_sessions > 0:
+            argv = adb_shell_argv(self.adb_address)
+            if argv is None:
+                print("MCP Bridge: No adb binary found, shell sessions disabled")
+                self.shell_sessions = 0
+                return None
+            self.shell_pool = ShellSessionPool(argv, self.shell_sessions)
+        return self.shell_pool
+
+    def run_shell(self, cmd: str, timeout: float = None):
+        """Run a shell command on a persistent session, falling back to d.shell if the session fails"""
+        pool = self.get_shell_pool()
+        if pool is not None:
+            try:
+                return pool.run(cmd, timeout)
+            except TimeoutError:
+                raise  # The deadline is gone, do not run it again
+            except (ConnectionError, OSError) as e:
+                print(f"MCP Bridge: Shell session failed ({e}), falling back to d.shell")
+        d = self.get_device()
+        return d.shell(cmd, timeout=timeout) if timeout else d.shell(cmd)
+
+    def logcat_command(self):
+        # Through adb the shell user can read every app's log, the app's own uid only its own
+        return (adb_shell_argv(self.adb_address) or []) + ["logcat"]
 
     def send(self, msg):
+        queueable = isinstance(msg, dict) and msg.get("type") in OUTBOX_MESSAGE_TYPES
         try:
             with self.connection_lock:
-                if self.sio and self.connected:
+                # Results queue behind anything still in the outbox so ordering is preserved
+                if self.sio and self.connected and not (queueable and self.outbox.pending):
                     self.sio.emit('message', msg)
-                    print(f"MCP Bridge: Message sent: {msg}")
-                else:
+                    print(f"MCP Bridge: Message sent: {loggable(msg)}")
+                    return
+                if not queueable:
                     print(f"MCP Bridge: Cannot send message, not connected")
+                    return
+                self.outbox.put(msg)
+                print(f"MCP Bridge: Queued message in outbox ({self.outbox.pending} pending)")
         except Exception as e:
             print(f"MCP Bridge: Failed to send message: {e}")
             self.connected = False
+            if queueable:
+                self.outbox.put(msg)
+            return
+        if self.connected:
+            self._start_outbox_flush()
+
+    def _start_outbox_flush(self):
+        """Drain the outbox in a background thread unless a flush is already running"""
+        with self.connection_lock:
+            if self.flushing or not self.outbox.pending:
+                return
+            self.flushing = True
+        threading.Thread(target=self.flush_outbox, daemon=True).start()
+
+    def flush_outbox(self):
+        """Send queued messages oldest first in batches; stops on the first failure"""
+        sent = 0
+        try:
+            while True:
+                with self.connection_lock:
+                    if not (self.sio and self.connected):
+                        break
+                    batch = self.outbox.peek(self.outbox_batch_size)
+                    if not batch:
+                        break
+                    self.sio.emit('message', {"type": "batch", "messages": batch})
+                    self.outbox.ack(len(batch))
+                    sent += len(batch)
+        except Exception as e:
+            print(f"MCP Bridge: Outbox flush failed: {e}")
+            self.connected = False
+        finally:
+            with self.connection_lock:
+                self.flushing = False
+        if sent:
+            print(f"MCP Bridge: Flushed {sent} queued messages, {self.outbox.pending} still pending")
 
-    def handle_call(self, req_id: str, method: str, params: dict):
+    def handle_call(self, req_id: str, method: str, params: dict, timeout: float = None):
         try:
             self.connect_device()
             d = self.device
             
-            print(f"MCP Bridge: Handling call {method} with params {params}")
+            print(f"MCP Bridge: Handling call {method} with params {loggable(params)}")
             
             if method == "get_device_info":
                 info = d.info
@@ -73,7 +224,7 @@ class ReverseMcpBridge:
             elif method == "shell":
                 cmd = params.get("cmd")
                 print(f"MCP Bridge: Executing shell command: {cmd}")
-                res = d.shell(cmd)
+                res = self.run_shell(cmd, timeout)
                 result_str = str(res)
                 print(f"MCP Bridge: Shell result: {result_str}")
                 return {"success": True, "result": result_str}
@@ -81,6 +232,51 @@ class ReverseMcpBridge:
             elif method == "ping":
                 return {"success": True, "message": "pong", "session": self.session_id}
                 
+            elif method in TRANSFER_METHODS:
+                if self.transfers is None:
+                    self.transfers = TransferStore(self.transfer_dir, self.get_device, self.run_shell)
+                if method == "install_apk":
+                    return self.transfers.install_apk(params, timeout)
+                return getattr(self.transfers, method)(params)
+                
+            elif method == "dump_hierarchy":
+                return dump_hierarchy(d, params.get("format") or "xml")
+                
+            elif method == "input_text":
+                print(f"MCP Bridge: Typing {len(str(params.get('text', '')))} characters")
+                return input_text(d, params, self.run_shell)
+                
+            elif method == "gesture":
+                return run_gestures(d, params)
+                
+            elif method == "scroll_until":
+                print(f"MCP Bridge: Scrolling {params.get('direction', 'down')} until {params.get('selector')}")
+                return scroll_until(d, params, timeout)
+                
+            elif method == "find_image":
+                return self.matcher.find(params)
+                
+            elif method == "click_image":
+                return self.matcher.click(params)
+                
+            elif method == "observe":
+                return self.observer.observe(params, timeout)
+                
+            elif method == "start_perf":
+                return self.perf.start(params)
+                
+            elif method == "stop_perf":
+                return self.perf.stop(params)
+                
+            elif method == "set_watchers":
+                return self.popups.set(params)
+                
+            elif method == "remove_watchers":
+                return self.popups.remove(params)
+                
+            elif method == "list_watchers":
+                return self.popups.list(int(params.get("since") or 0))
+                
             else:
                 print(f"MCP Bridge: Unknown method: {method}")
                 return {"success": False, "error": f"Unknown method: {method}"}
@@ -89,6 +285,29 @@ class ReverseMcpBridge:
             print(f"MCP Bridge: Error handling call {method}: {e}")
             return {"success": False, "error": str(e)}
 
+    def run_call(self, req_id: str, method: str, params: dict, timeout: float):
+        """Run handle_call within `timeout` seconds; None if the deadline passed first.
+
+        The call runs on the worker pool so a hung uiautomator request does not
+        hold the message handler past the caller's deadline. A call still queued
+        at the deadline is never started; a late result is discarded.
+        """
+        deadline = time.time() + timeout
+
+        def work():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            return self.handle_call(req_id, method, params, timeout=remaining)
+
+        executor = self.transfer_executor if method in TRANSFER_METHODS else self.executor
+        future = executor.submit(work)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            return None
+
     def handle_incoming_message(self, data):
         try:
             if isinstance(data, str):
@@ -96,7 +315,7 @@ class ReverseMcpBridge:
             else:
                 msg = data
                 
-            print(f"MCP Bridge: Received message: {msg}")
+            print(f"MCP Bridge: Received message: {loggable(msg)}")
             
             # Update last heartbeat time
             self.last_heartbeat = time.time()
@@ -106,11 +325,27 @@ class ReverseMcpBridge:
                 method = msg.get("method")
                 params = msg.get("params") or {}
                 
+                # Seconds the caller is still waiting; absent for callers without deadlines
+                timeout = msg.get("timeout")
+                
                 print(f"MCP Bridge: Processing RPC call {req_id}: {method}")
-                result = self.handle_call(req_id, method, params)
+                if timeout is None:
+                    result = self.handle_call(req_id, method, params)
+                elif float(timeout) > 0:
+                    result = self.run_call(req_id, method, params, float(timeout))
+                else:
+                    result = None
                 
-                response = {"type": "rpc.result", "id": req_id, "result": result}
+                if result is None:
+                    print(f"MCP Bridge: RPC call {req_id} exceeded its deadline ({timeout}s)")
+                    response = {"type": "rpc.error", "id": req_id, "error": "Deadline exceeded"}
+                else:
+                    response = {"type": "rpc.result", "id": req_id, "result": result}
                 self.send(response)
+            elif msg.get("type") == "watch":
+                # Gateway tells us which event kinds (and logcat filters) currently have subscribers
+                self.events.set_kinds(msg.get("events") or [])
+                self.logcat.set_filters(msg.get("logcat") or {})
             elif msg.get("type") == "ping":
                 # Respond to ping with pong
                 pong_msg = {"type": "pong", "session": self.session_id, "timestamp": time.time()}
@@ -134,6 +369,10 @@ class ReverseMcpBridge:
             print(f"MCP Bridge: Error processing message: {e}")
 
     def run(self):
+        started = time.time()
+        self.prewarm()
+        import socketio
+        print(f"MCP Bridge: socketio imported in {time.time() - started:.2f}s")
         print(f"MCP Bridge: Starting connection to {self.ws_url}")
         print(f"MCP Bridge: Session ID: {self.session_id}")
         print(f"MCP Bridge: Token: {self.token}")
@@ -145,12 +384,15 @@ class ReverseMcpBridge:
         def connect():
             self.connected = True
             self.reconnect_count = 0
+            self.gateway_ready.set()
             print(f"MCP Bridge: Successfully connected to gateway!")
             
             # Send hello message
-            hello_msg = {"type": "hello", "session": self.session_id, "device": self.adb_address}
+            hello_msg = {"type": "hello", "session": self.session_id, "device": self.adb_address,
+                         "tags": self.tags, "capabilities": SUPPORTED_METHODS}
             self.send(hello_msg)
             print(f"MCP Bridge: Sent hello message: {hello_msg}")
+            self._start_outbox_flush()
         
         @self.sio.event
         def disconnect():
@@ -159,7 +401,7 @@ class ReverseMcpBridge:
         
         @self.sio.event
         def message(data):
-            print(f"MCP Bridge: Received message: {data}")
+            print(f"MCP Bridge: Received message: {loggable(data)}")
             self.handle_incoming_message(data)
         
         while True:
@@ -183,12 +425,17 @@ class ReverseMcpBridge:
                 def connect():
                     self.connected = True
                     self.reconnect_count = 0
+                    if not self.gateway_ready.is_set():
+                        print(f"MCP Bridge: Gateway connected {time.time() - started:.2f}s after start")
+                        self.gateway_ready.set()
                     print(f"MCP Bridge: Successfully connected to gateway!")
                     
                     # Send hello message
-                    hello_msg = {"type": "hello", "session": self.session_id, "device": self.adb_address}
+                    hello_msg = {"type": "hello", "session": self.session_id, "device": self.adb_address,
+                                 "tags": self.tags, "capabilities": SUPPORTED_METHODS}
                     self.send(hello_msg)
                     print(f"MCP Bridge: Sent hello message: {hello_msg}")
+                    self._start_outbox_flush()
                 
                 @self.sio.event
                 def disconnect():
@@ -197,7 +444,7 @@ class ReverseMcpBridge:
                 
                 @self.sio.event
                 def message(data):
-                    print(f"MCP Bridge: Received message: {data}")
+                    print(f"MCP Bridge: Received message: {loggable(data)}")
                     self.handle_incoming_message(data)
                 
                 # Attempt connection
@@ -263,6 +510,15 @@ class ReverseMcpBridge:
         print("MCP Bridge: Stopping service...")
         self.running = False
         self.connected = False
+        self.events.stop()
+        self.logcat.stop()
+        self.perf.stop_all()
+        self.popups.stop()
+        self.observer.close()
+        self.executor.shutdown(wait=False)
+        self.transfer_executor.shutdown(wait=False)
+        if self.shell_pool:
+            self.shell_pool.close()
         
         # Disconnect socket
         try:
@@ -277,6 +533,10 @@ class ReverseMcpBridge:
 def start_reverse_mcp_from_env(adb_address: str):
     ws_url = os.environ.get("MCP_GATEWAY_WS_URL")
     token = os.environ.get("MCP_GATEWAY_TOKEN")
+    outbox_path = os.environ.get("MCP_OUTBOX_PATH")
+    tags = [t.strip() for t in os.environ.get("MCP_DEVICE_TAGS", "").split(",") if t.strip()]
+    shell_sessions = int(os.environ.get("MCP_SHELL_SESSIONS", "2"))
+    transfer_dir = os.environ.get("MCP_TRANSFER_DIR")
     
     if not ws_url or not token:
         print("MCP Bridge: Missing environment variables, skipping MCP bridge startup")
@@ -287,11 +547,12 @@ def start_reverse_mcp_from_env(adb_address: str):
     print(f"MCP Bridge: Starting with URL={ws_url}, token={token[:8]}..., device={adb_address}")
     
     try:
-        bridge = ReverseMcpBridge(ws_url, token, adb_address)
+        bridge = ReverseMcpBridge(ws_url, token, adb_address, outbox_path, tags, shell_sessions, transfer_dir)
         # Run in a separate thread to avoid blocking
         bridge_thread = threading.Thread(target=bridge.run, daemon=True)
         bridge_thread.start()
         print(f"MCP Bridge: Started in background thread")
+        return bridge
     except Exception as e:
         print(f"MCP Bridge: Fatal error: {e}")
         # Don't re-raise - let the main app continue running
@@ -0,0 +1,143 @@
+import os
+import uuid
+import shutil
+import threading
+import subprocess
+from collections import deque, namedtuple
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+# Same shape (and str()) as uiautomator2's shell() return value
+ShellResponse = namedtuple("ShellResponse", ["output", "exit_code"])
+
+DEFAULT_SHELL_TIMEOUT = 60.0
+
+
+def adb_shell_argv(serial: str, adb_path: str = None):
+    """argv of an interactive `adb shell` on `serial`, or None when no adb binary is available"""
+    adb_path = adb_path or os.environ.get("ADBUTILS_ADB_PATH") or shutil.which("adb")
+    if not adb_path or not serial:
+        return None
+    return [adb_path, "-s", serial, "shell"]
+
+
+class ShellSession:
+    """One long-lived shell process running commands written to its stdin.
+
+    Each command is wrapped as
+
+        (eval '<cmd>') </dev/null 2>&1; r=$?; echo; echo "<marker><seq> $r"
+
+    so it runs in a subshell (cd/exit/variables do not leak into the next
+    command, like a fresh `adb shell <cmd>`), cannot read the session's stdin,
+    and ends with a sentinel line carrying its exit code. Commands are written
+    as soon as they are submitted; a reader thread resolves them in order, so
+    several commands can be in flight on one session without waiting for a
+    round trip each.
+    """
+
+    def __init__(self, argv):
+        self.argv = list(argv)
+        self.marker = f"__MCP_SHELL_{uuid.uuid4().hex}_"
+        self.proc = None
+        self.seq = 0
+        self.waiting = deque()  # (sentinel, future) in the order commands were written
+        self.lock = threading.Lock()
+
+    @property
+    def load(self) -> int:
+        return len(self.waiting)
+
+    def _start(self):
+        self.proc = subprocess.Popen(
+            self.argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0,
+        )
+        threading.Thread(target=self._read, args=(self.proc,), daemon=True).start()
+        print(f"MCP Shell: Started session {self.marker[12:20]} ({' '.join(self.argv)})")
+
+    def submit(self, cmd: str) -> Future:
+        future = Future()
+        quoted = cmd.replace("'", "'\\''")
+        with self.lock:
+            if self.proc is None or self.proc.poll() is not None:
+                self._start()
+            self.seq += 1
+            sentinel = f"{self.marker}{self.seq} "
+            line = f"(eval '{quoted}') </dev/null 2>&1; r=$?; echo; echo \"{sentinel}$r\"\n"
+            self.waiting.append((sentinel, future))
+            try:
+                self.proc.stdin.write(line.encode("utf-8"))
+                self.proc.stdin.flush()
+            except OSError as e:
+                self._reset(ConnectionError(f"shell session write failed: {e}"))
+        return future
+
+    def _read(self, proc):
+        output = []
+        for raw in iter(proc.stdout.readline, b""):
+            line = raw.decode("utf-8", "replace")
+            with self.lock:
+                if proc is not self.proc or not self.waiting:
+                    continue  # Output of a session that was reset
+                sentinel, future = self.waiting[0]
+                if not line.startswith(sentinel):
+                    output.append(line)
+                    continue
+                self.waiting.popleft()
+            text = "".join(output)
+            output = []
+            try:
+                exit_code = int(line[len(sentinel):].strip())
+            except ValueError:
+                exit_code = -1
+            # Drop the newline the wrapper echoes before the sentinel
+            future.set_result(ShellResponse(text[:-1] if text.endswith("\n") else text, exit_code))
+        with self.lock:
+            if proc is self.proc:
+                self._reset(ConnectionError("shell session closed"))
+
+    def _reset(self, error: Exception):
+        """Kill the process and fail everything still waiting on it (lock held)"""
+        proc, self.proc = self.proc, None
+        if proc is not None and proc.poll() is None:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+        while self.waiting:
+            _, future = self.waiting.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    def reset(self, reason: str):
+        with self.lock:
+            print(f"MCP Shell: Resetting session {self.marker[12:20]}: {reason}")
+            self._reset(ConnectionError(f"shell session reset: {reason}"))
+
+    def close(self):
+        with self.lock:
+            self._reset(ConnectionError("shell session closed"))
+
+
+class ShellSessionPool:
+    """A few persistent shell sessions; each command goes to the least loaded one.
+
+    Sessions start lazily on first use and restart after they die. A command
+    that times out resets its session, since the shell is still busy with it.
+    """
+
+    def __init__(self, argv, size: int = 2):
+        self.sessions = [ShellSession(argv) for _ in range(max(1, size))]
+
+    def run(self, cmd: str, timeout: float = None) -> ShellResponse:
+        timeout = timeout or DEFAULT_SHELL_TIMEOUT
+        session = min(self.sessions, key=lambda s: s.load)
+        future = session.submit(cmd)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            session.reset(f"command timed out after {timeout:.1f}s")
+            raise TimeoutError(f"shell command timed out after {timeout:.1f}s")
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
@@ -0,0 +1,98 @@
+import re
+import time
+
+INPUT_MODES = ("auto", "ime", "clipboard", "set_text", "shell")
+CHUNK_SIZE = 1000      # characters per IME / clipboard batch
+KEYCODE_PASTE = 279
+SELECTOR_WAIT = 5.0    # seconds to wait for the selector's element
+
+# `input text` treats these specially in the device shell; spaces become %s
+_SHELL_SPECIAL_RE = re.compile(r"([\\\"'`$&|;<>()\[\]{}*?!~#])")
+
+
+def shell_input_command(text: str) -> str:
+    """`input text` command typing `text` (ASCII only, one key event per character)"""
+    return "input text " + _SHELL_SPECIAL_RE.sub(r"\\\1", text).replace(" ", "%s")
+
+
+def _chunks(text: str):
+    return [text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)] or [""]
+
+
+def _type_ime(d, text: str, clear: bool, progress: list):
+    # uiautomator2 switches to its own IME and commits each batch as a single edit
+    for index, chunk in enumerate(_chunks(text)):
+        d.send_keys(chunk, clear=clear and index == 0)
+        progress[0] += len(chunk)
+
+
+def _type_clipboard(d, text: str, clear: bool):
+    if clear:
+        d.clear_text()
+    for chunk in _chunks(text):
+        d.set_clipboard(chunk)
+        d.press(KEYCODE_PASTE)
+
+
+def _type_shell(run_shell, text: str):
+    for chunk in _chunks(text):
+        run_shell(shell_input_command(chunk))
+
+
+def input_text(d, params: dict, run_shell) -> dict:
+    """The input_text RPC: type into the focused field, or set an element's text by selector.
+
+    mode "auto" uses the uiautomator2 IME and falls back to clipboard paste;
+    with a selector the element's text is set in one accessibility call.
+    """
+    text = params.get("text")
+    if text is None:
+        return {"success": False, "error": "Missing text"}
+    text = str(text)
+    clear = bool(params.get("clear", False))
+    selector = params.get("selector")
+    mode = params.get("mode") or ("set_text" if selector else "auto")
+    if mode not in INPUT_MODES:
+        return {"success": False, "error": f"Unknown input mode: {mode}, available: {list(INPUT_MODES)}"}
+
+    typed = len(text)
+    started = time.perf_counter()
+    if mode == "set_text":
+        if not selector:
+            return {"success": False, "error": "set_text needs a selector"}
+        element = d(**selector)
+        if not element.wait(timeout=float(params.get("wait", SELECTOR_WAIT))):
+            return {"success": False, "error": f"No element matches {selector}"}
+        if not clear:
+            text = (element.get_text() or "") + text
+        element.set_text(text)
+    else:
+        if selector:
+            # Focus the field first, then type through the chosen path
+            d(**selector).click(timeout=float(params.get("wait", SELECTOR_WAIT)))
+        if mode == "shell":
+            if not text.isascii():
+                return {"success": False, "error": "input text only types ASCII, use ime or clipboard"}
+            if clear:
+                d.clear_text()
+            _type_shell(run_shell, text)
+        elif mode == "clipboard":
+            _type_clipboard(d, text, clear)
+        else:
+            progress = [0]  # characters the IME already committed
+            try:
+                _type_ime(d, text, clear, progress)
+            except Exception as e:
+                if mode == "ime":
+                    raise
+                print(f"MCP Input: IME input failed ({e}), pasting from the clipboard")
+                mode = "clipboard"
+                _type_clipboard(d, text[progress[0]:], clear and not progress[0])
+    elapsed = time.perf_counter() - started
+    return {
+        "success": True,
+        "mode": mode,
+        "chars": typed,
+        "elapsed_ms": round(elapsed * 1000, 1),
+        "chars_per_s": round(typed / elapsed, 1) if elapsed > 0 else None,
+    }
@@ -0,0 +1,100 @@
+"""
+Adaptive RPC timeouts shared by the gateway and the MCP server.
+
+Each hop records how long calls take per method (and per device when known) and
+derives the default timeout from recent tail latency instead of a fixed 30s, so
+fast methods fail fast and slow ones are not cut off.
+"""
+
+import math
+import threading
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+# Used until a method has enough samples
+DEFAULT_METHOD_TIMEOUTS = {
+    "ping": 5.0,
+    "get_device_info": 10.0,
+    "click_text": 15.0,
+    "start_app": 30.0,
+    "shell": 60.0,
+    "push_file": 30.0,   # per chunk
+    "pull_file": 30.0,   # per chunk
+    "install_apk": 120.0,
+    "observe": 30.0,
+    "dump_hierarchy": 20.0,
+    "find_image": 20.0,
+    "click_image": 20.0,
+    "input_text": 30.0,
+    "gesture": 30.0,
+    "scroll_until": 60.0,
+    "set_watchers": 20.0,
+    "remove_watchers": 20.0,  # stopping the watcher thread waits for its current pass
+}
+
+# Methods whose latency depends on what they are asked to do rather than on the device
+# (a getprop and a pm install are both "shell"); they always get their fixed default
+FIXED_TIMEOUT_METHODS = ("shell",)
+
+
+class AdaptiveTimeouts:
+    """timeout = clamp(p99 * factor, minimum, maximum) over a sliding window of latencies"""
+
+    def __init__(self, default: float = 30.0, minimum: float = 1.0, maximum: float = 120.0,
+                 factor: float = 3.0, min_samples: int = 20, window: int = 200,
+                 defaults: Optional[Dict[str, float]] = None, fixed=FIXED_TIMEOUT_METHODS):
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.min_samples = min_samples
+        self.window = window
+        self.defaults = dict(DEFAULT_METHOD_TIMEOUTS if defaults is None else defaults)
+        self.fixed = frozenset(fixed)
+        self.samples: Dict[Tuple[str, Optional[str]], deque] = {}
+        self.cache: Dict[Tuple[str, Optional[str]], float] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, method: str, latency: float, device: Optional[str] = None):
+        """Record a completed (or timed out) call for the method and the method on that device"""
+        if method in self.fixed:
+            return
+        with self.lock:
+            for key in ((method, None), (method, device)) if device else ((method, None),):
+                window = self.samples.get(key)
+                if window is None:
+                    window = self.samples[key] = deque(maxlen=self.window)
+                window.append(latency)
+                self.cache.pop(key, None)
+
+    def _p99(self, key) -> Optional[float]:
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        window = self.samples.get(key)
+        if not window or len(window) < self.min_samples:
+            return None
+        ordered = sorted(window)
+        value = ordered[min(len(ordered) - 1, math.ceil(0.99 * len(ordered)) - 1)]
+        self.cache[key] = value
+        return value
+
+    def timeout_for(self, method: str, device: Optional[str] = None) -> float:
+        with self.lock:
+            p99 = self._p99((method, device)) if device else None
+            if p99 is None:
+                p99 = self._p99((method, None))
+        if p99 is None:
+            return self.defaults.get(method, self.default)
+        return max(self.minimum, min(self.maximum, p99 * self.factor))
+
+    def forget_device(self, device: str):
+        with self.lock:
+            for key in [k for k in self.samples if k[1] == device]:
+                self.samples.pop(key, None)
+                self.cache.pop(key, None)
+
+    def snapshot(self) -> dict:
+        """Current timeout per method (device-specific entries omitted)"""
+        methods = sorted({key[0] for key in self.samples} | set(self.defaults))
+        return {method: round(self.timeout_for(method), 3) for method in methods}
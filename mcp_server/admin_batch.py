@@ -0,0 +1,207 @@
+"""
+Scripted admin commands for the gateway: bulk RPC calls across devices.
+
+A script has one command per line (blank lines and # comments are skipped):
+
+  call <method> <json_params> [target]   one call per target device
+  wait                                   let every call so far finish first
+  sleep <seconds>
+
+The target is `*` (every connected device, the default), a comma separated
+list of device ids, or `tag:<tag>,<tag>` for devices carrying all the tags.
+
+Calls go out through Gateway.start_call, so nothing blocks waiting for a
+device: each device runs its calls in script order, different devices run
+in parallel, and at most `parallel` calls are in flight at once. Every
+outcome is logged as it arrives and summarized per method at the end.
+"""
+
+import json
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+from perf_stats import percentile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARALLEL = 16
+OUTCOMES = ("ok", "failed", "error", "timeout")  # failed: the call ran but reported success=False
+
+
+class BatchCall:
+    __slots__ = ("line", "device_id", "method", "params", "timeout", "sent_at", "latency", "outcome", "detail")
+
+    def __init__(self, line: int, device_id: str, method: str, params: dict, timeout: Optional[float]):
+        self.line = line
+        self.device_id = device_id
+        self.method = method
+        self.params = params
+        self.timeout = timeout
+        self.sent_at = None
+        self.latency = None
+        self.outcome = None
+        self.detail = None
+
+
+def parse_command(line: str):
+    """(command, args) of one script line, None for blank lines and comments"""
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    command, _, rest = line.partition(" ")
+    rest = rest.strip()
+    if command == "call":
+        method, _, rest = rest.partition(" ")
+        if not method:
+            raise ValueError("call needs a method")
+        params, end = json.JSONDecoder().raw_decode(rest.strip() or "{}")
+        if not isinstance(params, dict):
+            raise ValueError("params must be a JSON object")
+        return "call", (method, params, rest.strip()[end:].strip() or "*")
+    if command == "wait":
+        return "wait", ()
+    if command == "sleep":
+        return "sleep", (float(rest),)
+    raise ValueError(f"Unknown command: {command}")
+
+
+class AdminBatch:
+    """Runs script commands against the gateway with a limit on calls in flight"""
+
+    def __init__(self, gw, parallel: int = DEFAULT_PARALLEL, timeout: Optional[float] = None):
+        self.gw = gw
+        self.parallel = max(1, parallel)
+        self.timeout = timeout  # None: the gateway's adaptive per-method default
+        self.queues: Dict[str, deque] = {}  # device_id -> calls waiting for the device's previous call
+        self.ready = deque()                # devices with queued calls and nothing in flight
+        self.busy = set()                   # devices with a call in flight
+        self.calls: List[BatchCall] = []
+        self.lock = threading.Lock()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.started = time.time()
+
+    def targets(self, target: str) -> List[str]:
+        if target == "*":
+            return self.gw.select_devices()
+        if target.startswith("tag:"):
+            return self.gw.select_devices(tags=[t for t in target[4:].split(",") if t])
+        # Unknown ids are kept so they are reported as errors instead of silently dropped
+        return [d for d in target.split(",") if d]
+
+    def submit(self, line: int, method: str, params: dict, target: str) -> int:
+        devices = self.targets(target)
+        if not devices:
+            logger.warning(f"Batch line {line}: no device matches {target}")
+        with self.lock:
+            for device_id in devices:
+                call = BatchCall(line, device_id, method, params, self.timeout)
+                self.calls.append(call)
+                queue = self.queues.setdefault(device_id, deque())
+                queue.append(call)
+                if len(queue) == 1 and device_id not in self.busy:
+                    self.ready.append(device_id)
+            if devices:
+                self.idle.clear()
+            sends = self._take_ready()
+        self._send(sends)
+        return len(devices)
+
+    def _take_ready(self) -> List[BatchCall]:
+        """Calls to send now, taken while holding the lock"""
+        sends = []
+        while self.ready and len(self.busy) < self.parallel:
+            device_id = self.ready.popleft()
+            call = self.queues[device_id].popleft()
+            self.busy.add(device_id)
+            call.sent_at = time.time()
+            sends.append(call)
+        return sends
+
+    def _send(self, sends: List[BatchCall]):
+        for call in sends:
+            self.gw.start_call(call.device_id, call.method, call.params,
+                               lambda message, call=call: self._finished(call, message), call.timeout)
+
+    def _finished(self, call: BatchCall, message: dict):
+        call.latency = time.time() - call.sent_at
+        result = message.get("result")
+        if message.get("type") == "rpc.error":
+            error = str(message.get("error"))
+            call.outcome = "timeout" if error == "Deadline exceeded" else "error"
+            call.detail = error
+        elif isinstance(result, dict) and result.get("success") is False:
+            call.outcome = "failed"
+            call.detail = result.get("error")
+        else:
+            call.outcome = "ok"
+        logger.info(f"  [{call.line}] {call.device_id} {call.method}: {call.outcome} "
+                    f"{call.latency * 1000:.0f} ms{f' ({call.detail})' if call.detail else ''}")
+        with self.lock:
+            self.busy.discard(call.device_id)
+            if self.queues[call.device_id]:
+                self.ready.append(call.device_id)
+            sends = self._take_ready()
+            if not sends and not self.busy:
+                self.idle.set()
+        self._send(sends)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.idle.wait(timeout)
+
+    def run(self, lines) -> dict:
+        """Run script lines (any iterable, e.g. an open file or sys.stdin) and return the summary"""
+        for number, line in enumerate(lines, 1):
+            try:
+                command = parse_command(line)
+            except ValueError as e:
+                logger.error(f"Batch line {number}: {e}")
+                continue
+            if command is None:
+                continue
+            name, args = command
+            if name == "call":
+                self.submit(number, *args)
+            elif name == "wait":
+                self.wait()
+            elif name == "sleep":
+                time.sleep(args[0])
+        self.wait()
+        return self.summary()
+
+    def summary(self) -> dict:
+        """Per method: call count, outcomes and latency percentiles (ms)"""
+        methods = {}
+        for call in self.calls:
+            entry = methods.setdefault(call.method, {"calls": 0, **{o: 0 for o in OUTCOMES}, "latencies": []})
+            entry["calls"] += 1
+            if call.outcome:
+                entry[call.outcome] += 1
+                entry["latencies"].append(call.latency * 1000)
+        for entry in methods.values():
+            latencies = entry.pop("latencies")
+            entry["p50_ms"] = round(percentile(latencies, 50), 1)
+            entry["p90_ms"] = round(percentile(latencies, 90), 1)
+            entry["max_ms"] = round(max(latencies, default=0.0), 1)
+        return {
+            "calls": len(self.calls),
+            "devices": len(self.queues),
+            "parallel": self.parallel,
+            "elapsed": round(time.time() - self.started, 3),
+            "methods": methods,
+        }
+
+
+def format_summary(summary: dict) -> str:
+    lines = [f"Batch: {summary['calls']} calls on {summary['devices']} devices in {summary['elapsed']}s "
+             f"(parallel {summary['parallel']})"]
+    header = f"  {'method':<20}{'calls':>6}" + "".join(f"{o:>8}" for o in OUTCOMES) + \
+             f"{'p50 ms':>9}{'p90 ms':>9}{'max ms':>9}"
+    lines.append(header)
+    for method, entry in sorted(summary["methods"].items()):
+        lines.append(f"  {method:<20}{entry['calls']:>6}" + "".join(f"{entry[o]:>8}" for o in OUTCOMES) +
+                     f"{entry['p50_ms']:>9.1f}{entry['p90_ms']:>9.1f}{entry['max_ms']:>9.1f}")
+    return "\n".join(lines)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Connection flood benchmark for the gateway handshake checks.
+
+Starts an in-process gateway, attaches one legitimate client that keeps
+measuring ping -> pong round trips, then floods the gateway from worker
+processes with Socket.IO handshakes carrying a wrong token. Reports how many
+bad handshakes were refused, how many sockets the registry ended up holding
+and the legitimate client's latency before and during the flood.
+
+--no-auth runs the same flood against a gateway without a token, i.e. the
+old behaviour where every socket got a registry record.
+
+Examples:
+  python3 bench_auth.py
+  python3 bench_auth.py --workers 8 --duration 10
+  python3 bench_auth.py --connect-rate 20   # also enable the per-IP limit
+  python3 bench_auth.py --no-auth
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+import http.client
+import multiprocessing
+from urllib.parse import urlparse
+
+import socketio
+
+from bench_harness import start_gateway, quiet, percentile
+from gateway_stub import TOKEN
+
+SOCKETIO_PATH = "/socket.io/?EIO=4&transport=polling"
+
+
+def flood(url: str, duration: float, counter):
+    """Open Engine.IO sessions with a bad token and send the Socket.IO CONNECT packet"""
+    target = urlparse(url)
+    deadline = time.time() + duration
+    attempts = 0
+    conn = http.client.HTTPConnection(target.hostname, target.port, timeout=5)
+    headers = {"Authorization": "Bearer wrong-token"}
+    while time.time() < deadline:
+        try:
+            conn.request("GET", SOCKETIO_PATH, headers=headers)
+            body = conn.getresponse().read().decode()
+            sid = json.loads(body[body.index("{"):body.rindex("}") + 1])["sid"]
+            conn.request("POST", f"{SOCKETIO_PATH}&sid={sid}", body="40", headers=headers)
+            conn.getresponse().read()
+            # The answer to CONNECT: "40{...}" when accepted, "44{...}" when refused
+            conn.request("GET", f"{SOCKETIO_PATH}&sid={sid}", headers=headers)
+            conn.getresponse().read()
+            attempts += 1
+        except Exception:
+            conn.close()
+            conn = http.client.HTTPConnection(target.hostname, target.port, timeout=5)
+    with counter.get_lock():
+        counter.value += attempts
+
+
+def measure_pings(client: socketio.Client, pong: threading.Event, duration: float) -> list:
+    latencies = []
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        pong.clear()
+        started = time.perf_counter()
+        client.emit("message", {"type": "ping", "session": "bench"})
+        if pong.wait(5):
+            latencies.append(time.perf_counter() - started)
+        time.sleep(0.01)
+    return latencies
+
+
+def run(args) -> dict:
+    with quiet():
+        gw, url = start_gateway(token="" if args.no_auth else TOKEN, connect_rate=args.connect_rate)
+
+        pong = threading.Event()
+        client = socketio.Client(reconnection=False)
+        client.on("message", lambda data: pong.set() if data.get("type") == "pong" else None)
+        client.connect(url, headers={"Authorization": f"Bearer {TOKEN}"}, transports=["websocket"])
+        client.emit("message", {"type": "hello", "role": "client"})
+
+        idle = measure_pings(client, pong, args.warmup)
+
+        counter = multiprocessing.Value("l", 0)
+        workers = [multiprocessing.Process(target=flood, args=(url, args.duration, counter))
+                   for _ in range(args.workers)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        loaded = measure_pings(client, pong, args.duration)
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        stats = gw.stats()
+        client.disconnect()
+
+    return {
+        "auth": not args.no_auth,
+        "connect_rate": args.connect_rate,
+        "workers": args.workers,
+        "attempts": counter.value,
+        "attempts_per_s": counter.value / elapsed if elapsed else 0.0,
+        "rejected": stats["rejected"],
+        "registry_connections": stats["registry"]["connections"],
+        "registry_bytes": stats["memory"]["total_bytes"],
+        "idle_p50_ms": percentile(idle, 50) * 1000,
+        "idle_p99_ms": percentile(idle, 99) * 1000,
+        "flood_p50_ms": percentile(loaded, 50) * 1000,
+        "flood_p99_ms": percentile(loaded, 99) * 1000,
+        "flood_pings": len(loaded),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4, help="flooding processes")
+    parser.add_argument("--duration", type=float, default=5.0, help="flood length in seconds")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of pings before the flood")
+    parser.add_argument("--connect-rate", type=float, default=0.0, help="per-IP connects/s (0 = no limit)")
+    parser.add_argument("--no-auth", action="store_true", help="run the gateway without a token")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args(argv)
+
+    r = run(args)
+    print(f"Flood: {r['workers']} workers, {r['attempts']} bad handshakes ({r['attempts_per_s']:.0f}/s), "
+          f"auth={'on' if r['auth'] else 'off'}, connect rate={r['connect_rate'] or 'unlimited'}")
+    print(f"Rejected at handshake: {r['rejected']}")
+    print(f"Registry after flood: {r['registry_connections']} sockets, {r['registry_bytes'] / 1024:.1f} KB")
+    print(f"Legit client ping: idle p50 {r['idle_p50_ms']:.2f} ms / p99 {r['idle_p99_ms']:.2f} ms, "
+          f"under flood p50 {r['flood_p50_ms']:.2f} ms / p99 {r['flood_p99_ms']:.2f} ms ({r['flood_pings']} pings)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(r, f, indent=2)
+        print(f"Results written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
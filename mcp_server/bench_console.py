@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for ConsoleInputStream (app/src/main/python/chaquopy/utils/console.py).
+
+Feeds large inputs to the console's stdin the way the Java side does (one
+on_input call per paste or typed line) and reads them back with readline()
+and read(n), comparing the buffered stream with the previous implementation
+(one read(1) per character, the pending text rebuilt by concatenation and
+slicing, onInputState on every queue item). Reports the time per run and
+the number of onInputState calls, which are JNI calls on the device.
+
+Examples:
+  python3 bench_console.py
+  python3 bench_console.py --lines 20000 --width 120 --paste 500
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+from io import TextIOBase
+from queue import Queue
+
+# The console lives with the on-device sources
+APP_PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "src", "main", "python")
+sys.path.insert(0, os.path.normpath(APP_PYTHON_DIR))
+
+from chaquopy.utils.console import ConsoleInputStream  # noqa: E402
+
+
+class CharwiseInputStream(TextIOBase):
+    """ConsoleInputStream as of the baseline (2167d4d), copied verbatim for comparison"""
+    def __init__(self, task):
+        self.task = task
+        self.queue = Queue()
+        self.buffer = ""
+        self.eof = False
+
+    @property
+    def encoding(self):
+        return "UTF-8"
+
+    @property
+    def errors(self):
+        return "strict"  # UTF-8 encoding should never fail.
+
+    def readable(self):
+        return True
+
+    def on_input(self, input):
+        if self.eof:
+            raise ValueError("Can't add more input after EOF")
+        if input is None:
+            self.eof = True
+        self.queue.put(input)
+
+    def read(self, size=None):
+        if size is not None and size < 0:
+            size = None
+        buffer = self.buffer
+        while (self.queue is not None) and ((size is None) or (len(buffer) < size)):
+            if self.queue.empty():
+                self.task.onInputState(True)
+            input = self.queue.get()
+            self.task.onInputState(False)
+            if input is None:  # EOF
+                self.queue = None
+            else:
+                buffer += input
+
+        result = buffer if (size is None) else buffer[:size]
+        self.buffer = buffer[len(result):]
+        return result
+
+    def readline(self, size=None):
+        if size is not None and size < 0:
+            size = None
+        chars = []
+        while (size is None) or (len(chars) < size):
+            c = self.read(1)
+            if not c:
+                break
+            chars.append(c)
+            if c == "\n":
+                break
+
+        return "".join(chars)
+
+
+class CountingTask:
+    """Stands in for the Java task; counts onInputState calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def onInputState(self, blocked):
+        self.calls += 1
+
+
+def make_input(lines: int, width: int, paste: int) -> list:
+    """Inputs as the console receives them: `paste` lines per on_input call"""
+    line = ("x" * (width - 1)) + "\n"
+    return ["".join(line for _ in range(min(paste, lines - start))) for start in range(0, lines, paste)]
+
+
+def run(cls, inputs: list, mode: str, size: int) -> tuple:
+    task = CountingTask()
+    stream = cls(task)
+    for text in inputs:
+        stream.on_input(text)
+    stream.on_input(None)
+    started = time.perf_counter()
+    total = 0
+    while True:
+        data = stream.readline() if mode == "readline" else stream.read(size)
+        if not data:
+            break
+        total += len(data)
+    return time.perf_counter() - started, task.calls, total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=5000, help="lines of input")
+    parser.add_argument("--width", type=int, default=80, help="characters per line")
+    parser.add_argument("--paste", type=int, default=1000, help="lines per on_input call")
+    parser.add_argument("--read-size", type=int, default=4096, help="size of the read(n) calls")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per implementation")
+    args = parser.parse_args(argv)
+
+    inputs = make_input(args.lines, args.width, args.paste)
+    chars = sum(len(text) for text in inputs)
+    print(f"{args.lines} lines, {chars} characters in {len(inputs)} on_input calls")
+    header = f"{'mode':<10}{'stream':<14}{'ms':>10}{'MB/s':>9}{'JNI calls':>11}"
+    print(header)
+    print("-" * len(header))
+    for mode in ("readline", "read"):
+        for name, cls in (("charwise", CharwiseInputStream), ("buffered", ConsoleInputStream)):
+            timings = []
+            for _ in range(args.repeat):
+                elapsed, calls, total = run(cls, inputs, mode, args.read_size)
+                if total != chars:
+                    print(f"{mode:<10}{name:<14}  read {total} of {chars} characters")
+                    return 1
+                timings.append(elapsed)
+            elapsed = statistics.median(timings)
+            print(f"{mode:<10}{name:<14}{elapsed * 1000:>10.1f}{chars / elapsed / 1e6 if elapsed else 0:>9.1f}"
+                  f"{calls:>11}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
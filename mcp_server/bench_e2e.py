@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark for the MCP -> gateway -> bridge path.
+
+Everything runs locally: an in-process gateway, N simulated phones (see
+bench_harness.py) and a UIAutomatorMCPServer connection pool issuing RPC calls.
+
+Examples:
+  python3 bench_e2e.py
+  python3 bench_e2e.py --devices 4 --concurrency 1,8,32 --requests 2000 --latency 0.005
+  python3 bench_e2e.py --json results.json
+  python3 bench_e2e.py --baseline results.json   # print deltas against a previous run
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tracemalloc
+
+from bench_harness import (
+    start_gateway, start_fake_bridges, wait_for_devices, stop_bridges, quiet, percentile,
+)
+from gateway_stub import TOKEN
+from uiautomator_mcp_server import UIAutomatorMCPServer
+
+
+METHODS = {
+    "ping": {},
+    "get_device_info": {},
+    "shell": {"cmd": "getprop ro.build.version.sdk"},
+}
+
+
+async def run_level(server: UIAutomatorMCPServer, method: str, params: dict,
+                    concurrency: int, total: int) -> dict:
+    """Issue `total` calls with at most `concurrency` in flight"""
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await server.send_rpc_call(method, params)
+                if not result.get("success"):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+
+    return {
+        "method": method,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "peak_traced_mb": peak / (1024 * 1024),
+    }
+
+
+async def run_benchmark(args) -> dict:
+    tracemalloc.start()
+    with quiet():
+        gw, url = start_gateway()
+        bridges = start_fake_bridges(url, args.devices, args.latency, args.jitter)
+        wait_for_devices(gw, args.devices)
+        server = UIAutomatorMCPServer(gateway_url=url, gateway_token=TOKEN, pool_size=args.pool_size)
+        await server.connect_to_gateway()
+
+        results = []
+        try:
+            # Warm up connections and code paths before measuring
+            await run_level(server, "ping", {}, args.pool_size, args.pool_size * 4)
+            for method in args.methods:
+                for concurrency in args.concurrency:
+                    results.append(await run_level(server, method, METHODS[method], concurrency, args.requests))
+        finally:
+            await server.disconnect_from_gateway()
+            stop_bridges(bridges)
+    tracemalloc.stop()
+
+    return {
+        "config": {
+            "devices": args.devices,
+            "pool_size": args.pool_size,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "requests": args.requests,
+        },
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "results": results,
+    }
+
+
+def print_report(report: dict, baseline: dict = None):
+    print(f"Config: {report['config']}")
+    print(f"Max RSS: {report['max_rss_mb']:.1f} MB")
+    header = f"{'method':<16}{'conc':>6}{'reqs':>8}{'err':>6}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>10}"
+    print(header)
+    print("-" * len(header))
+
+    previous = {}
+    if baseline:
+        previous = {(r["method"], r["concurrency"]): r for r in baseline.get("results", [])}
+
+    for r in report["results"]:
+        print(f"{r['method']:<16}{r['concurrency']:>6}{r['requests']:>8}{r['errors']:>6}"
+              f"{r['throughput_rps']:>10.1f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['peak_traced_mb']:>10.2f}")
+        old = previous.get((r["method"], r["concurrency"]))
+        if old:
+            rps_delta = (r["throughput_rps"] / old["throughput_rps"] - 1) * 100 if old["throughput_rps"] else 0.0
+            p99_delta = (r["p99_ms"] / old["p99_ms"] - 1) * 100 if old["p99_ms"] else 0.0
+            print(f"{'  vs baseline':<36}{rps_delta:>+9.1f}%{'':>10}{p99_delta:>+9.1f}%")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=2, help="number of simulated phones")
+    parser.add_argument("--pool-size", type=int, default=4, help="MCP server gateway connections")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="comma separated in-flight limits")
+    parser.add_argument("--requests", type=int, default=500, help="calls per concurrency level")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake device latency per call (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency per call (s)")
+    parser.add_argument("--methods", default="ping,get_device_info,shell", help="comma separated RPC methods")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="previous --json output to compare against")
+    args = parser.parse_args(argv)
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+    args.methods = [m for m in args.methods.split(",") if m]
+    unknown = [m for m in args.methods if m not in METHODS]
+    if unknown:
+        parser.error(f"unknown methods: {unknown}, choose from {list(METHODS)}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run_benchmark(args))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    return 1 if any(r["errors"] for r in report["results"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
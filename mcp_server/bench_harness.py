@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Local gateway + fake device harness.
+
+Starts gateway_stub's Gateway in-process and attaches simulated phones: real
+ReverseMcpBridge instances (from the app sources) whose uiautomator2 device is
+replaced by FakeDevice, so the full MCP -> gateway -> bridge path can be
+exercised without a phone.
+"""
+
+import os
+import sys
+import math
+import time
+import random
+import logging
+import threading
+import contextlib
+from collections import namedtuple
+from typing import List, Optional
+
+import eventlet
+import eventlet.wsgi
+
+from gateway_stub import Gateway, TOKEN
+
+# The bridge lives with the on-device sources
+APP_PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "src", "main", "python")
+sys.path.insert(0, os.path.normpath(APP_PYTHON_DIR))
+
+from reverse_mcp_bridge import ReverseMcpBridge  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Same shape as uiautomator2's shell() return value
+ShellResponse = namedtuple("ShellResponse", ["output", "exit_code"])
+
+
+class FakeDevice:
+    """Stand-in for uiautomator2.Device with configurable per-call latency"""
+
+    def __init__(self, serial: str, latency: float = 0.0, jitter: float = 0.0):
+        self.serial = serial
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        self.current_package = "com.android.launcher3"
+
+    def _delay(self):
+        self.calls += 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    @property
+    def info(self):
+        self._delay()
+        return {
+            "currentPackageName": self.current_package,
+            "displayHeight": 2400,
+            "displayWidth": 1080,
+            "displayRotation": 0,
+            "productName": "fake",
+            "screenOn": True,
+            "sdkInt": 34,
+            "naturalOrientation": True,
+        }
+
+    def app_start(self, package_name: str, stop: bool = False):
+        self._delay()
+        self.current_package = package_name
+
+    def app_current(self):
+        self._delay()
+        return {"package": self.current_package, "activity": f"{self.current_package}.MainActivity"}
+
+    def shell(self, cmd, timeout: Optional[float] = None):
+        self._delay()
+        return ShellResponse(output=f"fake:{cmd}\n", exit_code=0)
+
+    def __call__(self, **selector):
+        return FakeSelector(self, selector)
+
+
+class FakeSelector:
+    def __init__(self, device: FakeDevice, selector: dict):
+        self.device = device
+        self.selector = selector
+
+    @property
+    def exists(self):
+        self.device._delay()
+        return True
+
+    def click(self, timeout: Optional[float] = None):
+        self.device._delay()
+
+
+def start_gateway(host: str = "127.0.0.1", port: int = 0, connect_rate: float = 0.0, **gateway_kwargs):
+    """Run a Gateway on an eventlet WSGI server in a background thread.
+
+    Returns (gateway, url). Port 0 picks a free port. Every simulated phone
+    connects from the same address, so the per-IP connect limit is off
+    unless `connect_rate` is given.
+    """
+    gw = Gateway(connect_rate=connect_rate, **gateway_kwargs)
+    sock = eventlet.listen((host, port))
+    port = sock.getsockname()[1]
+    thread = threading.Thread(
+        target=eventlet.wsgi.server,
+        args=(sock, gw.app),
+        kwargs={"log_output": False},
+        daemon=True,
+    )
+    thread.start()
+    return gw, f"http://{host}:{port}"
+
+
+def start_fake_bridges(url: str, count: int, latency: float = 0.0, jitter: float = 0.0,
+                       token: str = TOKEN) -> List[ReverseMcpBridge]:
+    """Start `count` ReverseMcpBridge instances backed by FakeDevice"""
+    bridges = []
+    for i in range(count):
+        bridge = ReverseMcpBridge(url, token, f"fake-device-{i}")
+        bridge.device = FakeDevice(f"fake-device-{i}", latency, jitter)
+        threading.Thread(target=bridge.run, daemon=True).start()
+        bridges.append(bridge)
+    return bridges
+
+
+def wait_for_devices(gw: Gateway, count: int, timeout: float = 10.0):
+    deadline = time.time() + timeout
+    while len(gw.registry.devices) < count:
+        if time.time() > deadline:
+            raise RuntimeError(f"only {len(gw.registry.devices)}/{count} fake devices registered")
+        time.sleep(0.05)
+
+
+def stop_bridges(bridges: List[ReverseMcpBridge]):
+    with quiet():
+        for bridge in bridges:
+            bridge.stop()
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the bridge's per-message prints and gateway INFO logging"""
+    root = logging.getLogger()
+    level = root.level
+    root.setLevel(logging.WARNING)
+    logging.getLogger("gateway_stub").setLevel(logging.WARNING)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            yield
+        finally:
+            root.setLevel(level)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
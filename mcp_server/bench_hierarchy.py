@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the compact hierarchy format (compact_hierarchy.py).
+
+For each uiautomator XML dump, reports the node count before and after
+pruning, the size of the XML and of the compact text (bytes and a rough
+token estimate at 4 bytes per token), and how long parsing plus rendering
+takes (median over --repeat runs).
+
+Dumps come from files (saved with `d.dump_hierarchy()` or
+`adb exec-out uiautomator dump /dev/tty`) or are taken live from a device
+with --serial (needs uiautomator2 on this host).
+
+Examples:
+  python3 bench_hierarchy.py dumps/*.xml
+  python3 bench_hierarchy.py --serial 127.0.0.1:5555 --save dumps/settings.xml
+  python3 bench_hierarchy.py dumps/feed.xml --show
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+# The compact renderer lives with the on-device sources
+APP_PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "src", "main", "python")
+sys.path.insert(0, os.path.normpath(APP_PYTHON_DIR))
+
+from compact_hierarchy import CompactHierarchy  # noqa: E402
+
+
+def measure(name: str, xml: str, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        compact = CompactHierarchy(xml)
+        text = compact.render()
+        timings.append(time.perf_counter() - started)
+    xml_bytes = len(xml.encode("utf-8"))
+    compact_bytes = len(text.encode("utf-8"))
+    return {
+        "name": name,
+        "nodes": compact.total,
+        "kept": compact.kept,
+        "xml_bytes": xml_bytes,
+        "compact_bytes": compact_bytes,
+        "reduction": 1 - compact_bytes / xml_bytes if xml_bytes else 0.0,
+        "xml_tokens": xml_bytes // 4,
+        "compact_tokens": compact_bytes // 4,
+        "render_ms": statistics.median(timings) * 1000,
+        "text": text,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dumps", nargs="*", help="uiautomator XML dump files")
+    parser.add_argument("--serial", help="take a live dump from this device with uiautomator2")
+    parser.add_argument("--save", help="write the live dump to this file")
+    parser.add_argument("--repeat", type=int, default=20, help="render runs per dump")
+    parser.add_argument("--show", action="store_true", help="print the compact text")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    dumps = []
+    for path in args.dumps:
+        with open(path, encoding="utf-8") as f:
+            dumps.append((os.path.basename(path), f.read()))
+    if args.serial:
+        import uiautomator2 as u2
+        xml = u2.connect(args.serial).dump_hierarchy()
+        if args.save:
+            with open(args.save, "w", encoding="utf-8") as f:
+                f.write(xml)
+        dumps.append((args.serial, xml))
+    if not dumps:
+        parser.error("give dump files or --serial")
+
+    results = [measure(name, xml, args.repeat) for name, xml in dumps]
+    if args.json:
+        print(json.dumps([{k: v for k, v in r.items() if k != "text"} for r in results], indent=2))
+        return 0
+
+    header = f"{'dump':<28}{'nodes':>7}{'kept':>6}{'xml B':>9}{'compact B':>11}{'saved':>8}{'~tokens':>14}{'ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        tokens = f"{r['xml_tokens']}->{r['compact_tokens']}"
+        print(f"{r['name'][:27]:<28}{r['nodes']:>7}{r['kept']:>6}{r['xml_bytes']:>9}{r['compact_bytes']:>11}"
+              f"{r['reduction']:>8.1%}{tokens:>14}{r['render_ms']:>8.2f}")
+        if args.show:
+            print(r["text"])
+            print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the bridge's input_text paths (text_input.py).
+
+Types strings of several lengths into an input field on a device through
+each mode and reports characters per second:
+
+  shell      `input text` (one key event per character, the usual fallback)
+  ime        uiautomator2 fast input IME (send_keys), in 1000 character batches
+  clipboard  set clipboard + paste key
+  set_text   accessibility setText on the selector's element
+
+Needs uiautomator2 on this host and a screen with an input field, selected
+with --selector (a uiautomator2 selector as JSON). The field is cleared
+before every run.
+
+Examples:
+  python3 bench_input.py --serial 127.0.0.1:5555 --selector '{"className": "android.widget.EditText"}'
+  python3 bench_input.py --serial emulator-5554 --selector '{"resourceId": "com.app:id/q"}' --lengths 10,100,2000
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+
+# The input paths live with the on-device sources
+APP_PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "src", "main", "python")
+sys.path.insert(0, os.path.normpath(APP_PYTHON_DIR))
+
+from text_input import input_text  # noqa: E402
+
+MODES = ("shell", "ime", "clipboard", "set_text")
+SAMPLE = "The quick brown fox jumps over the lazy dog 0123456789. "
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--serial", required=True, help="adb serial of the device")
+    parser.add_argument("--selector", required=True, help="uiautomator2 selector of the input field, as JSON")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma separated modes to compare")
+    parser.add_argument("--lengths", default="10,100,1000", help="comma separated text lengths")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per mode and length")
+    args = parser.parse_args(argv)
+
+    import uiautomator2 as u2
+    d = u2.connect(args.serial)
+    selector = json.loads(args.selector)
+    field = d(**selector)
+    if not field.wait(timeout=5):
+        parser.error(f"no element matches {selector}")
+
+    def run_shell(cmd, timeout=None):
+        return d.shell(cmd, timeout=timeout) if timeout else d.shell(cmd)
+
+    header = f"{'mode':<11}{'chars':>7}{'chars/s':>10}{'ms':>10}{'ok':>5}"
+    print(header)
+    print("-" * len(header))
+    for length in (int(n) for n in args.lengths.split(",") if n):
+        text = (SAMPLE * (length // len(SAMPLE) + 1))[:length]
+        for mode in (m for m in args.modes.split(",") if m):
+            timings = []
+            ok = 0
+            for _ in range(args.repeat):
+                field.click()
+                d.clear_text()
+                result = input_text(d, {"text": text, "mode": mode, "selector": selector, "clear": True}, run_shell)
+                if not result.get("success"):
+                    print(f"{mode:<11}{length:>7}  failed: {result.get('error')}")
+                    break
+                timings.append(result["elapsed_ms"])
+                ok += field.get_text() == text
+            if timings:
+                ms = statistics.median(timings)
+                print(f"{mode:<11}{length:>7}{length / (ms / 1000) if ms else 0:>10.0f}{ms:>10.1f}"
+                      f"{ok:>3}/{len(timings)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
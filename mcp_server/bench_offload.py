@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the gateway's payload transforms (payload_workers.py): event
+loop lag with the work done inline on the loop versus in worker processes.
+
+Runs an in-process gateway, one simulated phone answering every call with
+an observe-style result (a JPEG screenshot plus a uiautomator XML dump) and
+one client sending calls that ask the gateway to downscale the screenshot
+and compact the hierarchy. For each worker count it reports call latency,
+throughput and the loop lag the gateway measured meanwhile; the lag is
+what every other connection's heartbeats and routing wait on.
+
+Needs Pillow. Examples:
+  python3 bench_offload.py
+  python3 bench_offload.py --workers 0,2,4 --calls 200 --concurrency 8 --width 1440
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+
+import socketio
+
+from bench_harness import start_gateway, wait_for_devices, quiet, percentile
+from gateway_stub import TOKEN
+from payload_workers import PayloadWorkers
+
+
+def make_screenshot(width: int, height: int) -> bytes:
+    from PIL import Image
+    gradient = Image.linear_gradient("L").resize((width, height))
+    # Coarse noise keeps the JPEG near a real screenshot's size (under the 1 MB Socket.IO message limit)
+    noise = Image.effect_noise((width // 4, height // 4), 40).resize((width, height))
+    image = Image.merge("RGB", (gradient, noise, Image.blend(gradient, noise, 0.5)))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+
+def make_hierarchy(nodes: int) -> str:
+    rng = random.Random(0)
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<hierarchy rotation="0">']
+    for i in range(nodes):
+        x, y = rng.randrange(0, 900), rng.randrange(0, 2200)
+        text = f"Item {i}" if i % 3 == 0 else ""
+        lines.append(f'<node index="{i}" text="{text}" resource-id="com.example:id/row{i % 40}" '
+                     f'class="android.widget.{"TextView" if text else "FrameLayout"}" package="com.example" '
+                     f'content-desc="" checkable="false" checked="false" clickable="{str(i % 5 == 0).lower()}" '
+                     f'enabled="true" focusable="false" focused="false" scrollable="false" long-clickable="false" '
+                     f'password="false" selected="false" bounds="[{x},{y}][{x + 120},{y + 60}]" />')
+    lines.append("</hierarchy>")
+    return "\n".join(lines)
+
+
+def start_fake_phone(url: str, result: dict) -> socketio.Client:
+    """A device that answers every rpc.call with `result`"""
+    sio = socketio.Client()
+
+    @sio.on("message")
+    def on_message(data):
+        if isinstance(data, dict) and data.get("type") == "rpc.call":
+            sio.emit("message", {"type": "rpc.result", "id": data["id"], "result": result})
+
+    sio.connect(url, headers={"Authorization": f"Bearer {TOKEN}", "X-Device-Id": "bench-phone"})
+    sio.emit("message", {"type": "hello", "device": "bench-phone"})
+    return sio
+
+
+def run_level(url: str, gw, calls: int, concurrency: int, transform: dict) -> dict:
+    client = socketio.Client()
+    waiting = {}
+    slots = threading.Semaphore(concurrency)
+    latencies = []
+    sizes = []
+
+    @client.on("message")
+    def on_message(data):
+        event = waiting.pop(data.get("id"), None) if isinstance(data, dict) else None
+        if event:
+            facets = (data.get("result") or {}).get("facets") or {}
+            sizes.append(sum(len(f.get("data") or "") for f in facets.values()))
+            event.set()
+
+    client.connect(url, headers={"Authorization": f"Bearer {TOKEN}", "X-Device-Id": "bench-client"})
+    client.emit("message", {"type": "hello", "role": "client"})
+    time.sleep(0.5)
+    gw.loop_lag.samples.clear()
+
+    def one(index):
+        try:
+            event = threading.Event()
+            req_id = f"bench-{index}"
+            waiting[req_id] = event
+            started = time.perf_counter()
+            client.emit("message", {"type": "rpc.call", "id": req_id, "method": "observe", "params": {},
+                                    "timeout": 60, "transform": transform})
+            if event.wait(60):
+                latencies.append(time.perf_counter() - started)
+        finally:
+            slots.release()
+
+    started = time.perf_counter()
+    threads = []
+    for index in range(calls):
+        slots.acquire()
+        thread = threading.Thread(target=one, args=(index,), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    lag = gw.loop_lag.to_dict()
+    client.disconnect()
+    return {
+        "ok": len(latencies),
+        "calls_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "result_kb": (sum(sizes) / len(sizes) / 1024) if sizes else 0.0,
+        "lag": lag,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="0,2", help="comma separated worker counts, 0 = inline on the loop")
+    parser.add_argument("--calls", type=int, default=100, help="calls per worker count")
+    parser.add_argument("--concurrency", type=int, default=4, help="calls in flight")
+    parser.add_argument("--width", type=int, default=1080, help="screenshot width (height is 20:9)")
+    parser.add_argument("--nodes", type=int, default=400, help="nodes in the hierarchy dump")
+    parser.add_argument("--max-width", type=int, default=540, help="width the gateway downscales to")
+    args = parser.parse_args(argv)
+
+    screenshot = make_screenshot(args.width, args.width * 20 // 9)
+    hierarchy = make_hierarchy(args.nodes)
+    result = {"success": True, "facets": {"screenshot": {"version": "s", "data": screenshot},
+                                          "hierarchy": {"version": "h", "data": hierarchy}}}
+    transform = {"image": {"max_width": args.max_width, "quality": 80}, "hierarchy": "compact"}
+    print(f"screenshot {len(screenshot) / 1024:.0f} KB, hierarchy {len(hierarchy) / 1024:.0f} KB, "
+          f"{args.calls} calls, {args.concurrency} in flight")
+
+    header = f"{'workers':>8}{'calls/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'out KB':>8}" \
+             f"{'lag p50':>9}{'lag p99':>9}{'lag max':>9}"
+    print(header)
+    print("-" * len(header))
+    with quiet():
+        # One gateway throughout: eventlet's tpool serves the first event loop that uses it
+        gw, url = start_gateway(workers=0)
+        phone = start_fake_phone(url, result)
+        wait_for_devices(gw, 1)
+    for workers in (int(n) for n in args.workers.split(",") if n):
+        with quiet():
+            gw.payloads.close()
+            gw.payloads = PayloadWorkers(workers)
+            if workers:
+                # Start the pool before measuring
+                run_level(url, gw, workers, workers, transform)
+            report = run_level(url, gw, args.calls, args.concurrency, transform)
+        lag = report["lag"]
+        print(f"{workers:>8}{report['calls_per_s']:>9.1f}{report['p50_ms']:>9.1f}{report['p99_ms']:>9.1f}"
+              f"{report['result_kb']:>8.0f}{lag.get('p50_ms', 0):>9.1f}{lag.get('p99_ms', 0):>9.1f}"
+              f"{lag.get('max_ms', 0):>9.1f}")
+        if workers:
+            print(f"  {gw.payloads.stats()['shm_jobs']} payloads of {gw.payloads.shm_threshold // 1024} KB or more "
+                  f"handed over through shared memory (one copy each)")
+        if report["ok"] < args.calls:
+            print(f"  {args.calls - report['ok']} calls got no result")
+    with quiet():
+        phone.disconnect()
+        # Wait for the worker processes, otherwise they outlive the benchmark
+        gw.payloads.close(wait=True)
+    return 0
+
+
+if __name__ == "__main__":
+    code = main()
+    sys.stdout.flush()
+    # The gateways' event loops run on daemon threads; eventlet's atexit tpool cleanup
+    # can only run on the loop that started tpool and would fail from the main thread
+    os._exit(code)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the gateway's ConnectionRegistry.
+
+Attaches N simulated sockets (half devices, half clients) and reports memory per
+connection plus connect / lookup / disconnect cost, next to the linear sid scan
+the gateway used before the registry existed.
+
+Examples:
+  python3 bench_registry.py
+  python3 bench_registry.py --connections 10000,50000
+"""
+
+import sys
+import time
+import uuid
+import argparse
+import tracemalloc
+
+from gateway_stub import ConnectionRegistry
+
+
+def bench(n: int) -> dict:
+    sids = [uuid.uuid4().hex for _ in range(n)]
+    ids = [str(uuid.uuid4()) for _ in range(n)]
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    registry = ConnectionRegistry(max_connections=n)
+    started = time.perf_counter()
+    for i, sid in enumerate(sids):
+        record = registry.add(sid)
+        registry.assign(record, "device" if i % 2 else "client", ids[i])
+    connect_s = time.perf_counter() - started
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for sid in sids:
+        registry.get(sid)
+    lookup_s = time.perf_counter() - started
+
+    # What on_disconnect used to do: scan id -> sid to find the id for a sid
+    legacy = {ids[i]: sid for i, sid in enumerate(sids)}
+    probes = sids[-min(n, 200):]
+    started = time.perf_counter()
+    for sid in probes:
+        next(conn_id for conn_id, s in legacy.items() if s == sid)
+    legacy_scan_s = (time.perf_counter() - started) / len(probes)
+
+    estimate = registry.memory_usage()
+    started = time.perf_counter()
+    for sid in sids:
+        registry.remove(sid)
+    disconnect_s = time.perf_counter() - started
+
+    return {
+        "connections": n,
+        "traced_bytes_per_conn": (after - before) / n,
+        "estimated_bytes_per_conn": estimate["bytes_per_connection"],
+        "connect_us": connect_s / n * 1e6,
+        "lookup_us": lookup_s / n * 1e6,
+        "disconnect_us": disconnect_s / n * 1e6,
+        "legacy_scan_us": legacy_scan_s * 1e6,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", default="1000,10000,50000", help="comma separated socket counts")
+    args = parser.parse_args(argv)
+
+    header = (f"{'conns':>8}{'B/conn':>10}{'est B/conn':>12}{'connect us':>12}"
+              f"{'lookup us':>11}{'disconn us':>12}{'old scan us':>13}")
+    print(header)
+    print("-" * len(header))
+    for n in (int(c) for c in args.connections.split(",") if c):
+        r = bench(n)
+        print(f"{r['connections']:>8}{r['traced_bytes_per_conn']:>10.0f}{r['estimated_bytes_per_conn']:>12.0f}"
+              f"{r['connect_us']:>12.2f}{r['lookup_us']:>11.3f}{r['disconnect_us']:>12.2f}{r['legacy_scan_us']:>13.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
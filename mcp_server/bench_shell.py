@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the bridge's persistent shell sessions (shell_pool.py).
+
+Runs the same short commands (COMMANDS) through a fresh `adb shell <cmd>`
+process per call ("per-call", what d.shell costs without a session) and
+through a ShellSessionPool ("pool"), at several concurrency levels. The
+last column is the pool's throughput relative to per-call at that level.
+
+Needs adb and a device, or --local to measure against the local `sh` (only
+shows the framing/pipelining overhead, not the adb handshake savings).
+
+Examples:
+  python3 bench_shell.py --serial 127.0.0.1:5555
+  python3 bench_shell.py --serial emulator-5554 --sessions 4 --concurrency 1,4,16
+  python3 bench_shell.py --local
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# The session pool lives with the on-device sources
+APP_PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "src", "main", "python")
+sys.path.insert(0, os.path.normpath(APP_PYTHON_DIR))
+
+from shell_pool import ShellSessionPool, adb_shell_argv  # noqa: E402
+from bench_harness import percentile  # noqa: E402
+
+COMMANDS = ["getprop ro.build.version.sdk", "dumpsys window | grep mCurrentFocus", "echo ok"]
+
+
+def run_level(call, concurrency: int, total: int) -> dict:
+    latencies = []
+    errors = 0
+
+    def one(i):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            call(COMMANDS[i % len(COMMANDS)])
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    return {
+        "calls_per_s": total / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "errors": errors,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--serial", help="adb serial of the device")
+    parser.add_argument("--adb", help="adb binary (default: $ADBUTILS_ADB_PATH or adb on PATH)")
+    parser.add_argument("--local", action="store_true", help="use the local sh instead of adb shell")
+    parser.add_argument("--sessions", type=int, default=2, help="persistent sessions in the pool")
+    parser.add_argument("--concurrency", default="1,4", help="comma separated in-flight limits")
+    parser.add_argument("--requests", type=int, default=100, help="commands per level")
+    args = parser.parse_args(argv)
+
+    if args.local:
+        session_argv, spawn_argv = ["sh"], ["sh", "-c"]
+    else:
+        session_argv = adb_shell_argv(args.serial, args.adb)
+        if session_argv is None:
+            parser.error("need --serial and an adb binary, or --local")
+        spawn_argv = session_argv
+
+    def spawn(cmd):
+        subprocess.run(spawn_argv + [cmd], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
+
+    pool = ShellSessionPool(session_argv, args.sessions)
+    pool.run("true")  # Start the first session outside the measurement
+
+    header = f"{'mode':<10}{'conc':>6}{'calls/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'err':>6}{'vs per-call':>13}"
+    print(f"{args.requests} commands per level, {args.sessions} pool sessions, {'sh' if args.local else 'adb shell'}")
+    print(header)
+    print("-" * len(header))
+    try:
+        for concurrency in (int(c) for c in args.concurrency.split(",") if c):
+            baseline = None
+            for mode, call in (("per-call", spawn), ("pool", pool.run)):
+                r = run_level(call, concurrency, args.requests)
+                baseline = baseline or r["calls_per_s"]
+                print(f"{mode:<10}{concurrency:>6}{r['calls_per_s']:>10.1f}{r['p50_ms']:>10.2f}"
+                      f"{r['p99_ms']:>10.2f}{r['errors']:>6}{r['calls_per_s'] / baseline:>12.2f}x")
+    finally:
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,18 +13,45 @@ Examples:
   call start_app {"package_name":"com.android.settings","stop":true}
   call click_text {"text":"Network & internet"}
   call shell {"cmd":"pm list packages -3"}
+  fanout get_device_info {}              (every device)
+  fanout shell {"cmd":"getprop"} lab,a13 (devices tagged lab AND a13)
+  batch ops.txt 8                        (admin script, 8 calls in flight)
+
+Admin scripts (see admin_batch.py) can also run unattended:
+  python3 gateway_stub.py --script ops.txt --parallel 8 --wait-devices 20
+  cat ops.txt | python3 gateway_stub.py --script -
+
+Sockets without the right Bearer token are refused at handshake; set
+GATEWAY_TOKEN= (empty) to disable the check. GATEWAY_CONNECT_RATE and
+GATEWAY_CONNECT_BURST limit new connections per source IP.
+
+Set GATEWAY_RECORD_FILE=<path> to capture rpc traffic for replay.py.
 """
 
 import os
+import re
 import sys
 import uuid
 import json
+import time
+import hmac
+import heapq
+import queue
+import hashlib
 import threading
 import logging
-from typing import Dict
+from collections import OrderedDict, deque
+from typing import Dict, Optional
 
 import socketio
 import eventlet
+from eventlet import tpool
+from eventlet import websocket as eventlet_websocket
+
+from adaptive_timeout import AdaptiveTimeouts
+from admin_batch import AdminBatch, DEFAULT_PARALLEL, format_summary
+from payload_workers import PayloadWorkers, WORKERS
+from transfer_common import loggable
 
 
 # Configure logging
@@ -41,17 +68,501 @@ logger = logging.getLogger(__name__)
 HOST = "0.0.0.0"  # Force listen on all interfaces
 PORT = int(os.environ.get("GATEWAY_PORT", "8765"))
 TOKEN = os.environ.get("GATEWAY_TOKEN", "devtoken")
+RECORD_FILE = os.environ.get("GATEWAY_RECORD_FILE")  # Optional rpc traffic capture for replay.py
+MAX_CONNECTIONS = int(os.environ.get("GATEWAY_MAX_CONNECTIONS", "50000"))
+CONNECT_RATE = float(os.environ.get("GATEWAY_CONNECT_RATE", "20"))    # new sockets per second per IP
+CONNECT_BURST = float(os.environ.get("GATEWAY_CONNECT_BURST", "40"))  # short bursts allowed above the rate
+FAST_WS_MASK = os.environ.get("GATEWAY_FAST_WS_MASK") == "1"  # opt-in replacement for eventlet's unmasking
+PROBE_TIMEOUT = 5.0  # seconds a half-open circuit waits for its ping probe
+LOOP_LAG_INTERVAL = 0.1  # seconds between event loop lag samples
+LOOP_CALL_INTERVAL = 0.02  # seconds between runs of calls handed to the loop from other threads
+FANOUT_FINISH_WAIT = 5.0  # seconds a REPL fanout waits for the loop to summarize it after the deadline
+
+
+def _xor_mask(data, mask, length=None, offset=0):
+    """RFC 6455 unmasking with one big-int XOR.
+
+    eventlet's own _apply_mask builds the frame one byte per generator
+    step, about half a second of event loop time per megabyte a device
+    sends (screenshots, hierarchy dumps); this takes around a millisecond.
+    Only installed with GATEWAY_FAST_WS_MASK=1, since it replaces a private
+    eventlet method.
+    """
+    if length is None:
+        length = len(data)
+    if not length:
+        return b""
+    key = bytes(mask[(offset + i) % 4] for i in range(4)) * (length // 4 + 1)
+    return (int.from_bytes(data[:length], "big") ^ int.from_bytes(key[:length], "big")).to_bytes(length, "big")
+
+
+if FAST_WS_MASK and hasattr(eventlet_websocket, "RFC6455WebSocket"):
+    eventlet_websocket.RFC6455WebSocket._apply_mask = staticmethod(_xor_mask)
+
+
+class TokenVerifier:
+    """Checks the handshake Authorization header against the gateway token.
+
+    The expected digest is computed once; each check hashes the presented
+    header and compares digests in constant time, so neither the token length
+    nor a matching prefix is observable through timing.
+    """
+
+    def __init__(self, token: str):
+        self.enabled = bool(token)
+        self.expected = hashlib.sha256(f"Bearer {token}".encode()).digest()
+
+    def verify(self, authorization: Optional[str]) -> bool:
+        if not self.enabled:
+            return True
+        if not authorization:
+            return False
+        presented = hashlib.sha256(authorization.strip().encode("utf-8", "replace")).digest()
+        return hmac.compare_digest(presented, self.expected)
+
+
+class ConnectRateLimiter:
+    """Token bucket per source IP for new connections.
+
+    Buckets are kept in least recently used order and the oldest is evicted
+    once `max_ips` are tracked, so a flood from many distinct addresses costs
+    O(1) per connect and bounded memory.
+    """
+
+    def __init__(self, rate: float = CONNECT_RATE, burst: float = CONNECT_BURST, max_ips: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_ips = max_ips
+        self.buckets: "OrderedDict[str, list]" = OrderedDict()  # ip -> [tokens, last refill time]
+
+    def allow(self, ip: str, now: float) -> bool:
+        if self.rate <= 0:
+            return True
+        bucket = self.buckets.get(ip)
+        if bucket is None:
+            if len(self.buckets) >= self.max_ips:
+                self.buckets.popitem(last=False)
+            bucket = self.buckets[ip] = [self.burst, now]
+        else:
+            self.buckets.move_to_end(ip)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1.0:
+            return False
+        bucket[0] -= 1.0
+        return True
+
+
+class TrafficRecorder:
+    """Append-only capture of rpc.call / rpc.result / rpc.error traffic.
+
+    One compact JSON array per line:
+      [ts, "c", id, method, params]   rpc.call
+      [ts, "r", id, success]          rpc.result
+      [ts, "e", id]                   rpc.error
+    Binary params (transfer chunks, image templates) are recorded as
+    {"__bytes__": length}; replay.py sends random bytes of that length.
+    Lines are buffered and flushed every `flush_every` records (and on close).
+    """
+
+    def __init__(self, path: str, flush_every: int = 64):
+        self.path = path
+        self.flush_every = flush_every
+        self.file = open(path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.unflushed = 0
+
+    def _write(self, record: list):
+        line = json.dumps(record, separators=(",", ":"), ensure_ascii=False, default=self._default)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.unflushed += 1
+            if self.unflushed >= self.flush_every:
+                self.file.flush()
+                self.unflushed = 0
+
+    @staticmethod
+    def _default(value):
+        # Binary payloads are not worth storing, keep only their size
+        if isinstance(value, (bytes, bytearray)):
+            return {"__bytes__": len(value)}
+        return str(value)
+
+    def record_call(self, data: dict):
+        self._write([round(time.time(), 4), "c", data.get("id"), data.get("method"), data.get("params") or {}])
+
+    def record_result(self, data: dict):
+        if data.get("type") == "rpc.error":
+            self._write([round(time.time(), 4), "e", data.get("id")])
+        else:
+            result = data.get("result")
+            success = result.get("success", True) if isinstance(result, dict) else True
+            self._write([round(time.time(), 4), "r", data.get("id"), success])
+
+    def close(self):
+        with self.lock:
+            self.file.flush()
+            self.file.close()
+
+
+def logcat_spec_error(spec) -> Optional[str]:
+    """Why a client's logcat filter would fail on the device, None when it is usable"""
+    if not isinstance(spec, dict):
+        return "logcat filter must be an object"
+    tags = spec.get("tags")
+    if tags is not None and not (isinstance(tags, list) and all(isinstance(tag, str) for tag in tags)):
+        return "logcat tags must be a list of strings"
+    level = spec.get("level")
+    if level is not None and (not isinstance(level, str) or level[:1].upper() not in "VDIWEF"):
+        return f"logcat level must be one of V D I W E F, got {level!r}"
+    regex = spec.get("regex")
+    if regex is not None:
+        if not isinstance(regex, str):
+            return "logcat regex must be a string"
+        try:
+            re.compile(regex)
+        except re.error as e:
+            return f"invalid logcat regex {regex!r}: {e}"
+    return None
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a sleeping green thread.
+
+    Anything that runs on the loop without yielding (CPU-heavy handlers,
+    blocking calls) delays every connection's heartbeats and routing by
+    the same amount; the last `window` samples give the lag percentiles.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, window: int = 600):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.started = False
+
+    def run(self, sleep):
+        self.started = True
+        while True:
+            before = time.perf_counter()
+            sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - before - self.interval))
+
+    def to_dict(self) -> dict:
+        samples = sorted(self.samples)
+        if not samples:
+            return {"samples": 0}
+
+        def pct(q):
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 2)
+
+        return {"samples": len(samples), "p50_ms": pct(0.5), "p99_ms": pct(0.99), "max_ms": pct(1.0)}
+
+
+class LoopCalls:
+    """Runs functions handed over from OS threads (REPL, admin scripts, monitors) on the event loop.
+
+    Socket.IO emits and background tasks only take effect on the loop's own
+    thread; from another thread they sit in eventlet queues nobody wakes up.
+    A green thread drains the submitted calls every `interval` seconds
+    (tpool would wake it sooner, but binds eventlet's thread pool to this
+    loop for the rest of the process).
+    """
+
+    def __init__(self, interval: float = LOOP_CALL_INTERVAL):
+        self.interval = interval
+        self.queue = queue.SimpleQueue()
+        self.loop_thread = None  # ident of the thread running the event loop, once known
+
+    def start(self, sio):
+        """Called on the loop (first connect)"""
+        if self.loop_thread is None:
+            self.loop_thread = threading.get_ident()
+            sio.start_background_task(self._run, sio.sleep)
+
+    def submit(self, func, *args):
+        if self.loop_thread is None or threading.get_ident() == self.loop_thread:
+            func(*args)
+        else:
+            self.queue.put((func, args))
+
+    def _run(self, sleep):
+        while True:
+            sleep(self.interval)
+            while not self.queue.empty():
+                func, args = self.queue.get_nowait()
+                try:
+                    func(*args)
+                except Exception as e:
+                    logger.error(f"Gateway: Error in loop call {getattr(func, '__name__', func)}: {e}")
+
+
+class CircuitBreaker:
+    """Per-device circuit breaker over the last `window` forwarded calls.
+
+    A call counts as failed when the device answered rpc.error, missed the
+    deadline, or took longer than `slow_call` seconds. The circuit opens when
+    failures reach `failure_ratio` of at least `min_calls` calls, or after
+    `max_consecutive` failures in a row; an open device gets no traffic. After
+    `cooldown` seconds it goes half-open and the gateway sends a `ping` probe:
+    success closes the circuit, failure reopens it with the cooldown doubled.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window: int = 20, min_calls: int = 5, failure_ratio: float = 0.5,
+                 max_consecutive: int = 3, slow_call: float = 10.0,
+                 cooldown: float = 15.0, max_cooldown: float = 120.0):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.max_consecutive = max_consecutive
+        self.slow_call = slow_call
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = self.CLOSED
+        self.outcomes = deque(maxlen=window)  # True for a failed call
+        self.failures = 0                      # failures currently in `outcomes`
+        self.consecutive = 0
+        self.latency = None                    # EWMA of call latency, seconds
+        self.cooldown = cooldown
+        self.open_until = 0.0
+        self.trips = 0
+
+    def allow(self) -> bool:
+        return self.state == self.CLOSED
+
+    def record(self, ok: bool, latency: float, now: float) -> bool:
+        """Add a call outcome; True if this tripped the circuit"""
+        failed = not ok or latency > self.slow_call
+        if len(self.outcomes) == self.window and self.outcomes[0]:
+            self.failures -= 1
+        self.outcomes.append(failed)
+        self.failures += failed
+        self.consecutive = self.consecutive + 1 if failed else 0
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if self.state != self.CLOSED or not failed:
+            return False
+        if self.consecutive >= self.max_consecutive or (
+                len(self.outcomes) >= self.min_calls and self.failures >= self.failure_ratio * len(self.outcomes)):
+            self._open(now)
+            return True
+        return False
+
+    def _open(self, now: float):
+        self.state = self.OPEN
+        self.open_until = now + self.cooldown
+        self.trips += 1
+
+    def probe_due(self, now: float) -> bool:
+        """Move an open circuit whose cooldown elapsed to half-open; True if a probe should be sent"""
+        if self.state == self.OPEN and now >= self.open_until:
+            self.state = self.HALF_OPEN
+            return True
+        return False
+
+    def probe_result(self, ok: bool, now: float):
+        if self.state != self.HALF_OPEN:
+            return
+        if ok:
+            self.state = self.CLOSED
+            self.outcomes.clear()
+            self.failures = 0
+            self.consecutive = 0
+            self.cooldown = self.base_cooldown
+        else:
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self._open(now)
+
+    def score(self) -> float:
+        """0-100: share of recent calls that succeeded, discounted by latency relative to `slow_call`"""
+        if self.state != self.CLOSED:
+            return 0.0
+        success = 1.0 - self.failures / len(self.outcomes) if self.outcomes else 1.0
+        slowness = min(self.latency / self.slow_call, 1.0) if self.latency is not None else 0.0
+        return round(100.0 * success * (1.0 - 0.5 * slowness), 1)
+
+    def to_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "score": self.score(),
+            "calls": len(self.outcomes),
+            "failures": self.failures,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "trips": self.trips,
+        }
+
+
+class ConnectionRecord:
+    """State of one socket. Slots keep records small when tens of thousands are attached."""
+
+    __slots__ = (
+        "sid", "id", "kind", "connected_at", "last_heartbeat",
+        "messages_in", "messages_out", "rpc_calls", "rpc_results", "rpc_errors",
+        "capabilities", "tags", "watch", "logcat", "subscription", "forwarded", "breaker",
+    )
+
+    def __init__(self, sid: str, now: float):
+        self.sid = sid
+        self.id: Optional[str] = None      # device_id / client_id once the first message arrives
+        self.kind: Optional[str] = None    # "device" or "client"
+        self.connected_at = now
+        self.last_heartbeat = now
+        self.messages_in = 0
+        self.messages_out = 0
+        self.rpc_calls = 0                 # calls sent by a client / received by a device
+        self.rpc_results = 0
+        self.rpc_errors = 0
+        self.capabilities: frozenset = frozenset()  # device: RPC methods announced in hello
+        self.tags: frozenset = frozenset()          # device: tags announced in hello
+        self.watch: frozenset = frozenset()         # device: event kinds last sent in "watch"
+        self.logcat: frozenset = frozenset()        # device: logcat filter keys last sent in "watch"
+        self.subscription: Optional[dict] = None    # client: {"events": set, "devices": set or None, "logcat": (key, spec) or None}
+        self.forwarded: Optional[set] = None        # client: req_ids awaiting a device result
+        self.breaker: Optional[CircuitBreaker] = None  # device: routing health
+
+    def to_dict(self) -> dict:
+        return {
+            "sid": self.sid,
+            "id": self.id,
+            "kind": self.kind,
+            "connected_at": self.connected_at,
+            "last_heartbeat": self.last_heartbeat,
+            "messages_in": self.messages_in,
+            "messages_out": self.messages_out,
+            "rpc_calls": self.rpc_calls,
+            "rpc_results": self.rpc_results,
+            "rpc_errors": self.rpc_errors,
+            "capabilities": sorted(self.capabilities),
+            "tags": sorted(self.tags),
+            "health": self.breaker.to_dict() if self.breaker else None,
+        }
+
+
+class ForwardedCall:
+    """A client call relayed to a device, kept until the result arrives or its deadline passes"""
+
+    __slots__ = ("client", "method", "device_id", "sent_at", "deadline", "transform")
+
+    def __init__(self, client: ConnectionRecord, method: str, device_id: str, sent_at: float, deadline: float,
+                 transform: Optional[dict] = None):
+        self.client = client
+        self.method = method
+        self.device_id = device_id
+        self.sent_at = sent_at
+        self.deadline = deadline
+        self.transform = transform  # payload transform applied to the result (payload_workers.py)
+
+
+class LocalCall:
+    """A call the gateway itself sent with start_call, answered through its sink"""
+
+    __slots__ = ("sink", "method", "device_id", "sent_at")
+
+    def __init__(self, sink, method: str, device_id: str, sent_at: float):
+        self.sink = sink
+        self.method = method
+        self.device_id = device_id
+        self.sent_at = sent_at
+
+
+class ConnectionRegistry:
+    """Single source of truth for attached sockets.
+
+    Records are indexed by sid and by device/client id, so connect, disconnect
+    and routing lookups are O(1) in both directions.
+    """
+
+    def __init__(self, max_connections: int = MAX_CONNECTIONS):
+        self.max_connections = max_connections
+        self.by_sid: Dict[str, ConnectionRecord] = {}
+        self.devices: Dict[str, ConnectionRecord] = {}  # device_id -> record (手机设备)
+        self.clients: Dict[str, ConnectionRecord] = {}  # client_id -> record (客户端)
+
+    def __len__(self):
+        return len(self.by_sid)
+
+    def add(self, sid: str) -> Optional[ConnectionRecord]:
+        """Create the record for a new socket, or None when the registry is full"""
+        if len(self.by_sid) >= self.max_connections:
+            return None
+        record = ConnectionRecord(sid, time.time())
+        self.by_sid[sid] = record
+        return record
+
+    def get(self, sid: str) -> Optional[ConnectionRecord]:
+        return self.by_sid.get(sid)
+
+    def assign(self, record: ConnectionRecord, kind: str, conn_id: str):
+        record.kind = kind
+        record.id = conn_id
+        (self.devices if kind == "device" else self.clients)[conn_id] = record
+
+    def remove(self, sid: str) -> Optional[ConnectionRecord]:
+        record = self.by_sid.pop(sid, None)
+        if record and record.id is not None:
+            (self.devices if record.kind == "device" else self.clients).pop(record.id, None)
+        return record
+
+    def memory_usage(self) -> dict:
+        """Approximate bytes held by records and indexes (shared frozensets excluded)"""
+        record_bytes = 0
+        for record in self.by_sid.values():
+            record_bytes += sys.getsizeof(record) + sys.getsizeof(record.sid)
+            if record.id is not None:
+                record_bytes += sys.getsizeof(record.id)
+            if record.forwarded:
+                record_bytes += sys.getsizeof(record.forwarded)
+        index_bytes = sys.getsizeof(self.by_sid) + sys.getsizeof(self.devices) + sys.getsizeof(self.clients)
+        total = record_bytes + index_bytes
+        return {
+            "connections": len(self.by_sid),
+            "total_bytes": total,
+            "bytes_per_connection": total / len(self.by_sid) if self.by_sid else 0,
+        }
+
+    def health(self) -> dict:
+        """Device count per circuit state"""
+        counts = {CircuitBreaker.CLOSED: 0, CircuitBreaker.OPEN: 0, CircuitBreaker.HALF_OPEN: 0}
+        for record in self.devices.values():
+            if record.breaker:
+                counts[record.breaker.state] += 1
+        return counts
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.by_sid),
+            "devices": len(self.devices),
+            "clients": len(self.clients),
+            "max_connections": self.max_connections,
+        }
 
 
 class Gateway:
-    def __init__(self):
-        self.device_connections: Dict[str, str] = {}  # device_id -> sid (手机设备)
-        self.client_connections: Dict[str, str] = {}  # client_id -> sid (客户端)
-        self.connection_types: Dict[str, str] = {}    # sid -> connection_type ("device" or "client")
+    def __init__(self, record_file: str = RECORD_FILE, token: str = TOKEN,
+                 connect_rate: float = CONNECT_RATE, connect_burst: float = CONNECT_BURST, workers: int = WORKERS):
+        self.registry = ConnectionRegistry()
+        self.verifier = TokenVerifier(token)
+        self.rate_limiter = ConnectRateLimiter(connect_rate, connect_burst)
+        self.rejected = {"rate": 0, "auth": 0, "full": 0}  # sockets refused at handshake
+        if not self.verifier.enabled:
+            logger.warning("Gateway: GATEWAY_TOKEN is empty, accepting unauthenticated sockets")
         self.pending: Dict[str, threading.Event] = {}
         self.results: Dict[str, dict] = {}
-        self.connection_heartbeats: Dict[str, float] = {}  # sid -> last heartbeat time
+        self.forwarded: Dict[str, ForwardedCall] = {}  # req_id -> client call awaiting the device result
+        self.local_calls: Dict[str, LocalCall] = {}  # req_id -> start_call awaiting the device result
+        self.deadlines = []  # heap of (deadline, req_id) for forwarded calls
+        self.deadline_lock = threading.Lock()
+        self.timeouts = AdaptiveTimeouts()  # per-method / per-device defaults from recent latency
+        self.event_subscribers: Dict[str, ConnectionRecord] = {}  # client sid -> record with a subscription
+        self.fanouts: Dict[str, dict] = {}  # fanout id -> scatter/gather state
+        self.fanout_requests: Dict[str, tuple] = {}  # per-device req_id -> (fanout id, device_id)
+        self.probes: Dict[str, str] = {}  # ping probe req_id -> device_id of a half-open circuit
         self.heartbeat_timeout = 60  # 60 seconds timeout
+        self.recorder = TrafficRecorder(record_file) if record_file else None
+        self.payloads = PayloadWorkers(workers)  # screenshot / hierarchy / compression transforms
+        self.loop_lag = LoopLagMonitor()
+        self.loop_calls = LoopCalls()  # emits from the REPL, admin scripts and monitor threads
+        if self.recorder:
+            logger.info(f"Gateway: Recording RPC traffic to {record_file}")
         
         logger.info("Gateway: Initializing Socket.IO server...")
         
@@ -72,6 +583,14 @@ class Gateway:
         self.heartbeat_thread = threading.Thread(target=self._monitor_heartbeats, daemon=True)
         self.heartbeat_thread.start()
         
+        # Expire forwarded calls whose deadline passed without a device result
+        self.deadline_thread = threading.Thread(target=self._expire_deadlines, daemon=True)
+        self.deadline_thread.start()
+        
+        # Probe devices whose circuit breaker cooldown has elapsed
+        self.probe_thread = threading.Thread(target=self._probe_open_circuits, daemon=True)
+        self.probe_thread.start()
+        
         logger.info("Gateway: Socket.IO event handlers registered successfully")
         
     def _monitor_heartbeats(self):
@@ -81,8 +600,8 @@ class Gateway:
                 current_time = time.time()
                 stale_connections = []
                 
-                for sid, last_heartbeat in self.connection_heartbeats.items():
-                    if current_time - last_heartbeat > self.heartbeat_timeout:
+                for sid, record in list(self.registry.by_sid.items()):
+                    if current_time - record.last_heartbeat > self.heartbeat_timeout:
                         stale_connections.append(sid)
                         logger.warning(f"Gateway: Connection {sid} timed out, marking for disconnect")
                 
@@ -100,48 +619,142 @@ class Gateway:
                 logger.error(f"Gateway: Error in heartbeat monitor: {e}")
                 time.sleep(10)
 
+    def _expire_deadlines(self):
+        """Answer forwarded calls past their deadline with rpc.error instead of letting clients hang"""
+        while True:
+            try:
+                now = time.time()
+                expired = []
+                with self.deadline_lock:
+                    while self.deadlines and self.deadlines[0][0] <= now:
+                        expired.append(heapq.heappop(self.deadlines)[1])
+                for req_id in expired:
+                    if req_id in self.probes:
+                        self._finish_probe(req_id, ok=False)
+                        continue
+                    local = self.local_calls.pop(req_id, None)
+                    if local is not None:
+                        self.timeouts.observe(local.method, now - local.sent_at, local.device_id)
+                        self._record_outcome(local.device_id, False, now - local.sent_at)
+                        local.sink({"type": "rpc.error", "id": req_id, "error": "Deadline exceeded"})
+                        continue
+                    call = self.forwarded.pop(req_id, None)
+                    if call is None:
+                        continue  # Already answered
+                    call.client.forwarded.discard(req_id)
+                    # A timeout is a lower bound on the real latency; feed it back so the
+                    # adaptive default grows for a method/device that keeps timing out
+                    self.timeouts.observe(call.method, now - call.sent_at, call.device_id)
+                    self._record_outcome(call.device_id, False, now - call.sent_at)
+                    logger.warning(f"Gateway: RPC call {req_id} ({call.method}) exceeded its deadline")
+                    self._emit(call.client, {"type": "rpc.error", "id": req_id, "error": "Deadline exceeded"})
+                time.sleep(0.2)
+            except Exception as e:
+                logger.error(f"Gateway: Error in deadline monitor: {e}")
+                time.sleep(1)
+
+    def _probe_open_circuits(self):
+        """Send a ping to each device whose circuit just went half-open"""
+        while True:
+            try:
+                now = time.time()
+                for device in list(self.registry.devices.values()):
+                    if device.breaker and device.breaker.probe_due(now):
+                        self._send_probe(device, now)
+                time.sleep(1)
+            except Exception as e:
+                logger.error(f"Gateway: Error in circuit probe monitor: {e}")
+                time.sleep(1)
+
+    def _send_probe(self, device, now):
+        req_id = f"probe:{uuid.uuid4()}"
+        self.probes[req_id] = device.id
+        with self.deadline_lock:
+            heapq.heappush(self.deadlines, (now + PROBE_TIMEOUT, req_id))
+        logger.info(f"Gateway: Circuit half-open for device {device.id}, sending ping probe")
+        self._emit(device, {"type": "rpc.call", "id": req_id, "method": "ping", "params": {}, "timeout": PROBE_TIMEOUT})
+
+    def _finish_probe(self, req_id, ok):
+        device_id = self.probes.pop(req_id, None)
+        device = self.registry.devices.get(device_id)
+        if device is None or device.breaker is None:
+            return
+        device.breaker.probe_result(ok, time.time())
+        if ok:
+            logger.info(f"Gateway: Device {device_id} passed its probe, circuit closed")
+        else:
+            logger.warning(f"Gateway: Device {device_id} failed its probe, circuit open "
+                           f"for {device.breaker.cooldown:.0f}s")
+
+    def _record_outcome(self, device_id, ok, latency):
+        """Feed a call outcome into the device's circuit breaker"""
+        device = self.registry.devices.get(device_id)
+        if device is None or device.breaker is None:
+            return
+        if device.breaker.record(ok, latency, time.time()):
+            logger.warning(f"Gateway: Circuit opened for device {device_id} "
+                           f"({device.breaker.failures}/{len(device.breaker.outcomes)} recent calls failed), "
+                           f"excluded from routing for {device.breaker.cooldown:.0f}s")
+
     def on_connect(self, sid, environ):
-        logger.info(f"Gateway: New connection from {sid}")
-        logger.debug(f"Gateway: Environment: {environ}")
+        # 握手阶段先做限流和鉴权，被拒绝的连接不分配任何状态，也不逐条打 INFO 日志
+        ip = environ.get("REMOTE_ADDR", "")
+        if not self.rate_limiter.allow(ip, time.time()):
+            self.rejected["rate"] += 1
+            logger.debug(f"Gateway: Connection rate limit exceeded for {ip}, rejecting {sid}")
+            return False
+        if not self.verifier.verify(environ.get("HTTP_AUTHORIZATION")):
+            self.rejected["auth"] += 1
+            logger.debug(f"Gateway: Bad or missing token from {ip}, rejecting {sid}")
+            return False
+        logger.info(f"Gateway: New connection from {sid} ({ip})")
+        if not self.loop_lag.started:
+            # 在服务器所在的事件循环中采样，而不是创建 Gateway 的线程
+            self.loop_lag.started = True
+            self.sio.start_background_task(self.loop_lag.run, self.sio.sleep)
+            self.loop_calls.start(self.sio)
         # 新连接暂时不分配类型，等待第一个消息来判断
+        # Initialize record (and heartbeat) for new connection
+        if self.registry.add(sid) is None:
+            self.rejected["full"] += 1
+            logger.warning(f"Gateway: Connection limit {self.registry.max_connections} reached, rejecting {sid}")
+            return False
         logger.info(f"Gateway: New connection established, waiting for message type...")
-        logger.info(f"Gateway: Total connections: {len(self.connection_types)}")
-        # Initialize heartbeat for new connection
-        self.connection_heartbeats[sid] = time.time()
+        logger.info(f"Gateway: Total connections: {len(self.registry)}")
 
     def on_disconnect(self, sid):
         logger.info(f"Gateway: Client disconnected: {sid}")
         
         # 根据连接类型处理断开
-        connection_type = self.connection_types.get(sid)
-        if connection_type == "device":
-            # 设备断开
-            for device_id, device_sid in list(self.device_connections.items()):
-                if device_sid == sid:
-                    self.device_connections.pop(device_id, None)
-                    logger.info(f"Gateway: Device disconnected: {device_id}")
-                    break
-        elif connection_type == "client":
-            # 客户端断开
-            for client_id, client_sid in list(self.client_connections.items()):
-                if client_sid == sid:
-                    self.client_connections.pop(client_id, None)
-                    logger.info(f"Gateway: Client disconnected: {client_id}")
-                    break
+        record = self.registry.remove(sid)
+        if record is None:
+            return
+        if record.kind == "device":
+            logger.info(f"Gateway: Device disconnected: {record.id}")
+            self.timeouts.forget_device(record.id)
+        elif record.kind == "client":
+            logger.info(f"Gateway: Client disconnected: {record.id}")
+            # 丢弃该客户端尚未返回的转发请求和事件订阅
+            for req_id in record.forwarded or ():
+                self.forwarded.pop(req_id, None)
+            if self.event_subscribers.pop(sid, None):
+                self._update_device_watches()
         
-        # 清理连接类型和心跳
-        self.connection_types.pop(sid, None)
-        self.connection_heartbeats.pop(sid, None)
-        logger.info(f"Gateway: Remaining connections: {len(self.connection_types)}")
-        logger.info(f"Gateway: Devices: {len(self.device_connections)}, Clients: {len(self.client_connections)}")
+        logger.info(f"Gateway: Remaining connections: {len(self.registry)}")
+        logger.info(f"Gateway: Devices: {len(self.registry.devices)}, Clients: {len(self.registry.clients)}")
 
     def on_message(self, sid, data):
-        logger.info(f"Gateway: Received message from {sid}: {data}")
+        logger.info(f"Gateway: Received message from {sid}: {loggable(data)}")
         logger.debug(f"Gateway: Message type: {type(data)}")
         
+        record = self.registry.get(sid)
+        if record is None:
+            return
+        record.messages_in += 1
+        
         # 如果这是新连接的第一个消息，判断连接类型
-        if sid not in self.connection_types:
-            self._determine_connection_type(sid, data)
+        if record.kind is None:
+            self._determine_connection_type(record, data)
         
         # Handle different message types
         if isinstance(data, dict):
@@ -152,24 +765,25 @@ class Gateway:
             elif msg_type == "ping":
                 logger.debug(f"Gateway: ping from {sid}")
                 # Update heartbeat
-                self.connection_heartbeats[sid] = time.time()
+                record.last_heartbeat = time.time()
                 # Send pong response
                 pong_msg = {"type": "pong", "session": data.get("session", "unknown")}
-                self.sio.emit('message', pong_msg, room=sid)
+                self._emit(record, pong_msg)
                 logger.debug(f"Gateway: Sent pong response to {sid}")
             elif msg_type == "heartbeat":
                 logger.debug(f"Gateway: heartbeat from {sid}")
                 # Update heartbeat time
-                self.connection_heartbeats[sid] = time.time()
+                record.last_heartbeat = time.time()
                 # Send heartbeat acknowledgment
                 heartbeat_ack = {"type": "heartbeat_ack", "session": data.get("session", "unknown")}
-                self.sio.emit('message', heartbeat_ack, room=sid)
+                self._emit(record, heartbeat_ack)
                 logger.debug(f"Gateway: Sent heartbeat ack to {sid}")
             elif msg_type == "rpc.call":
-                logger.info(f"Gateway: RPC call from {sid}: {data}")
+                logger.info(f"Gateway: RPC call from {sid}: {loggable(data)}")
                 # 检查发送者是否是客户端
-                if self.connection_types.get(sid) == "client":
-                    self._forward_rpc_to_device(sid, data)
+                if record.kind == "client":
+                    record.rpc_calls += 1
+                    self._forward_rpc_to_device(record, data)
                 else:
                     logger.warning(f"Gateway: RPC call from non-client connection {sid}")
                     # 发送错误响应
@@ -178,38 +792,364 @@ class Gateway:
                         "id": data.get("id"),
                         "error": "Only clients can send RPC calls"
                     }
-                    self.sio.emit('message', response, room=sid)
+                    self._emit(record, response)
             elif msg_type == "rpc.result":
-                logger.info(f"Gateway: RPC result from {sid}: {data}")
-                req_id = data.get("id")
-                if req_id in self.pending:
-                    self.results[req_id] = data
-                    self.pending[req_id].set()
+                logger.info(f"Gateway: RPC result from {sid}: {loggable(data)}")
+                record.rpc_results += 1
+                self._deliver_result(data)
             elif msg_type == "rpc.error":
                 logger.warning(f"Gateway: RPC error from {sid}: {data}")
-                req_id = data.get("id")
-                if req_id in self.pending:
-                    self.results[req_id] = data
-                    self.pending[req_id].set()
+                record.rpc_errors += 1
+                self._deliver_result(data)
+            elif msg_type == "rpc.fanout":
+                if record.kind == "client":
+                    record.rpc_calls += 1
+                    self._fanout_from_client(record, data)
+                else:
+                    logger.warning(f"Gateway: Fanout from non-client connection {sid}")
+            elif msg_type == "stats":
+                self._emit(record, {"type": "stats", "stats": self.stats(detail=bool(data.get("detail")))})
+            elif msg_type == "subscribe":
+                self._subscribe(record, data)
+            elif msg_type == "unsubscribe":
+                self._unsubscribe(record, data)
+            elif msg_type == "event":
+                logger.debug(f"Gateway: Event from {sid}: {data}")
+                self._fanout_event(record, data)
+            elif msg_type == "batch":
+                # 设备重连后批量补发的离线消息，按顺序逐条处理
+                messages = data.get("messages") or []
+                logger.info(f"Gateway: Batch of {len(messages)} queued messages from {sid}")
+                for message in messages:
+                    if isinstance(message, dict) and message.get("type") != "batch":
+                        self.on_message(sid, message)
 
-    def on_rpc_result(self, sid, data):
+    def stats(self, detail: bool = False) -> dict:
+        """Registry counts, memory and in-flight work; `detail` adds per-connection records"""
+        stats = {
+            "registry": self.registry.stats(),
+            "memory": self.registry.memory_usage(),
+            "pending_calls": len(self.pending),
+            "forwarded_calls": len(self.forwarded),
+            "local_calls": len(self.local_calls),
+            "fanouts": len(self.fanouts),
+            "event_subscribers": len(self.event_subscribers),
+            "timeouts": self.timeouts.snapshot(),
+            "health": self.registry.health(),
+            "rejected": dict(self.rejected),
+            "loop_lag": self.loop_lag.to_dict(),
+            "payloads": self.payloads.stats(),
+        }
+        if detail:
+            stats["devices"] = [record.to_dict() for record in self.registry.devices.values()]
+            stats["clients"] = [record.to_dict() for record in self.registry.clients.values()]
+        return stats
+
+    def _emit(self, record: ConnectionRecord, message: dict):
+        """Send a message to one connection and count it"""
+        record.messages_out += 1
+        # 监控线程、REPL 和管理脚本也会调用，统一交给事件循环发送
+        self.loop_calls.submit(self._emit_on_loop, record.sid, message)
+
+    def _emit_on_loop(self, sid, message):
+        self.sio.emit('message', message, room=sid)
+
+    def _subscribe(self, record, data):
+        """Register (or replace) a client's event filter: kinds plus optional device ids"""
+        if record.kind != "client":
+            logger.warning(f"Gateway: Subscribe from non-client connection {record.sid}")
+            return
+        events = set(data.get("events") or [])
+        devices = data.get("devices")
+        logcat = None
+        if "logcat" in events:
+            # Clients asking for the same filter share one device-side stream
+            spec = data.get("logcat") or {}
+            error = logcat_spec_error(spec)
+            if error:
+                # 设备端编译失败会影响所有订阅者的过滤器，在这里直接拒绝
+                logger.warning(f"Gateway: Rejected subscription from {record.sid}: {error}")
+                self._emit(record, {"type": "subscribe.error", "error": error})
+                return
+            logcat = (hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12], spec)
+        record.subscription = {"events": events, "devices": set(devices) if devices else None, "logcat": logcat}
+        self.event_subscribers[record.sid] = record
+        logger.info(f"Gateway: {record.sid} subscribed to {sorted(events)} on {devices or 'all devices'}")
+        self._emit(record, {"type": "subscribed", "events": sorted(events), "devices": devices})
+        self._update_device_watches()
+
+    def _unsubscribe(self, record, data):
+        """Drop the given event kinds (or all of them) from a client's filter"""
+        subscription = record.subscription
+        if not subscription:
+            return
+        events = data.get("events")
+        if events:
+            subscription["events"] -= set(events)
+            if "logcat" not in subscription["events"]:
+                subscription["logcat"] = None
+        if not events or not subscription["events"]:
+            record.subscription = None
+            self.event_subscribers.pop(record.sid, None)
+        logger.info(f"Gateway: {record.sid} unsubscribed from {events or 'all events'}")
+        self._update_device_watches()
+
+    def _update_device_watches(self):
+        """Tell each device which event kinds and logcat filters have subscribers, only when they change"""
+        for device_id, device in self.registry.devices.items():
+            kinds = set()
+            logcat = {}
+            for subscriber in self.event_subscribers.values():
+                subscription = subscriber.subscription
+                if subscription["devices"] is None or device_id in subscription["devices"]:
+                    kinds |= subscription["events"]
+                    if subscription["logcat"]:
+                        key, spec = subscription["logcat"]
+                        logcat[key] = spec
+            kinds = frozenset(kinds)
+            if device.watch != kinds or device.logcat != frozenset(logcat):
+                device.watch = kinds
+                device.logcat = frozenset(logcat)
+                self._emit(device, {"type": "watch", "events": sorted(kinds), "logcat": logcat})
+
+    def _fanout_event(self, device, data):
+        """Forward a device event only to clients whose filter matches it"""
+        kind = data.get("kind")
+        event = {"type": "event", "device_id": device.id, "kind": kind, "ts": data.get("ts"), "data": data.get("data")}
+        for subscriber in list(self.event_subscribers.values()):
+            subscription = subscriber.subscription
+            if kind not in subscription["events"]:
+                continue
+            if subscription["devices"] is not None and device.id not in subscription["devices"]:
+                continue
+            if kind == "logcat" and (subscription["logcat"] or ("",))[0] != (event["data"] or {}).get("filter"):
+                continue
+            self._emit(subscriber, event)
+
+    def _deliver_result(self, data):
+        """Hand a device result to a local waiter or relay it to the client that sent the call"""
+        if self.recorder:
+            self.recorder.record_result(data)
         req_id = data.get("id")
-        logger.info(f"Gateway: RPC result from {sid}, req_id: {req_id}")
+        if req_id in self.probes:
+            self._finish_probe(req_id, ok=data.get("type") == "rpc.result")
+            return
+        if req_id in self.fanout_requests:
+            self._gather_fanout_result(req_id, data)
+            return
         if req_id in self.pending:
             self.results[req_id] = data
             self.pending[req_id].set()
+            return
+        local = self.local_calls.pop(req_id, None)
+        if local:
+            latency = time.time() - local.sent_at
+            self.timeouts.observe(local.method, latency, local.device_id)
+            self._record_outcome(local.device_id, data.get("type") == "rpc.result", latency)
+            local.sink(data)
+            return
+        call = self.forwarded.pop(req_id, None)
+        if call:
+            latency = time.time() - call.sent_at
+            self.timeouts.observe(call.method, latency, call.device_id)
+            # success=False 是业务结果（如找不到控件），只有 rpc.error 计为设备故障
+            self._record_outcome(call.device_id, data.get("type") == "rpc.result", latency)
+            call.client.forwarded.discard(req_id)
+            if call.transform and data.get("type") == "rpc.result":
+                self.sio.start_background_task(self._relay_transformed, call.client, data, call.transform)
+            else:
+                self._emit(call.client, data)
+
+    def _relay_transformed(self, client, data, transform):
+        """Apply a call's payload transform to its result, then relay it"""
+        try:
+            if self.payloads.workers:
+                # 截图、层级解析和压缩在工作进程中完成，tpool 线程等待结果时事件循环照常运行
+                data = tpool.execute(self.payloads.apply, data, transform)
+            else:
+                data = self.payloads.apply(data, transform)
+        except Exception as e:
+            # 例如共享内存分配失败：原样转发，不让客户端一直等待
+            logger.warning(f"Gateway: Transform of {data.get('id')} failed, relaying it unchanged: {e}")
+        self._emit(client, data)
+
+    def on_rpc_result(self, sid, data):
+        req_id = data.get("id")
+        logger.info(f"Gateway: RPC result from {sid}, req_id: {req_id}")
+        self._deliver_result(data)
 
     def on_rpc_error(self, sid, data):
         req_id = data.get("id")
         logger.warning(f"Gateway: RPC error from {sid}, req_id: {req_id}")
-        if req_id in self.pending:
-            self.results[req_id] = data
-            self.pending[req_id].set()
+        self._deliver_result(data)
+
+    def select_devices(self, tags=None, devices=None):
+        """Device ids matching an explicit id list and/or carrying all of `tags`"""
+        candidates = [d for d in devices if d in self.registry.devices] if devices else self.registry.devices
+        if not tags:
+            return list(candidates)
+        tags = set(tags)
+        return [device_id for device_id in candidates if tags <= self.registry.devices[device_id].tags]
+
+    def start_fanout(self, method: str, params: dict, sink, tags=None, devices=None,
+                     timeout: float = 30.0, fanout_id: str = None) -> str:
+        """Scatter one RPC call to every selected device in parallel.
+
+        `sink` receives each message of the stream: one "rpc.fanout.result" per
+        device as results arrive, then a final "rpc.fanout.done" summary either
+        when all devices answered or at the deadline (listing devices that did not).
+        """
+        fanout_id = fanout_id or str(uuid.uuid4())
+        targets = self.select_devices(tags, devices)
+        # 熔断中的设备不参与，在汇总中列为 skipped
+        skipped = [d for d in targets if not self.registry.devices[d].breaker.allow()]
+        if skipped:
+            targets = [d for d in targets if self.registry.devices[d].breaker.allow()]
+        self.fanouts[fanout_id] = {
+            "sink": sink,
+            "method": method,
+            "waiting": set(targets),
+            "succeeded": 0,
+            "failed": 0,
+            "started": time.time(),
+            "total": len(targets),
+            "skipped": skipped,
+        }
+        logger.info(f"Gateway: Fanout {fanout_id}: {method} to {len(targets)} devices")
+        for device_id in targets:
+            req_id = f"{fanout_id}:{device_id}"
+            self.fanout_requests[req_id] = (fanout_id, device_id)
+            message = {"type": "rpc.call", "id": req_id, "method": method, "params": params, "timeout": timeout}
+            if self.recorder:
+                self.recorder.record_call(message)
+            self._emit(self.registry.devices[device_id], message)
+
+        if targets:
+            self.sio.start_background_task(self._fanout_deadline, fanout_id, timeout)
+        else:
+            self._finish_fanout(fanout_id)
+        return fanout_id
+
+    def _gather_fanout_result(self, req_id, data):
+        fanout_id, device_id = self.fanout_requests.pop(req_id, (None, None))
+        fanout = self.fanouts.get(fanout_id)
+        if not fanout or device_id not in fanout["waiting"]:
+            return  # Arrived after the deadline
+        fanout["waiting"].discard(device_id)
+        latency = time.time() - fanout["started"]
+        self.timeouts.observe(fanout["method"], latency, device_id)
+        self._record_outcome(device_id, data.get("type") == "rpc.result", latency)
+        message = {"type": "rpc.fanout.result", "id": fanout_id, "device_id": device_id}
+        result = data.get("result")
+        if data.get("type") == "rpc.error" or (isinstance(result, dict) and result.get("success") is False):
+            fanout["failed"] += 1
+        else:
+            fanout["succeeded"] += 1
+        if data.get("type") == "rpc.error":
+            message["error"] = data.get("error")
+        else:
+            message["result"] = result
+        fanout["sink"](message)
+        if not fanout["waiting"]:
+            self._finish_fanout(fanout_id)
+
+    def _fanout_deadline(self, fanout_id, timeout):
+        self.sio.sleep(timeout)
+        if fanout_id in self.fanouts:
+            self._finish_fanout(fanout_id)
+
+    def _finish_fanout(self, fanout_id):
+        fanout = self.fanouts.pop(fanout_id, None)
+        if not fanout:
+            return
+        elapsed = time.time() - fanout["started"]
+        for device_id in fanout["waiting"]:
+            self.fanout_requests.pop(f"{fanout_id}:{device_id}", None)
+            self._record_outcome(device_id, False, elapsed)
+        summary = {
+            "type": "rpc.fanout.done",
+            "id": fanout_id,
+            "method": fanout["method"],
+            "total": fanout["total"],
+            "succeeded": fanout["succeeded"],
+            "failed": fanout["failed"],
+            "timed_out": sorted(fanout["waiting"]),
+            "skipped": fanout["skipped"],
+            "elapsed": round(elapsed, 3),
+        }
+        logger.info(f"Gateway: Fanout {fanout_id} done: {summary}")
+        fanout["sink"](summary)
+
+    def _fanout_from_client(self, client, data):
+        """Handle an rpc.fanout message, streaming results back to the client"""
+        self.start_fanout(
+            data.get("method"),
+            data.get("params") or {},
+            sink=lambda message: self._emit(client, message),
+            tags=data.get("tags"),
+            devices=data.get("devices"),
+            timeout=float(data.get("timeout") or 30.0),
+            fanout_id=data.get("id"),
+        )
+
+    def fanout(self, method: str, params: dict, tags=None, devices=None, timeout: float = 30.0,
+               on_result=None) -> dict:
+        """Blocking fanout for the REPL: calls `on_result` per device and returns the summary"""
+        done = threading.Event()
+        summary = {}
+
+        def sink(message):
+            if message["type"] == "rpc.fanout.done":
+                summary.update(message)
+                done.set()
+            elif on_result:
+                on_result(message)
+
+        # 在 REPL 线程中调用：在事件循环上启动（截止时间任务才会被调度），
+        # 同时自己等待截止时间；超时后同样交给事件循环汇总，避免与结果处理并发修改扇出状态
+        fanout_id = str(uuid.uuid4())
+        self.loop_calls.submit(self.start_fanout, method, params, sink, tags, devices, timeout, fanout_id)
+        if not done.wait(timeout + 1):
+            self.loop_calls.submit(self._finish_fanout, fanout_id)
+            if not done.wait(FANOUT_FINISH_WAIT):
+                logger.warning(f"Gateway: Fanout {fanout_id} not finished by the event loop, giving up")
+        return summary
+
+    def start_call(self, device_id: str, method: str, params: dict, sink, timeout: Optional[float] = None) -> str:
+        """Send one RPC call without waiting for it.
+
+        `sink` receives the device's rpc.result / rpc.error message, or an
+        rpc.error when the device is unknown, its circuit is open or the
+        deadline passes. Results arrive on the Socket.IO handlers, so any
+        number of calls can be in flight without a waiting thread each.
+        """
+        req_id = str(uuid.uuid4())
+        device = self.registry.devices.get(device_id)
+        if not device:
+            sink({"type": "rpc.error", "id": req_id, "error": f"device {device_id} not connected"})
+            return req_id
+        if not device.breaker.allow():
+            sink({"type": "rpc.error", "id": req_id, "error": f"circuit open for device {device_id}"})
+            return req_id
+        if timeout is None:
+            timeout = self.timeouts.timeout_for(method, device_id)
+        now = time.time()
+        message = {"type": "rpc.call", "id": req_id, "method": method, "params": params, "timeout": timeout}
+        self.local_calls[req_id] = LocalCall(sink, method, device_id, now)
+        with self.deadline_lock:
+            heapq.heappush(self.deadlines, (now + timeout, req_id))
+        if self.recorder:
+            self.recorder.record_call(message)
+        device.rpc_calls += 1
+        self._emit(device, message)
+        return req_id
 
-    def call(self, device_id: str, method: str, params: dict, timeout: float = 30.0):
-        sid = self.device_connections.get(device_id)
-        if not sid:
+    def call(self, device_id: str, method: str, params: dict, timeout: Optional[float] = None):
+        device = self.registry.devices.get(device_id)
+        if not device:
             raise RuntimeError(f"device {device_id} not connected")
+        if timeout is None:
+            timeout = self.timeouts.timeout_for(method, device_id)
         
         req_id = str(uuid.uuid4())
         event = threading.Event()
@@ -221,67 +1161,101 @@ class Gateway:
             "id": req_id,
             "method": method,
             "params": params,
+            "timeout": timeout,  # 设备端按剩余时间放弃执行
         }
-        self.sio.emit('rpc_call', message, room=sid)
+        if self.recorder:
+            self.recorder.record_call(message)
+        started = time.time()
+        self._emit(device, message)
         
         try:
             if event.wait(timeout):
                 result = self.results.pop(req_id, None)
                 if result:
+                    latency = time.time() - started
+                    self.timeouts.observe(method, latency, device_id)
+                    self._record_outcome(device_id, result.get("type") != "rpc.error", latency)
                     return result
                 else:
                     raise RuntimeError("No result received")
             else:
+                self.timeouts.observe(method, timeout, device_id)
+                self._record_outcome(device_id, False, timeout)
                 raise RuntimeError("RPC call timeout")
         finally:
             self.pending.pop(req_id, None)
 
-    def _determine_connection_type(self, sid, data):
+    def _determine_connection_type(self, record, data):
         """根据第一个消息判断连接类型"""
         if isinstance(data, dict):
             msg_type = data.get("type")
             if msg_type == "hello" and "device" in data:
                 # 这是手机设备连接
                 device_id = str(uuid.uuid4())
-                self.device_connections[device_id] = sid
-                self.connection_types[sid] = "device"
-                logger.info(f"Gateway: Device connection established: {device_id} (sid: {sid})")
+                record.tags = frozenset(data.get("tags") or ())
+                record.capabilities = frozenset(data.get("capabilities") or ())
+                record.breaker = CircuitBreaker()
+                self.registry.assign(record, "device", device_id)
+                logger.info(f"Gateway: Device connection established: {device_id} (sid: {record.sid})")
+                # 新设备按当前订阅启动事件监听
+                self._update_device_watches()
             else:
                 # 这是客户端连接
                 client_id = str(uuid.uuid4())
-                self.client_connections[client_id] = sid
-                self.connection_types[sid] = "client"
-                logger.info(f"Gateway: Client connection established: {client_id} (sid: {sid})")
+                self.registry.assign(record, "client", client_id)
+                logger.info(f"Gateway: Client connection established: {client_id} (sid: {record.sid})")
         
-        logger.info(f"Gateway: Total connections: {len(self.connection_types)}")
-        logger.info(f"Gateway: Devices: {len(self.device_connections)}, Clients: {len(self.client_connections)}")
+        logger.info(f"Gateway: Total connections: {len(self.registry)}")
+        logger.info(f"Gateway: Devices: {len(self.registry.devices)}, Clients: {len(self.registry.clients)}")
 
-    def _forward_rpc_to_device(self, client_sid, rpc_data):
+    def _forward_rpc_to_device(self, client, rpc_data):
         """将RPC调用从客户端转发到设备"""
         req_id = rpc_data.get("id")
         method = rpc_data.get("method")
         params = rpc_data.get("params", {})
         logger.info(f"Gateway: Forwarding RPC call {req_id}: {method}")
         
-        # 查找可用的设备连接
-        if self.device_connections:
-            # 选择第一个可用的设备
-            device_sid = list(self.device_connections.values())[0]
-            logger.info(f"Gateway: Forwarding RPC call to device {device_sid}")
-            self.sio.emit('message', rpc_data, room=device_sid)
+        # 查找可用的设备连接，跳过熔断中的设备
+        device = next((d for d in self.registry.devices.values() if d.breaker.allow()), None)
+        if device:
+            # 客户端给出的是剩余时间(秒)，没有则按该方法近期延迟自适应
+            now = time.time()
+            budget = rpc_data.get("timeout")
+            if budget is None:
+                budget = self.timeouts.timeout_for(method, device.id)
+            budget = float(budget)
+            if budget <= 0:
+                logger.warning(f"Gateway: RPC call {req_id} arrived after its deadline, not forwarding")
+                self._emit(client, {"type": "rpc.error", "id": req_id, "error": "Deadline exceeded"})
+                return
+            transform = rpc_data.get("transform")
+            rpc_data = {key: value for key, value in rpc_data.items() if key != "transform"}
+            rpc_data["timeout"] = round(budget, 3)
+            logger.info(f"Gateway: Forwarding RPC call to device {device.sid} (timeout {budget:.1f}s)")
+            self.forwarded[req_id] = ForwardedCall(client, method, device.id, now, now + budget, transform)
+            with self.deadline_lock:
+                heapq.heappush(self.deadlines, (now + budget, req_id))
+            if client.forwarded is None:
+                client.forwarded = set()
+            client.forwarded.add(req_id)
+            device.rpc_calls += 1
+            if self.recorder:
+                self.recorder.record_call(rpc_data)
+            self._emit(device, rpc_data)
         else:
-            # 没有设备连接，发送错误响应
+            # 没有设备连接（或全部熔断），发送错误响应
             logger.warning(f"Gateway: No device available for RPC call")
             response = {
                 "type": "rpc.error",
                 "id": req_id,
-                "error": "No device connected"
+                "error": "No healthy device available" if self.registry.devices else "No device connected"
             }
-            self.sio.emit('message', response, room=client_sid)
+            self._emit(client, response)
 
 
 def repl(gw: Gateway):
-    logger.info("Commands:\n  devices\n  use <deviceId>\n  call <method> <json_params>\n  quit")
+    logger.info("Commands:\n  devices\n  stats\n  use <deviceId>\n  call <method> <json_params>\n"
+                "  fanout <method> <json_params> [tag,...]\n  batch <script_file> [parallel]\n  quit")
     current = None
     while True:
         try:
@@ -294,8 +1268,11 @@ def repl(gw: Gateway):
         if line in ("quit", "exit"):
             break
         if line == "devices":
-            logger.info(f"Connected devices: {list(gw.device_connections.keys())}")
-            logger.info(f"Connected clients: {list(gw.client_connections.keys())}")
+            logger.info(f"Connected devices: {[(d, sorted(r.tags)) for d, r in gw.registry.devices.items()]}")
+            logger.info(f"Connected clients: {list(gw.registry.clients.keys())}")
+            continue
+        if line == "stats":
+            logger.info(f"Stats: {json.dumps(gw.stats(detail=True), indent=2)}")
             continue
         if line.startswith("use "):
             current = line.split(" ", 1)[1]
@@ -317,22 +1294,78 @@ def repl(gw: Gateway):
             except Exception as e:
                 logger.error("Error:", e)
             continue
+        if line.startswith("fanout "):
+            try:
+                _, method, rest = (line + " ").split(" ", 2)
+                params, end = json.JSONDecoder().raw_decode(rest.strip() or "{}")
+                tags = [t for t in rest.strip()[end:].strip().split(",") if t] or None
+            except Exception as e:
+                logger.error(f"Bad command: {e}")
+                continue
+            summary = gw.fanout(method, params, tags=tags,
+                                on_result=lambda m: logger.info(f"  {m['device_id']}: {m.get('result', m.get('error'))}"))
+            logger.info(f"Fanout summary: {summary}")
+            continue
+        if line.startswith("batch "):
+            parts = line.split()
+            try:
+                parallel = int(parts[2]) if len(parts) > 2 else DEFAULT_PARALLEL
+                with open(parts[1], encoding="utf-8") as script:
+                    summary = AdminBatch(gw, parallel).run(script)
+            except (OSError, ValueError) as e:
+                logger.error(f"Bad command: {e}")
+                continue
+            logger.info(format_summary(summary))
+            continue
         logger.warning("Unknown command")
 
 
+def wait_for_devices(gw: Gateway, count: int, timeout: float) -> int:
+    """Wait until `count` devices are connected or `timeout` passes; returns the number connected"""
+    deadline = time.time() + timeout
+    while len(gw.registry.devices) < count and time.time() < deadline:
+        time.sleep(0.5)
+    return len(gw.registry.devices)
+
+
+def run_script(gw: Gateway, path: str, parallel: int, wait_devices: int, wait_timeout: float, done: threading.Event):
+    """Run an admin script once devices have attached; `path` "-" reads stdin"""
+    try:
+        if wait_devices:
+            connected = wait_for_devices(gw, wait_devices, wait_timeout)
+            logger.info(f"Gateway: {connected} devices connected, running {path}")
+        script = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        try:
+            summary = AdminBatch(gw, parallel).run(script)
+        finally:
+            if script is not sys.stdin:
+                script.close()
+        logger.info(format_summary(summary))
+    except Exception as e:
+        logger.error(f"Gateway: Admin script failed: {e}")
+    finally:
+        done.set()
+
+
 def main():
-    import sys
-    import os
-    
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Reverse-connection MCP gateway")
+    parser.add_argument("--script", help="admin script to run, - for stdin; the gateway exits when it is done")
+    parser.add_argument("--parallel", type=int, default=DEFAULT_PARALLEL, help="admin script calls in flight")
+    parser.add_argument("--wait-devices", type=int, default=1, help="devices to wait for before the script")
+    parser.add_argument("--wait-timeout", type=float, default=60.0, help="seconds to wait for them")
+    args = parser.parse_args()
+
     logger.info("Gateway: Starting main function...")
     
     try:
         logger.info("Gateway: Creating Gateway instance...")
         gw = Gateway()
         logger.info("Gateway: Gateway instance created successfully")
-        logger.info(f"Gateway: Device connections: {len(gw.device_connections)}")
-        logger.info(f"Gateway: Client connections: {len(gw.client_connections)}")
-        logger.info(f"Gateway: Total connections: {len(gw.connection_types)}")
+        logger.info(f"Gateway: Device connections: {len(gw.registry.devices)}")
+        logger.info(f"Gateway: Client connections: {len(gw.registry.clients)}")
+        logger.info(f"Gateway: Total connections: {len(gw.registry)}")
         logger.info(f"Gateway: Socket.IO server: {gw.sio}")
         logger.info(f"Gateway: WSGI app: {gw.app}")
     except Exception as e:
@@ -364,12 +1397,23 @@ def main():
         traceback.print_exc()
         return
     
+    # 脚本在普通线程里等待结果，事件循环继续处理设备消息
+    script_done = threading.Event()
+    if args.script:
+        threading.Thread(target=run_script, daemon=True,
+                         args=(gw, args.script, args.parallel, args.wait_devices, args.wait_timeout,
+                               script_done)).start()
+
     # Keep server running
     try:
-        while True:
+        while not script_done.is_set():
             eventlet.sleep(1)
     except KeyboardInterrupt:
         pass
+    finally:
+        gw.payloads.close()
+        if gw.recorder:
+            gw.recorder.close()
 
 
 if __name__ == "__main__":
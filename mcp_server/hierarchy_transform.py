@@ -0,0 +1,146 @@
+"""
+Compact hierarchy rendering for the gateway's {"hierarchy": "compact"} transform.
+
+A host-side copy of the renderer in app/src/main/python/compact_hierarchy.py
+(the bridge's dump_hierarchy / observe use that one), so the gateway's
+worker processes do not import device sources. Keep the two in step: the
+same dump must give the same lines and node ids on either side.
+"""
+
+import re
+import hashlib
+import xml.etree.ElementTree as ET
+
+# Output, one line per kept node, indented one space per level:
+#   <id> <Class> "text" ~"content-desc" #resource-name [flags] @cx,cy
+# flags: c clickable, l long-clickable, s scrollable, k checkable (K checked),
+#        e editable, f focused, S selected, x disabled
+_BOUNDS_RE = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+MAX_TEXT = 80  # longer text is cut, the agent can dump the XML if it needs all of it
+ID_CHARS = 4
+
+
+def _bounds(node):
+    match = _BOUNDS_RE.match(node.get("bounds", ""))
+    return tuple(int(v) for v in match.groups()) if match else None
+
+
+def _flags(node) -> str:
+    flags = ""
+    if node.get("clickable") == "true":
+        flags += "c"
+    if node.get("long-clickable") == "true":
+        flags += "l"
+    if node.get("scrollable") == "true":
+        flags += "s"
+    if node.get("checkable") == "true":
+        flags += "K" if node.get("checked") == "true" else "k"
+    if "EditText" in node.get("class", ""):
+        flags += "e"
+    if node.get("focused") == "true":
+        flags += "f"
+    if node.get("selected") == "true":
+        flags += "S"
+    if node.get("enabled") == "false":
+        flags += "x"
+    return flags
+
+
+def _quote(text: str) -> str:
+    text = " ".join(text.split())
+    if len(text) > MAX_TEXT:
+        text = text[:MAX_TEXT - 1] + "…"
+    return '"' + text.replace('"', '\\"') + '"'
+
+
+class CompactHierarchy:
+    """Prunes a uiautomator XML dump into the line format above.
+
+    Invisible and zero-size nodes are dropped with their subtrees. Nodes with
+    no text, description, resource id or interaction flags are layout only:
+    they are not printed and their children move up a level, which also
+    collapses single-child layout chains.
+
+    Node ids hash the node's path from the root, where each step is the
+    class and resource id plus the ordinal among siblings with that same
+    class and resource id. Adding or removing a different kind of sibling
+    leaves an element's id alone, so it keeps its id across dumps of the
+    same screen. An id is the shortest prefix of at least ID_CHARS hex
+    digits that no other node's hash shares, which does not depend on the
+    order nodes are visited in.
+    """
+
+    def __init__(self, xml: str):
+        self.root = ET.fromstring(xml.encode("utf-8") if isinstance(xml, str) else xml)
+        self.entries = []  # (depth, path hash, rest of the line) per kept node
+        self.total = sum(1 for _ in self.root.iter("node"))
+        self.kept = 0
+
+    def render(self) -> str:
+        lines = []
+        packages = {node.get("package") for node in self.root.iter("node") if node.get("package")}
+        if len(packages) == 1:
+            lines.append(f"# {packages.pop()}")
+        self._visit_children(self.root, "", 0)
+        ids = _unique_prefixes([digest for _, digest, _ in self.entries])
+        for (depth, digest, rest), node_id in zip(self.entries, ids):
+            lines.append(" " * depth + node_id + " " + rest)
+        return "\n".join(lines)
+
+    def _visit_children(self, parent, path: str, depth: int):
+        seen = {}
+        for child in parent:
+            key = (child.get("class", ""), child.get("resource-id") or "")
+            ordinal = seen[key] = seen.get(key, -1) + 1
+            self._visit(child, f"{path}/{key[0]}#{key[1]}[{ordinal}]", depth)
+
+    def _visit(self, node, path: str, depth: int):
+        if node.get("visible-to-user") == "false":
+            return
+        bounds = _bounds(node)
+        if bounds is not None and (bounds[2] <= bounds[0] or bounds[3] <= bounds[1]):
+            return
+        cls = node.get("class", "").rsplit(".", 1)[-1]
+        text = node.get("text") or ""
+        desc = node.get("content-desc") or ""
+        resource_id = node.get("resource-id") or ""
+        flags = _flags(node)
+        interactive = any(flag in flags for flag in "clskKe")
+
+        child_depth = depth
+        if text or desc or resource_id or interactive:
+            self.kept += 1
+            parts = [cls]
+            if text:
+                parts.append(_quote(text))
+            if desc:
+                parts.append("~" + _quote(desc))
+            if resource_id:
+                parts.append("#" + resource_id.rsplit("/", 1)[-1])
+            if flags:
+                parts.append(f"[{flags}]")
+            if bounds is not None:
+                parts.append(f"@{(bounds[0] + bounds[2]) // 2},{(bounds[1] + bounds[3]) // 2}")
+            digest = hashlib.sha1(path.encode("utf-8")).hexdigest()
+            self.entries.append((depth, digest, " ".join(parts)))
+            child_depth = depth + 1
+        self._visit_children(node, path, child_depth)
+
+
+def _unique_prefixes(digests: list) -> list:
+    """Shortest prefix (at least ID_CHARS) of each digest that no other digest starts with"""
+    ordered = sorted(set(digests))
+    length = {}
+    for i, digest in enumerate(ordered):
+        shared = 0
+        for neighbour in ordered[max(i - 1, 0):i] + ordered[i + 1:i + 2]:
+            common = 0
+            while common < len(digest) and digest[common] == neighbour[common]:
+                common += 1
+            shared = max(shared, common)
+        length[digest] = max(ID_CHARS, shared + 1)
+    return [digest[:length[digest]] for digest in digests]
+
+
+def compact_hierarchy(xml: str) -> str:
+    return CompactHierarchy(xml).render()
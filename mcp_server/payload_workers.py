@@ -0,0 +1,230 @@
+"""
+CPU-heavy payload transforms for the gateway, run in a process pool.
+
+A client can ask the gateway to transform a device result before it is
+relayed, by adding "transform" to its rpc.call:
+
+  {"image": {"max_width": 720, "format": "JPEG", "quality": 80}}
+      re-encode image bytes (e.g. observe screenshots), downscaled to max_width
+  {"hierarchy": "compact"}
+      turn uiautomator XML strings into the compact one-line-per-node form
+  {"compress": true}
+      zlib-compress other payloads of COMPRESS_MIN bytes or more into
+      {"zlib": <bytes>, "size": <original bytes>, "text": <was a str>}
+
+Decoding, resizing, parsing and compressing would stall every connection
+if done on the gateway's event loop, so each payload becomes a job for a
+worker process. Payloads of SHM_THRESHOLD bytes or more are copied once
+into a shared memory block that the worker reads in place, instead of being
+pickled through the pool's pipe (a copy on each side plus the pipe).
+"""
+
+import io
+import os
+import zlib
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get("GATEWAY_WORKERS", str(min(4, os.cpu_count() or 1))))  # 0: run on the event loop
+SHM_THRESHOLD = int(os.environ.get("GATEWAY_SHM_THRESHOLD", str(64 * 1024)))
+COMPRESS_MIN = 4096
+IMAGE_FORMATS = ("JPEG", "PNG", "WEBP")
+
+
+def _is_image(data) -> bool:
+    head = bytes(data[:12])
+    return head.startswith(b"\xff\xd8") or head.startswith(b"\x89PNG") or head[8:12] == b"WEBP"
+
+
+def _is_hierarchy(text: str) -> bool:
+    return text.startswith("<?xml") or text.startswith("<hierarchy")
+
+
+def _image(view, options: dict) -> bytes:
+    from PIL import Image
+    image = Image.open(io.BytesIO(view))
+    max_width = options.get("max_width")
+    if max_width and image.width > max_width:
+        image = image.resize((int(max_width), round(image.height * max_width / image.width)), Image.BILINEAR)
+    fmt = str(options.get("format") or "JPEG").upper()
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format: {fmt}, available: {list(IMAGE_FORMATS)}")
+    if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    out = io.BytesIO()
+    image.save(out, fmt, quality=int(options.get("quality") or 80))
+    return out.getvalue()
+
+
+def _hierarchy(view, options) -> str:
+    from hierarchy_transform import compact_hierarchy
+    return compact_hierarchy(str(view, "utf-8"))
+
+
+def _compress(view, options) -> bytes:
+    return zlib.compress(view, 6)
+
+
+OPS = {"image": _image, "hierarchy": _hierarchy, "compress": _compress}
+
+
+def run_job(op: str, options, payload):
+    """Worker entry point: `payload` is bytes, or ("shm", name, size) for a shared memory block"""
+    started = time.perf_counter()
+    if isinstance(payload, tuple):
+        shm = SharedMemory(payload[1])
+        view = shm.buf[:payload[2]]
+        try:
+            out = OPS[op](view, options)
+        finally:
+            view.release()  # the block cannot be closed while a view is exported
+            shm.close()
+    else:
+        out = OPS[op](payload, options)
+    return out, time.perf_counter() - started
+
+
+class PayloadWorkers:
+    """Applies a call's transform to the payloads in its result.
+
+    apply() blocks until every payload job finished: the gateway calls it
+    from a thread (eventlet tpool) so its event loop keeps running, or
+    inline on the loop when there are no workers. The pool is created on
+    the first job. Payloads whose job fails are relayed unchanged.
+    """
+
+    def __init__(self, workers: int = WORKERS, shm_threshold: int = SHM_THRESHOLD):
+        self.workers = workers
+        self.shm_threshold = shm_threshold
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.lock = threading.Lock()
+        self.counts: Dict[str, int] = {op: 0 for op in OPS}
+        self.errors = 0
+        self.shm_jobs = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.worker_seconds = 0.0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.pool is None:
+                # spawn, not fork: the gateway process runs threads and an eventlet hub
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+                logger.info(f"Gateway: Started {self.workers} payload workers")
+            return self.pool
+
+    @staticmethod
+    def _jobs(value, spec: dict, jobs: list):
+        """Collect (container, key, op, options) for every payload the transform applies to"""
+        items = value.items() if isinstance(value, dict) else enumerate(value) if isinstance(value, list) else ()
+        for key, item in items:
+            if isinstance(item, (bytes, bytearray)):
+                if spec.get("image") and _is_image(item):
+                    jobs.append((value, key, "image", spec["image"]))
+                elif spec.get("compress") and len(item) >= COMPRESS_MIN:
+                    jobs.append((value, key, "compress", None))
+            elif isinstance(item, str):
+                if spec.get("hierarchy") == "compact" and _is_hierarchy(item):
+                    jobs.append((value, key, "hierarchy", None))
+                elif spec.get("compress") and len(item) >= COMPRESS_MIN:
+                    jobs.append((value, key, "compress", None))
+            else:
+                PayloadWorkers._jobs(item, spec, jobs)
+
+    def apply(self, message: dict, spec: dict) -> dict:
+        """The message with its payloads transformed in place"""
+        jobs = []
+        if isinstance(spec, dict):
+            self._jobs(message.get("result"), spec, jobs)
+        # Submit every payload first so the workers process them in parallel
+        started = []
+        try:
+            for job in jobs:
+                started.append(self._start(job))
+        except BaseException:
+            # e.g. SharedMemory(create=True) failed: release the blocks already handed out
+            for _, _, future, shm in started:
+                if future is not None:
+                    future.cancel()
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+            raise
+        for (container, key, op, options), data, future, shm in started:
+            try:
+                out, elapsed = future.result() if future is not None else run_job(op, options, data)
+                error = None
+            except Exception as e:
+                out, elapsed, error = None, 0.0, e
+            finally:
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+            with self.lock:
+                self.counts[op] += 1
+                self.worker_seconds += elapsed
+                if error is None:
+                    self.bytes_in += len(data)
+                    self.bytes_out += len(out)
+                else:
+                    self.errors += 1
+            if error is not None:
+                logger.warning(f"Gateway: {op} transform of {message.get('id')} failed: {error}")
+            elif op == "compress":
+                container[key] = {"zlib": out, "size": len(data), "text": isinstance(container[key], str)}
+            else:
+                container[key] = out
+        return message
+
+    def _start(self, job) -> tuple:
+        """(job, payload bytes, future or None to run inline, shared memory block or None)"""
+        container, key, op, options = job
+        data = container[key]
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if not self.workers:
+            return job, data, None, None
+        shm = None
+        if len(data) >= self.shm_threshold:
+            shm = SharedMemory(create=True, size=len(data))
+            try:
+                shm.buf[:len(data)] = data
+            except BaseException:
+                shm.close()
+                shm.unlink()
+                raise
+            payload = ("shm", shm.name, len(data))
+            with self.lock:
+                self.shm_jobs += 1
+        else:
+            payload = bytes(data)
+        try:
+            future = self._pool().submit(run_job, op, options, payload)
+        except Exception as e:  # pool shut down or broken
+            future = Future()
+            future.set_exception(e)
+        return job, data, future, shm
+
+    def stats(self) -> dict:
+        with self.lock:
+            jobs = sum(self.counts.values())
+            return {
+                "workers": self.workers,
+                "jobs": dict(self.counts),
+                "errors": self.errors,
+                "shm_jobs": self.shm_jobs,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "avg_job_ms": round(self.worker_seconds / jobs * 1000, 2) if jobs else 0.0,
+            }
+
+    def close(self, wait: bool = False):
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait, cancel_futures=True)
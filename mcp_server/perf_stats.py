@@ -0,0 +1,100 @@
+"""
+Aggregates `perf` events from the devices' app performance samplers.
+
+A device sends columns of samples (ts_ms, pid, cpu_ticks, pss_kb, frames,
+janky, frame_p90_ms), each delta-encoded: first value absolute, then
+differences. Decoded rows are kept per (device, package) in a bounded window
+and summarized into percentiles on request.
+"""
+
+import math
+from collections import deque
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+
+MAX_SAMPLES = 3600  # per device and package, one hour at 1s
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile, 0.0 for no values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _distribution(values: List[float]) -> dict:
+    return {
+        "p50": round(percentile(values, 50), 2),
+        "p90": round(percentile(values, 90), 2),
+        "p99": round(percentile(values, 99), 2),
+        "max": round(max(values), 2) if values else 0.0,
+    }
+
+
+class PerfAggregator:
+    """Time series per (device_id, package) built from perf event batches"""
+
+    def __init__(self, max_samples: int = MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.series: Dict[Tuple[str, str], deque] = {}
+        self.clk_tck: Dict[Tuple[str, str], int] = {}
+        self.missed: Dict[Tuple[str, str], int] = {}
+
+    def add(self, device_id: str, data: dict):
+        """Decode one batch and append its rows"""
+        key = (device_id, data.get("package"))
+        fields = data.get("fields") or []
+        columns = data.get("columns") or []
+        if data.get("encoding") == "delta":
+            columns = [list(accumulate(column)) for column in columns]
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = deque(maxlen=self.max_samples)
+        for row in zip(*columns):
+            series.append(dict(zip(fields, row)))
+        self.clk_tck[key] = data.get("clk_tck") or 100
+        self.missed[key] = self.missed.get(key, 0) + (data.get("missed") or 0)
+
+    def packages(self) -> List[dict]:
+        return [{"device_id": device_id, "package": package, "samples": len(series)}
+                for (device_id, package), series in self.series.items()]
+
+    def summary(self, package: str, device_id: Optional[str] = None) -> dict:
+        """Percentiles over the kept window for a package (on one device, or the first that has it)"""
+        keys = [key for key in self.series if key[1] == package and (device_id is None or key[0] == device_id)]
+        if not keys:
+            return {"package": package, "device_id": device_id, "samples": 0}
+        key = keys[0]
+        rows = list(self.series[key])
+        clk_tck = self.clk_tck[key]
+
+        cpu = []
+        for prev, row in zip(rows, rows[1:]):
+            elapsed = (row["ts_ms"] - prev["ts_ms"]) / 1000.0
+            # A new pid means the app restarted and its tick counter did too
+            if elapsed > 0 and row["pid"] == prev["pid"]:
+                cpu.append((row["cpu_ticks"] - prev["cpu_ticks"]) / clk_tck / elapsed * 100.0)
+        frames = sum(row["frames"] for row in rows)
+        janky = sum(row["janky"] for row in rows)
+        return {
+            "package": package,
+            "device_id": key[0],
+            "samples": len(rows),
+            "missed": self.missed.get(key, 0),
+            "duration_s": round((rows[-1]["ts_ms"] - rows[0]["ts_ms"]) / 1000.0, 1),
+            "restarts": sum(1 for prev, row in zip(rows, rows[1:]) if row["pid"] != prev["pid"]),
+            "cpu_percent": _distribution(cpu),
+            "pss_kb": _distribution([row["pss_kb"] for row in rows]),
+            "frames": frames,
+            "janky_frames": janky,
+            "jank_percent": round(janky * 100.0 / frames, 2) if frames else 0.0,
+            "frame_p90_ms": _distribution([row["frame_p90_ms"] for row in rows if row["frames"]]),
+        }
+
+    def forget(self, package: str, device_id: Optional[str] = None):
+        for key in [key for key in self.series if key[1] == package and (device_id is None or key[0] == device_id)]:
+            self.series.pop(key, None)
+            self.clk_tck.pop(key, None)
+            self.missed.pop(key, None)
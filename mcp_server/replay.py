@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Replay rpc traffic captured by gateway_stub (GATEWAY_RECORD_FILE) against a gateway.
+
+By default a local gateway with simulated phones is started (see bench_harness.py);
+pass --url to drive an already running gateway build instead.
+
+Examples:
+  python3 replay.py traffic.log                  # original pacing (1x)
+  python3 replay.py traffic.log --speed 10       # 10x faster
+  python3 replay.py traffic.log --speed max --concurrency 128
+  python3 replay.py traffic.log --url http://127.0.0.1:8765
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import defaultdict
+from typing import List, Optional, Tuple
+
+from bench_harness import start_gateway, start_fake_bridges, wait_for_devices, stop_bridges, quiet, percentile
+from gateway_stub import TOKEN
+from uiautomator_mcp_server import GatewayConnectionPool
+
+
+# Calls that only make sense inside the device-side transfer session they were recorded in:
+# replayed chunks would carry random bytes for the recorded CRC and offsets and all fail
+NON_REPLAYABLE_METHODS = ("push_file", "pull_file", "install_apk")
+_BYTES_PLACEHOLDER = re.compile(r"^<(\d+) bytes>$")  # how older captures recorded binary params
+
+
+def synthesize_bytes(value):
+    """Recorded params with each binary placeholder replaced by random bytes of the recorded length"""
+    if isinstance(value, dict):
+        if len(value) == 1 and isinstance(value.get("__bytes__"), int):
+            return os.urandom(value["__bytes__"])
+        return {key: synthesize_bytes(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [synthesize_bytes(item) for item in value]
+    if isinstance(value, str):
+        match = _BYTES_PLACEHOLDER.match(value)
+        if match:
+            return os.urandom(int(match.group(1)))
+    return value
+
+
+class RecordedCall:
+    __slots__ = ("ts", "id", "method", "params", "latency", "success")
+
+    def __init__(self, ts: float, req_id: str, method: str, params: dict):
+        self.ts = ts
+        self.id = req_id
+        self.method = method
+        self.params = params
+        self.latency: Optional[float] = None
+        self.success: Optional[bool] = None
+
+
+def load_traffic(path: str) -> Tuple[List[RecordedCall], dict]:
+    """Parse a capture file into calls (in send order) with their recorded latency.
+
+    Calls to NON_REPLAYABLE_METHODS are left out; the second value counts
+    them per method.
+    """
+    calls = {}
+    skipped = defaultdict(int)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Truncated last line of a live capture
+            ts, kind, req_id = record[0], record[1], record[2]
+            if kind == "c":
+                if record[3] in NON_REPLAYABLE_METHODS:
+                    skipped[record[3]] += 1
+                    continue
+                calls[req_id] = RecordedCall(ts, req_id, record[3], synthesize_bytes(record[4]))
+            elif req_id in calls and calls[req_id].latency is None:
+                call = calls[req_id]
+                call.latency = ts - call.ts
+                call.success = kind == "r" and record[3]
+    return sorted(calls.values(), key=lambda call: call.ts), dict(skipped)
+
+
+async def replay(calls: List[RecordedCall], url: str, token: str, speed: Optional[float],
+                 concurrency: int, pool_size: int) -> List[dict]:
+    """Send every call, paced by the recorded timestamps divided by `speed`
+    (or as fast as `concurrency` allows when speed is None)."""
+    pool = GatewayConnectionPool(url, token, pool_size)
+    await pool.start()
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    outcomes = []
+    t0 = calls[0].ts if calls else 0.0
+
+    async def send(index: int, call: RecordedCall):
+        rpc_data = {
+            "type": "rpc.call",
+            "id": f"replay-{index}-{call.id}",
+            "method": call.method,
+            "params": call.params,
+        }
+        start = time.perf_counter()
+        try:
+            response = await pool.call(rpc_data)
+            result = response.get("result") or {}
+            success = response.get("type") == "rpc.result" and result.get("success", True)
+        except Exception:
+            success = False
+        outcomes.append({
+            "method": call.method,
+            "recorded_latency": call.latency,
+            "latency": time.perf_counter() - start,
+            "success": success,
+        })
+
+    async def paced(index: int, call: RecordedCall, started: float):
+        delay = started + (call.ts - t0) / speed - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await send(index, call)
+
+    async def limited(index: int, call: RecordedCall):
+        async with semaphore:
+            await send(index, call)
+
+    try:
+        started = loop.time()
+        if speed is None:
+            await asyncio.gather(*(limited(i, call) for i, call in enumerate(calls)))
+        else:
+            await asyncio.gather(*(paced(i, call, started) for i, call in enumerate(calls)))
+    finally:
+        await pool.close()
+    return outcomes
+
+
+def summarize(outcomes: List[dict], elapsed: float) -> dict:
+    by_method = defaultdict(list)
+    for outcome in outcomes:
+        by_method[outcome["method"]].append(outcome)
+
+    methods = {}
+    for method, items in sorted(by_method.items()):
+        recorded = [o["recorded_latency"] for o in items if o["recorded_latency"] is not None]
+        replayed = [o["latency"] for o in items]
+        methods[method] = {
+            "calls": len(items),
+            "errors": sum(1 for o in items if not o["success"]),
+            "recorded_p50_ms": percentile(recorded, 50) * 1000,
+            "recorded_p99_ms": percentile(recorded, 99) * 1000,
+            "replay_p50_ms": percentile(replayed, 50) * 1000,
+            "replay_p99_ms": percentile(replayed, 99) * 1000,
+        }
+    return {
+        "calls": len(outcomes),
+        "errors": sum(1 for o in outcomes if not o["success"]),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(outcomes) / elapsed if elapsed else 0.0,
+        "methods": methods,
+    }
+
+
+def print_summary(summary: dict):
+    print(f"Replayed {summary['calls']} calls in {summary['elapsed_s']:.2f}s "
+          f"({summary['throughput_rps']:.1f} rps), {summary['errors']} errors")
+    header = (f"{'method':<20}{'calls':>7}{'err':>5}{'rec p50':>10}{'new p50':>10}{'Δp50':>9}"
+              f"{'rec p99':>10}{'new p99':>10}{'Δp99':>9}")
+    print(header)
+    print("-" * len(header))
+
+    def delta(new, old):
+        return f"{(new / old - 1) * 100:+.1f}%" if old else "n/a"
+
+    for method, m in summary["methods"].items():
+        print(f"{method:<20}{m['calls']:>7}{m['errors']:>5}"
+              f"{m['recorded_p50_ms']:>10.2f}{m['replay_p50_ms']:>10.2f}{delta(m['replay_p50_ms'], m['recorded_p50_ms']):>9}"
+              f"{m['recorded_p99_ms']:>10.2f}{m['replay_p99_ms']:>10.2f}{delta(m['replay_p99_ms'], m['recorded_p99_ms']):>9}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log", help="capture file written by gateway_stub (GATEWAY_RECORD_FILE)")
+    parser.add_argument("--url", help="target gateway; default starts a local gateway with simulated phones")
+    parser.add_argument("--token", default=TOKEN)
+    parser.add_argument("--speed", default="1", help="pacing multiplier (1, 10, ...) or 'max'")
+    parser.add_argument("--concurrency", type=int, default=64, help="in-flight limit for --speed max")
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--devices", type=int, default=2, help="simulated phones for the local gateway")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated phone latency per call (s)")
+    parser.add_argument("--json", help="write the summary to this file")
+    args = parser.parse_args(argv)
+    if args.speed == "max":
+        args.speed = None
+    else:
+        args.speed = float(args.speed)
+        if args.speed <= 0:
+            parser.error("--speed must be positive or 'max'")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    calls, skipped = load_traffic(args.log)
+    if skipped:
+        print(f"Skipped non-replayable calls: "
+              f"{', '.join(f'{method} x{count}' for method, count in sorted(skipped.items()))}")
+    if not calls:
+        print(f"No rpc.call records in {args.log}")
+        return 1
+
+    with quiet():
+        bridges = []
+        url = args.url
+        if not url:
+            gw, url = start_gateway(token=args.token)
+            bridges = start_fake_bridges(url, args.devices, args.latency, token=args.token)
+            wait_for_devices(gw, args.devices)
+        try:
+            started = time.perf_counter()
+            outcomes = asyncio.run(replay(calls, url, args.token, args.speed, args.concurrency, args.pool_size))
+            elapsed = time.perf_counter() - started
+        finally:
+            stop_bridges(bridges)
+
+    summary = summarize(outcomes, elapsed)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Host side of the bridge's chunked file transfer (push_file / pull_file RPCs).
+
+Files move in CHUNK_SIZE binary chunks, one rpc.call each, with a CRC32 per
+chunk and a SHA-256 over the whole file. Both directions resume after a
+dropped connection: pushes continue from the offset the device reports,
+pulls from the size of the local .part file. The device skips a push when it
+already has the content.
+
+Chunks are sent stop-and-wait (one in flight per transfer), so a transfer
+never holds more than one chunk's worth of bytes in front of interactive
+calls on a gateway connection.
+"""
+
+import os
+import zlib
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from transfer_common import CHUNK_SIZE, file_sha256
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_RETRIES = 5  # reconnect/resume attempts per transfer
+
+# send_rpc_call(method, params) -> result dict
+RpcCall = Callable[[str, dict], Awaitable[dict]]
+
+
+async def _with_resume(name: str, attempt: Callable[[], Awaitable[dict]]) -> dict:
+    """Run one transfer attempt, starting over (which resumes) on RPC/connection errors"""
+    retries = 0
+    while True:
+        try:
+            return await attempt()
+        except (RuntimeError, ConnectionError) as e:
+            retries += 1
+            if retries > TRANSFER_RETRIES:
+                raise
+            delay = min(2 ** retries, 10)
+            logger.warning(f"{name} interrupted ({e}), resuming in {delay}s")
+            await asyncio.sleep(delay)
+
+
+async def push_file(call: RpcCall, local_path: str, remote_path: Optional[str] = None,
+                    chunk_size: int = CHUNK_SIZE) -> dict:
+    """Upload a file; without `remote_path` it stays in the bridge's transfer store"""
+    size = os.path.getsize(local_path)
+    sha256 = await asyncio.to_thread(file_sha256, local_path)
+
+    async def attempt() -> dict:
+        begin = await call("push_file", {"op": "begin", "sha256": sha256, "size": size, "path": remote_path})
+        if not begin.get("success"):
+            raise RuntimeError(begin.get("error", "push_file begin failed"))
+        if begin.get("skipped"):
+            return {"success": True, "skipped": True, "path": begin.get("path"), "sha256": sha256, "size": size}
+        offset = begin["offset"]
+        sent = 0
+        rejected = 0
+        with open(local_path, "rb") as f:
+            while offset < size:
+                f.seek(offset)
+                data = f.read(chunk_size)
+                result = await call("push_file", {
+                    "op": "chunk", "sha256": sha256, "offset": offset, "data": data, "crc32": zlib.crc32(data),
+                })
+                if result.get("success"):
+                    sent += len(data)
+                    rejected = 0
+                elif "offset" not in result or rejected >= 3:
+                    raise RuntimeError(result.get("error", "push_file chunk failed"))
+                else:
+                    rejected += 1
+                # On a mismatch the device reports where it actually is; continue from there
+                offset = result["offset"]
+        end = await call("push_file", {"op": "end", "sha256": sha256, "path": remote_path})
+        if not end.get("success"):
+            raise RuntimeError(end.get("error", "push_file end failed"))
+        return dict(end, skipped=False, sent=sent)
+
+    return await _with_resume(f"Push of {local_path}", attempt)
+
+
+async def pull_file(call: RpcCall, remote_path: str, local_path: str, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Download a device file to `local_path` (via `local_path`.part until verified)"""
+    part = local_path + ".part"
+
+    async def attempt() -> dict:
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        begin = await call("pull_file", {"op": "begin", "path": remote_path, "resume": offset > 0})
+        if not begin.get("success"):
+            raise RuntimeError(begin.get("error", "pull_file begin failed"))
+        size, sha256 = begin["size"], begin["sha256"]
+        if offset > size:
+            offset = 0
+        with open(part, "r+b" if offset else "wb") as f:
+            f.truncate(offset)
+            f.seek(offset)
+            bad_chunks = 0
+            while offset < size:
+                result = await call("pull_file", {"op": "chunk", "path": remote_path, "offset": offset,
+                                                  "length": chunk_size})
+                if not result.get("success"):
+                    raise RuntimeError(result.get("error", "pull_file chunk failed"))
+                data = result.get("data") or b""
+                if zlib.crc32(data) != result.get("crc32") or result.get("offset") != offset:
+                    bad_chunks += 1
+                    if bad_chunks > 3:
+                        raise RuntimeError(f"repeated bad chunks at {offset} of {remote_path}")
+                    logger.warning(f"Bad chunk at {offset} of {remote_path}, requesting again")
+                    continue
+                bad_chunks = 0
+                if not data:
+                    raise RuntimeError(f"{remote_path} shrank to {offset} bytes during the pull")
+                f.write(data)
+                offset += len(data)
+        actual = await asyncio.to_thread(file_sha256, part)
+        if actual != sha256:
+            os.remove(part)
+            raise RuntimeError(f"content hash mismatch for {remote_path}, starting over")
+        os.replace(part, local_path)
+        return {"success": True, "path": local_path, "sha256": sha256, "size": size}
+
+    return await _with_resume(f"Pull of {remote_path}", attempt)
@@ -0,0 +1,34 @@
+"""
+Transfer constants and helpers used by the host side (MCP server, gateway, transfer client).
+
+The device has its own copies in app/src/main/python/file_transfer.py; the
+two sides ship separately, so they only have to agree on the wire format:
+CHUNK_SIZE no larger than the device's MAX_CHUNK_SIZE, and a hex SHA-256
+over the whole file.
+"""
+
+import hashlib
+
+CHUNK_SIZE = 64 * 1024  # bytes per push/pull chunk, one rpc.call each
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def loggable(msg):
+    """`msg` with bulky "data" payloads (chunks, screenshots, hierarchies) replaced by their size, at any depth"""
+    if not isinstance(msg, dict):
+        return msg
+    shown = {}
+    for key, value in msg.items():
+        if key == "data" and isinstance(value, (bytes, bytearray, str)) and len(value) > 64:
+            shown[key] = f"<{len(value)} bytes>"
+        else:
+            shown[key] = loggable(value)
+    changed = any(shown[key] is not msg[key] for key in msg)
+    return shown if changed else msg
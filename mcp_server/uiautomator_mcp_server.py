@@ -7,14 +7,26 @@ requests to the gateway server.
 """
 
 import asyncio
+import base64
 import json
 import logging
+import os
+import re
+import tempfile
+import uuid
+import zlib
 import socketio
-from typing import Any, Dict, List, Optional
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
 
 from fastmcp.server.server import FastMCP
 from fastmcp.server.http import create_sse_app
 
+from adaptive_timeout import AdaptiveTimeouts
+from perf_stats import PerfAggregator
+import transfer_client
+from transfer_common import loggable
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -26,6 +38,20 @@ logger = logging.getLogger(__name__)
 GATEWAY_URL = "http://192.168.2.53:8765"
 GATEWAY_TOKEN = "devtoken"
 
+# Gateway connection pool configuration
+GATEWAY_POOL_SIZE = int(os.environ.get("GATEWAY_POOL_SIZE", "4"))
+GATEWAY_RPC_TIMEOUT = 30.0          # fallback RPC timeout until a method has latency samples
+GATEWAY_HEALTH_INTERVAL = 10.0      # seconds between health check pings
+GATEWAY_PING_TIMEOUT = 5.0          # seconds to wait for a pong
+GATEWAY_RECONNECT_MAX_DELAY = 30.0  # backoff cap for reconnect attempts
+EVENT_BUFFER_SIZE = 1000            # device events kept for get_events
+TRANSFER_MAX_CONCURRENT = 2         # file transfers running at once, others wait
+OBSERVE_DIR = os.environ.get("MCP_OBSERVE_DIR", os.path.join(tempfile.gettempdir(), "mcp_observe"))  # screenshots
+
+# Read-only methods that are safe to resend when the connection drops after the call went out;
+# anything else may already have run on the device and is reported to the caller instead
+IDEMPOTENT_METHODS = ("ping", "get_device_info", "observe", "dump_hierarchy", "find_image", "list_watchers")
+
 # SSE Server configuration
 SSE_HOST = "0.0.0.0"
 SSE_PORT = 8766
@@ -35,16 +61,410 @@ SSE_PATH = "/mcp"
 mcp_server_instance = None
 
 
-class UIAutomatorMCPServer:
-    def __init__(self):
-        self.sio = socketio.AsyncClient()
+class RpcTimeout(RuntimeError):
+    """No result arrived within the call's timeout"""
+
+
+class CallNotSent(ConnectionError):
+    """The connection was down before the call frame could be emitted"""
+
+
+class GatewayConnection:
+    """A single Socket.IO connection to the gateway.
+
+    Tracks its own in-flight RPC calls so the pool can pick the least loaded
+    connection and fail pending calls when the socket drops.
+    """
+
+    def __init__(self, index: int, url: str, token: str):
+        self.index = index
+        self.url = url
+        self.token = token
+        self.connected = False
+        self.healthy = False
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.streams: Dict[str, asyncio.Queue] = {}  # fanout id -> per-device results then summary
+        self.pong_waiter: Optional[asyncio.Future] = None
+        self.reconnect_count = 0
+        self.subscription: Optional[dict] = None  # re-sent after every reconnect
+        self.on_event: Optional[Callable[[dict], None]] = None
+        self.disconnected = asyncio.Event()
+        self.sio = self._create_client()
+
+    def _create_client(self) -> socketio.AsyncClient:
+        # Reconnection is driven by the pool so backoff and health checks live in one place
+        sio = socketio.AsyncClient(reconnection=False)
+        sio.on('connect', self.on_connect)
+        sio.on('disconnect', self.on_disconnect)
+        sio.on('message', self.on_message)
+        return sio
+
+    @property
+    def load(self) -> int:
+        """Number of RPC calls waiting for a result on this connection"""
+        return len(self.pending) + len(self.streams)
+
+    async def connect(self):
+        """Open a fresh Socket.IO connection and register as a client"""
+        if self.sio.connected:
+            await self.sio.disconnect()
+        self.sio = self._create_client()
+        await self.sio.connect(
+            self.url,
+            headers={
+                "Authorization": f"Bearer {self.token}",
+                "X-Device-Id": f"mcp-server-client-{self.index}"
+            }
+        )
+        # Identify as a client before the first RPC call
+        await self.sio.emit('message', {"type": "hello", "role": "client"})
+        if self.subscription:
+            await self.sio.emit('message', self.subscription)
+
+    async def disconnect(self):
+        if self.sio.connected:
+            await self.sio.disconnect()
+        self._mark_disconnected()
+
+    async def on_connect(self):
+        """Handle gateway connection"""
+        logger.info(f"Gateway connection {self.index}: connected")
+        self.connected = True
+        self.healthy = True
+        self.reconnect_count = 0
+        self.disconnected.clear()
+
+    async def on_disconnect(self):
+        """Handle gateway disconnection"""
+        logger.info(f"Gateway connection {self.index}: disconnected")
+        self._mark_disconnected()
+
+    def _mark_disconnected(self):
         self.connected = False
+        self.healthy = False
+        self.disconnected.set()
+        # Results for calls sent on this socket can no longer reach us
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"gateway connection {self.index} lost"))
+        self.pending.clear()
+        for stream in self.streams.values():
+            stream.put_nowait(ConnectionError(f"gateway connection {self.index} lost"))
+        self.streams.clear()
+        if self.pong_waiter and not self.pong_waiter.done():
+            self.pong_waiter.set_result(False)
+
+    async def on_message(self, data):
+        """Handle messages from gateway"""
+        logger.debug(f"Gateway connection {self.index}: received message: {loggable(data)}")
+        if not isinstance(data, dict):
+            return
+        msg_type = data.get("type")
+        if msg_type in ("rpc.result", "rpc.error"):
+            future = self.pending.pop(data.get("id"), None)
+            if future and not future.done():
+                future.set_result(data)
+        elif msg_type == "subscribe.error":
+            logger.error(f"Gateway connection {self.index}: subscription rejected: {data.get('error')}")
+        elif msg_type == "pong":
+            if self.pong_waiter and not self.pong_waiter.done():
+                self.pong_waiter.set_result(True)
+        elif msg_type in ("rpc.fanout.result", "rpc.fanout.done"):
+            stream = self.streams.get(data.get("id"))
+            if stream:
+                stream.put_nowait(data)
+        elif msg_type == "event":
+            if self.on_event:
+                self.on_event(data)
+
+    async def call(self, rpc_data: dict, timeout: float) -> dict:
+        """Send an RPC call on this connection and wait for its result message"""
+        req_id = rpc_data["id"]
+        future = asyncio.get_running_loop().create_future()
+        self.pending[req_id] = future
+        try:
+            try:
+                await self.sio.emit('message', rpc_data)
+            except Exception as e:
+                raise CallNotSent(f"gateway connection {self.index}: {e}") from e
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(req_id, None)
+
+    async def fanout(self, fanout_data: dict, timeout: float):
+        """Send an rpc.fanout and yield per-device results, ending with the summary"""
+        fanout_id = fanout_data["id"]
+        stream: asyncio.Queue = asyncio.Queue()
+        self.streams[fanout_id] = stream
+        loop = asyncio.get_running_loop()
+        # The gateway sends the summary at its deadline; allow a little slack on top
+        deadline = loop.time() + timeout + 5.0
+        try:
+            await self.sio.emit('message', fanout_data)
+            while True:
+                message = await asyncio.wait_for(stream.get(), max(0.0, deadline - loop.time()))
+                if isinstance(message, Exception):
+                    raise message
+                yield message
+                if message.get("type") == "rpc.fanout.done":
+                    return
+        finally:
+            self.streams.pop(fanout_id, None)
+
+    async def ping(self, timeout: float) -> bool:
+        """Health check: send a ping and wait for the gateway's pong"""
+        self.pong_waiter = asyncio.get_running_loop().create_future()
+        try:
+            await self.sio.emit('message', {"type": "ping", "session": f"mcp-pool-{self.index}"})
+            return await asyncio.wait_for(self.pong_waiter, timeout)
+        except Exception:
+            return False
+        finally:
+            self.pong_waiter = None
+
+
+class GatewayConnectionPool:
+    """Pool of gateway connections with automatic reconnection, health checks
+    and least-loaded selection for outgoing RPC calls.
+    """
+
+    def __init__(self, url: str, token: str, size: int = GATEWAY_POOL_SIZE,
+                 health_interval: float = GATEWAY_HEALTH_INTERVAL,
+                 ping_timeout: float = GATEWAY_PING_TIMEOUT,
+                 reconnect_max_delay: float = GATEWAY_RECONNECT_MAX_DELAY):
+        self.url = url
+        self.token = token
+        self.size = max(1, size)
+        self.health_interval = health_interval
+        self.ping_timeout = ping_timeout
+        self.reconnect_max_delay = reconnect_max_delay
+        self.connections: List[GatewayConnection] = []
+        self.available: Optional[asyncio.Condition] = None
+        self.tasks: List[asyncio.Task] = []
+        self.running = False
+        self.event_handlers: List[Callable[[dict], None]] = []
+        self.requested: Optional[dict] = None  # subscription asked for by subscribe_events
+        self.required_events: set = set()      # kinds the server itself consumes (e.g. perf)
+        self.subscriber: Optional[GatewayConnection] = None  # the connection carrying the subscription
+
+    @property
+    def connected(self) -> bool:
+        return any(conn.healthy for conn in self.connections)
+
+    async def start(self):
+        """Open all connections and start one maintenance task per connection"""
+        self.running = True
+        self.available = asyncio.Condition()
+        self.connections = [GatewayConnection(i, self.url, self.token) for i in range(self.size)]
+        for conn in self.connections:
+            conn.on_event = self._dispatch_event
+        results = await asyncio.gather(*(conn.connect() for conn in self.connections), return_exceptions=True)
+        for conn, result in zip(self.connections, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Gateway connection {conn.index}: initial connect failed: {result}")
+        self.tasks = [asyncio.create_task(self._maintain(conn)) for conn in self.connections]
+        if not self.connected:
+            await self.close()
+            raise RuntimeError(f"Failed to connect to gateway at {self.url}")
+        logger.info(f"Gateway pool started: {sum(c.healthy for c in self.connections)}/{self.size} connections up")
+
+    async def close(self):
+        """Stop maintenance tasks and close every connection"""
+        self.running = False
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        await asyncio.gather(*(conn.disconnect() for conn in self.connections), return_exceptions=True)
+
+    async def _notify_available(self):
+        async with self.available:
+            self.available.notify_all()
+
+    async def _maintain(self, conn: GatewayConnection):
+        """Reconnect with backoff while down, ping periodically while up"""
+        while self.running:
+            if not conn.connected:
+                if conn is self.subscriber and conn.subscription:
+                    await self._send_subscription()  # keep events flowing on another connection
+                try:
+                    await conn.connect()
+                    logger.info(f"Gateway connection {conn.index}: reconnected")
+                    subscriber = self.subscriber
+                    if subscriber is not None and subscriber.subscription and not subscriber.connected:
+                        await self._send_subscription()
+                    await self._notify_available()
+                except Exception as e:
+                    conn.reconnect_count += 1
+                    delay = min(2 ** conn.reconnect_count, self.reconnect_max_delay)
+                    logger.warning(f"Gateway connection {conn.index}: reconnect failed ({e}), retrying in {delay}s")
+                    await asyncio.sleep(delay)
+                continue
+
+            try:
+                await asyncio.wait_for(conn.disconnected.wait(), self.health_interval)
+                continue  # Dropped while waiting, reconnect right away
+            except asyncio.TimeoutError:
+                pass
+
+            if await conn.ping(self.ping_timeout):
+                if not conn.healthy:
+                    conn.healthy = True
+                    await self._notify_available()
+            else:
+                logger.warning(f"Gateway connection {conn.index}: health check failed, recycling connection")
+                await conn.disconnect()
+
+    def _dispatch_event(self, event: dict):
+        for handler in self.event_handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                logger.error(f"Event handler failed: {e}")
+
+    async def subscribe(self, events: List[str], devices: Optional[List[str]] = None,
+                        logcat: Optional[Dict[str, Any]] = None):
+        """Subscribe to device events on one connection.
+
+        Only one connection carries the subscription so each event arrives once;
+        it is re-sent when that connection reconnects, or moved to another live
+        connection while it is down.
+        """
+        self.requested = {"events": list(events), "devices": devices, "logcat": logcat} if events else None
+        await self._send_subscription()
+
+    async def require_events(self, kinds: List[str]):
+        """Keep `kinds` subscribed on all devices regardless of subscribe_events"""
+        if set(kinds) <= self.required_events:
+            return
+        self.required_events |= set(kinds)
+        await self._send_subscription()
+
+    async def _send_subscription(self):
+        """Send the subscription on the connection carrying it, moving it to a live one if that is down"""
+        requested = self.requested or {"events": [], "devices": None, "logcat": None}
+        events = sorted(set(requested["events"]) | self.required_events)
+        subscription = None
+        if events:
+            # A device filter would hide the required kinds from the other devices
+            devices = requested["devices"] if not self.required_events else None
+            subscription = {"type": "subscribe", "events": events, "devices": devices}
+            if requested["logcat"]:
+                subscription["logcat"] = requested["logcat"]
+        conn = self.subscriber
+        if conn is None or not conn.connected:
+            conn = self._pick() or next((c for c in self.connections if c.connected), conn or self.connections[0])
+        for other in self.connections:
+            # The gateway drops a subscription with its socket, so a dropped one only needs forgetting
+            if other is not conn and other.subscription:
+                other.subscription = None
+                if other.connected:
+                    try:
+                        await other.sio.emit('message', {"type": "unsubscribe"})
+                    except Exception:
+                        pass
+        if conn is not self.subscriber and subscription:
+            logger.info(f"Gateway connection {conn.index}: carrying the event subscription")
+        self.subscriber = conn
+        conn.subscription = subscription
+        if conn.connected:
+            try:
+                await conn.sio.emit('message', subscription or {"type": "unsubscribe"})
+            except Exception as e:
+                logger.warning(f"Gateway connection {conn.index}: subscription not sent: {e}")
+
+    def _pick(self) -> Optional[GatewayConnection]:
+        healthy = [conn for conn in self.connections if conn.healthy]
+        if not healthy:
+            return None
+        return min(healthy, key=lambda conn: conn.load)
+
+    async def acquire(self, timeout: float) -> GatewayConnection:
+        """Return the least loaded healthy connection, waiting for a reconnect if none is up"""
+        conn = self._pick()
+        if conn:
+            return conn
+        async with self.available:
+            try:
+                await asyncio.wait_for(self.available.wait_for(lambda: self._pick() is not None), timeout)
+            except asyncio.TimeoutError:
+                raise RuntimeError("Not connected to gateway")
+        return self._pick()
+
+    async def call(self, rpc_data: dict, timeout: float = GATEWAY_RPC_TIMEOUT) -> dict:
+        """Send an RPC call on the least loaded connection.
+
+        A call that could not be emitted is sent on another connection within
+        the same overall timeout. Once the frame went out the device may have
+        run it, so a connection dropping before the result arrives only leads
+        to a resend for IDEMPOTENT_METHODS and is an error otherwise. The remaining time
+        is sent as `timeout` in the envelope so the gateway and the device
+        drop the call once nobody is waiting for it.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise RpcTimeout("RPC call timeout")
+            conn = await self.acquire(remaining)
+            remaining = deadline - loop.time()
+            rpc_data["timeout"] = round(remaining, 3)
+            try:
+                return await conn.call(rpc_data, remaining)
+            except asyncio.TimeoutError:
+                raise RpcTimeout("RPC call timeout")
+            except CallNotSent as e:
+                logger.warning(f"RPC call {rpc_data['id']} not sent: {e}, retrying")
+            except ConnectionError as e:
+                if rpc_data.get("method") not in IDEMPOTENT_METHODS:
+                    raise RuntimeError(f"Gateway connection lost before the result of {rpc_data['method']} "
+                                       f"arrived; it may have run on the device") from e
+                logger.warning(f"RPC call {rpc_data['id']} interrupted: {e}, retrying")
+
+    async def fanout(self, method: str, params: dict, tags: Optional[List[str]] = None,
+                     devices: Optional[List[str]] = None, timeout: float = GATEWAY_RPC_TIMEOUT):
+        """Run one call on every matching device; yields results as they arrive, then the summary"""
+        conn = await self.acquire(timeout)
+        fanout_data = {
+            "type": "rpc.fanout",
+            "id": f"mcp-fanout-{uuid.uuid4()}",
+            "method": method,
+            "params": params,
+            "tags": tags,
+            "devices": devices,
+            "timeout": timeout,
+        }
+        async for message in conn.fanout(fanout_data, timeout):
+            yield message
+
+    def stats(self) -> List[dict]:
+        return [
+            {"index": conn.index, "connected": conn.connected, "healthy": conn.healthy, "in_flight": conn.load}
+            for conn in self.connections
+        ]
+
+
+class UIAutomatorMCPServer:
+    def __init__(self, gateway_url: str = GATEWAY_URL, gateway_token: str = GATEWAY_TOKEN,
+                 pool_size: int = GATEWAY_POOL_SIZE):
+        self.pool = GatewayConnectionPool(gateway_url, gateway_token, pool_size)
+        self.timeouts = AdaptiveTimeouts(default=GATEWAY_RPC_TIMEOUT)
         self.device_available = False
-        
-        # Register Socket.IO event handlers
-        self.sio.on('connect', self.on_connect)
-        self.sio.on('disconnect', self.on_disconnect)
-        self.sio.on('message', self.on_message)
+
+        # Device events pushed by the gateway, numbered so clients can poll incrementally
+        self.events: deque = deque(maxlen=EVENT_BUFFER_SIZE)
+        self.event_seq = 0
+        self.pool.event_handlers.append(self.on_event)
+
+        # App performance samples from the devices' perf samplers
+        self.perf = PerfAggregator()
+
+        # Last observed content per facet: {"version": ..., "data": ...}
+        self.observed: Dict[str, dict] = {}
+
+        # Bounds how much of the pool bulk transfers can occupy
+        self.transfer_slots = asyncio.Semaphore(TRANSFER_MAX_CONCURRENT)
         
         # MCP server
         self.server = FastMCP("uiautomator-mcp-server")
@@ -91,43 +511,354 @@ class UIAutomatorMCPServer:
             except Exception as e:
                 return f"Error: {str(e)}"
 
-    async def on_connect(self):
-        """Handle gateway connection"""
-        logger.info("Connected to gateway")
-        self.connected = True
+        @self.server.tool(
+            name="fanout",
+            description="Run the same RPC method on all devices (or those with all the given tags) in parallel"
+        )
+        async def fanout(method: str, params: Optional[Dict[str, Any]] = None, tags: Optional[List[str]] = None,
+                         devices: Optional[List[str]] = None, timeout: float = GATEWAY_RPC_TIMEOUT) -> str:
+            """Scatter/gather one call across the device fleet"""
+            try:
+                results = []
+                summary = {}
+                async for message in self.pool.fanout(method, params or {}, tags, devices, timeout):
+                    if message.get("type") == "rpc.fanout.done":
+                        summary = message
+                    else:
+                        logger.info(f"Fanout result from {message.get('device_id')}")
+                        results.append(message)
+                return json.dumps({"results": results, "summary": summary}, indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
 
-    async def on_disconnect(self):
-        """Handle gateway disconnection"""
-        logger.info("Disconnected from gateway")
-        self.connected = False
-        self.device_available = False
+        @self.server.tool(
+            name="subscribe_events",
+            description="Subscribe to device events (app, toast, dialog, screen, logcat); an empty list unsubscribes. "
+                        "logcat takes an optional filter {\"tags\": [...], \"level\": \"W\", \"regex\": \"...\"}"
+        )
+        async def subscribe_events(events: List[str], devices: Optional[List[str]] = None,
+                                   logcat: Optional[Dict[str, Any]] = None) -> str:
+            """Subscribe to device-side change notifications"""
+            try:
+                if logcat and logcat.get("regex"):
+                    re.compile(logcat["regex"])  # the gateway rejects the whole subscription otherwise
+                await self.pool.subscribe(events, devices, logcat)
+                return json.dumps({"success": True, "events": events, "devices": devices, "logcat": logcat}, indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
 
-    async def on_message(self, data):
-        """Handle messages from gateway"""
-        logger.debug(f"Received message from gateway: {data}")
-        if isinstance(data, dict):
-            msg_type = data.get("type")
-            if msg_type == "rpc.result":
-                # Handle RPC result
-                req_id = data.get("id")
-                result = data.get("result", {})
-                logger.info(f"RPC result for {req_id}: {result}")
-            elif msg_type == "rpc.error":
-                # Handle RPC error
-                req_id = data.get("id")
-                error = data.get("error", "Unknown error")
-                logger.error(f"RPC error for {req_id}: {error}")
+        @self.server.tool(
+            name="get_events",
+            description="Get device events received after the given sequence number"
+        )
+        async def get_events(since: int = 0) -> str:
+            """Return buffered device events newer than `since`"""
+            events = [event for event in self.events if event["seq"] > since]
+            return json.dumps({"events": events, "last_seq": self.event_seq}, indent=2)
+
+        @self.server.tool(
+            name="push_file",
+            description="Upload a local file to the device (resumable, skipped if the device already has it)"
+        )
+        async def push_file(local_path: str, remote_path: str) -> str:
+            """Copy a file from the MCP server host to the device"""
+            try:
+                async with self.transfer_slots:
+                    result = await transfer_client.push_file(self.send_rpc_call, local_path, remote_path)
+                return json.dumps(result, indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+        @self.server.tool(
+            name="pull_file",
+            description="Download a file from the device to a local path (resumable, checksum verified)"
+        )
+        async def pull_file(remote_path: str, local_path: str) -> str:
+            """Copy a file from the device to the MCP server host"""
+            try:
+                async with self.transfer_slots:
+                    result = await transfer_client.pull_file(self.send_rpc_call, remote_path, local_path)
+                return json.dumps(result, indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+        @self.server.tool(
+            name="install_apk",
+            description="Upload a local APK to the device and install it with pm install -r"
+        )
+        async def install_apk(local_path: str, downgrade: bool = False) -> str:
+            """Install an APK from the MCP server host"""
+            try:
+                async with self.transfer_slots:
+                    pushed = await transfer_client.push_file(self.send_rpc_call, local_path)
+                result = await self.send_rpc_call("install_apk", {"sha256": pushed["sha256"], "downgrade": downgrade})
+                result["pushed"] = not pushed.get("skipped")
+                return json.dumps(result, indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+        @self.server.tool(
+            name="observe",
+            description="Observe the screen in one call: facets app, info, hierarchy, screenshot "
+                        "(default app + hierarchy). Facets unchanged since the last observe are marked "
+                        "unchanged instead of repeated unless changed_only is false. hierarchy_format "
+                        "is compact (pruned, one line per node) or xml; screenshot_width has the gateway "
+                        "downscale the screenshot to that many pixels wide"
+        )
+        async def observe(facets: Optional[List[str]] = None, changed_only: bool = True,
+                          hierarchy_format: str = "compact", screenshot_width: Optional[int] = None) -> str:
+            """Gather several facets of the current screen in one round trip"""
+            try:
+                return json.dumps(await self.observe(facets, changed_only, hierarchy_format, screenshot_width),
+                                  indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+        @self.server.tool(
+            name="dump_hierarchy",
+            description="Dump the UI hierarchy: compact (pruned, one line per node: id Class \"text\" "
+                        "~\"desc\" #resource-id [flags] @x,y) or the raw uiautomator xml"
+        )
+        async def dump_hierarchy(format: str = "compact") -> str:
+            """Return the current UI hierarchy"""
+            try:
+                result = await self.send_rpc_call("dump_hierarchy", {"format": format})
+                if not result.get("success"):
+                    return json.dumps(result, indent=2)
+                if format == "compact":
+                    logger.info(f"Compact hierarchy: {result['kept']}/{result['nodes']} nodes, "
+                                f"{result['xml_bytes']} -> {result['compact_bytes']} bytes in {result['compact_ms']}ms")
+                return result["hierarchy"]
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+        @self.server.tool(
+            name="input_text",
+            description="Type text into the focused field (fast IME, clipboard fallback), or set the text of "
+                        "the element matching selector (e.g. {\"resourceId\": \"com.app:id/search\"}) in one call"
+        )
+        async def input_text(text: str, selector: Optional[Dict[str, Any]] = None, clear: bool = False,
+                             mode: Optional[str] = None) -> str:
+            """Enter text; mode is auto, ime, clipboard, set_text or shell (input text, ASCII only)"""
+            try:
+                params: Dict[str, Any] = {"text": text, "clear": clear}
+                if selector:
+                    params["selector"] = selector
+                if mode:
+                    params["mode"] = mode
+                result = await self.send_rpc_call("input_text", params)
+                return json.dumps(result, indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+        @self.server.tool(
+            name="gesture",
+            description="Run gestures in one call, in order. Each is {\"type\": \"swipe\", \"points\": [[x, y], ...]}, "
+                        "{\"type\": \"drag\", \"from\": [x, y], \"to\": [x, y]}, {\"type\": \"pinch\", \"direction\": "
+                        "\"in\"|\"out\", \"selector\": {...}}, {\"type\": \"multi\", \"fingers\": [[start, end], [start, end]], "
+                        "\"selector\": {...}} or {\"type\": \"pause\", \"seconds\": s}; coordinates below 1 are screen fractions"
+        )
+        async def gesture(gestures: List[Dict[str, Any]]) -> str:
+            """Swipe paths, drags and multi-touch gestures batched into one round trip"""
+            try:
+                result = await self.send_rpc_call("gesture", {"gestures": gestures})
+                return json.dumps(result, indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+        @self.server.tool(
+            name="scroll_until",
+            description="Scroll (direction down/up/left/right, optionally inside a container selector) until an "
+                        "element matching selector appears or the list ends; optionally click it"
+        )
+        async def scroll_until(selector: Dict[str, Any], direction: str = "down",
+                               container: Optional[Dict[str, Any]] = None, max_swipes: int = 15,
+                               click: bool = False) -> str:
+            """Scroll and look on the device, returning once"""
+            try:
+                params: Dict[str, Any] = {"selector": selector, "direction": direction,
+                                          "max_swipes": max_swipes, "click": click}
+                if container:
+                    params["container"] = container
+                result = await self.send_rpc_call("scroll_until", params)
+                return json.dumps(result, indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+        @self.server.tool(
+            name="find_image",
+            description="Find a template image (local PNG/JPEG path) on the device screen; "
+                        "returns score, center and bounds"
+        )
+        async def find_image(template_path: str, threshold: float = 0.8) -> str:
+            """Locate a UI element by its appearance instead of a selector"""
+            try:
+                result = await self.image_rpc("find_image", template_path, threshold)
+                return json.dumps(result, indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+        @self.server.tool(
+            name="click_image",
+            description="Click the center of a template image (local PNG/JPEG path) found on the device screen"
+        )
+        async def click_image(template_path: str, threshold: float = 0.8) -> str:
+            """Find a template image and click it"""
+            try:
+                result = await self.image_rpc("click_image", template_path, threshold)
+                return json.dumps(result, indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+        @self.server.tool(
+            name="start_perf",
+            description="Start sampling CPU, memory (PSS) and frame stats of an app on the device"
+        )
+        async def start_perf(package: str, interval: float = 1.0) -> str:
+            """Start the device-side performance sampler for a package"""
+            try:
+                await self.pool.require_events(["perf"])
+                self.perf.forget(package)
+                result = await self.send_rpc_call("start_perf", {"package": package, "interval": interval})
+                return json.dumps(result, indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+        @self.server.tool(
+            name="get_perf_stats",
+            description="Percentiles of CPU %, PSS, jank and frame time for a sampled app"
+        )
+        async def get_perf_stats(package: str, device_id: Optional[str] = None) -> str:
+            """Summarize the samples received so far"""
+            return json.dumps(self.perf.summary(package, device_id), indent=2)
+
+        @self.server.tool(
+            name="stop_perf",
+            description="Stop sampling an app and return its performance summary"
+        )
+        async def stop_perf(package: str) -> str:
+            """Stop the device-side sampler; its last batch is sent before the result"""
+            try:
+                result = await self.send_rpc_call("stop_perf", {"package": package})
+                result["stats"] = self.perf.summary(package)
+                return json.dumps(result, indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+        @self.server.tool(
+            name="set_watchers",
+            description="Register popup watchers on the device, e.g. {\"name\": \"allow\", \"when\": "
+                        "\"//*[@text='Allow']\"} or {\"name\": \"later\", \"selector\": {\"text\": \"Later\"}, "
+                        "\"action\": \"click\"|\"back\"|\"home\", \"target\": xpath, \"limit\": n}; presets: "
+                        "permission, anr, crash, update. Handled popups are read with list_watchers"
+        )
+        async def set_watchers(rules: Optional[List[Dict[str, Any]]] = None, presets: Optional[List[str]] = None,
+                               interval: Optional[float] = None, replace: bool = False) -> str:
+            """Add (or with replace, set) the device's popup watcher rules"""
+            try:
+                params: Dict[str, Any] = {"rules": rules or [], "presets": presets or [], "replace": replace}
+                if interval:
+                    params["interval"] = interval
+                result = await self.send_rpc_call("set_watchers", params)
+                return json.dumps(result, indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+        @self.server.tool(
+            name="remove_watchers",
+            description="Remove popup watchers by name, or all of them when names is omitted"
+        )
+        async def remove_watchers(names: Optional[List[str]] = None) -> str:
+            """Unregister watcher rules; the watcher thread stops when none are left"""
+            try:
+                params = {"names": names} if names is not None else {}
+                result = await self.send_rpc_call("remove_watchers", params)
+                return json.dumps(result, indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+        @self.server.tool(
+            name="list_watchers",
+            description="List the device's popup watchers with how often each was triggered, and the popups "
+                        "handled after sequence number `since` (pass the last_seq of the previous call)"
+        )
+        async def list_watchers(since: int = 0) -> str:
+            """Registered watcher rules, trigger counts and recently handled popups"""
+            try:
+                result = await self.send_rpc_call("list_watchers", {"since": since})
+                return json.dumps(result, indent=2)
+            except Exception as e:
+                return f"Error: {str(e)}"
+
+    async def image_rpc(self, method: str, template_path: str, threshold: float) -> dict:
+        """find_image / click_image with the template sent as a binary attachment"""
+        with open(template_path, "rb") as f:
+            template = f.read()
+        return await self.send_rpc_call(method, {"template": template, "threshold": threshold})
+
+    async def observe(self, facets: Optional[List[str]] = None, changed_only: bool = True,
+                      hierarchy_format: str = "compact", screenshot_width: Optional[int] = None) -> dict:
+        """Run the observe RPC, sending the versions already seen so unchanged facets come back empty"""
+        params: Dict[str, Any] = {
+            "since": {facet: seen["version"] for facet, seen in self.observed.items()},
+            "hierarchy_format": hierarchy_format,
+        }
+        if facets:
+            params["facets"] = facets
+        # The gateway re-encodes the screenshot in its worker processes
+        transform = {"image": {"max_width": screenshot_width}} if screenshot_width else None
+        result = await self.send_rpc_call("observe", params, transform=transform)
+        if not result.get("success"):
+            return result
+        for facet, entry in result["facets"].items():
+            if "data" in entry:
+                data = entry["data"]
+                if facet == "screenshot" and not isinstance(data, (bytes, bytearray)):
+                    # Older bridges turned screenshots queued in their outbox into strings
+                    result["facets"][facet] = {"error": f"screenshot arrived as {type(data).__name__}, not bytes"}
+                    continue
+                if facet == "screenshot":
+                    # Keep image bytes out of the JSON answer
+                    os.makedirs(OBSERVE_DIR, exist_ok=True)
+                    path = os.path.join(OBSERVE_DIR, f"screenshot-{entry['version']}.jpg")
+                    with open(path, "wb") as f:
+                        f.write(data)
+                    data = {"path": path, "size": len(entry["data"])}
+                self.observed[facet] = {"version": entry["version"], "data": data}
+                entry["data"] = data
+            elif entry.get("unchanged") and not changed_only:
+                entry["data"] = self.observed[facet]["data"]
+        return result
+
+    def on_event(self, event: dict):
+        """Buffer a device event pushed by the gateway"""
+        data = event.get("data")
+        if event.get("kind") == "perf" and isinstance(data, dict):
+            # Sample batches go to the aggregator, get_perf_stats reads them from there
+            self.perf.add(event.get("device_id"), data)
+            return
+        if event.get("kind") == "logcat" and isinstance(data, dict) and data.get("encoding") == "zlib+base64":
+            # Logcat batches travel compressed; store them as plain lines
+            lines = zlib.decompress(base64.b64decode(data["lines"])).decode("utf-8", "replace").split("\n")
+            data = {"filter": data.get("filter"), "count": data.get("count"), "lines": lines}
+        self.event_seq += 1
+        self.events.append({
+            "seq": self.event_seq,
+            "device_id": event.get("device_id"),
+            "kind": event.get("kind"),
+            "ts": event.get("ts"),
+            "data": data,
+        })
+
+    @property
+    def connected(self) -> bool:
+        """True while at least one pooled gateway connection is healthy"""
+        return self.pool.connected
 
     async def connect_to_gateway(self):
         """Connect to the gateway server"""
         try:
-            await self.sio.connect(
-                GATEWAY_URL,
-                headers={
-                    "Authorization": f"Bearer {GATEWAY_TOKEN}",
-                    "X-Device-Id": "mcp-server-client"
-                }
-            )
+            await self.pool.start()
             logger.info("Successfully connected to gateway")
         except Exception as e:
             logger.error(f"Failed to connect to gateway: {e}")
@@ -136,36 +867,51 @@ class UIAutomatorMCPServer:
     async def disconnect_from_gateway(self):
         """Disconnect from the gateway server"""
         logger.info("Disconnecting from gateway...")
-        if self.connected:
-            await self.sio.disconnect()
-            logger.info("Disconnected from gateway")
+        await self.pool.close()
+        logger.info("Disconnected from gateway")
 
-    async def send_rpc_call(self, method: str, params: dict) -> dict:
-        """Send RPC call to gateway and wait for response"""
-        logger.info(f"Preparing to send RPC call: method={method}, params={params}")
-        logger.info(f"Connected to gateway: {self.connected}")
-        if not self.connected:
-            raise RuntimeError("Not connected to gateway")
+    async def send_rpc_call(self, method: str, params: dict, timeout: Optional[float] = None,
+                            transform: Optional[dict] = None) -> dict:
+        """Send RPC call to gateway and wait for response.
+
+        Without an explicit timeout the deadline adapts to the method's recent latency.
+        `transform` asks the gateway to process payloads in the result (see payload_workers.py).
+        """
+        if timeout is None:
+            timeout = self.timeouts.timeout_for(method)
+        logger.info(f"Preparing to send RPC call: method={method}, params={loggable(params)}")
         
         # Create RPC call
         rpc_data = {
             "type": "rpc.call",
-            "id": f"mcp-{method}-{id(params)}",
+            "id": f"mcp-{method}-{uuid.uuid4()}",
             "method": method,
             "params": params
         }
+        if transform:
+            rpc_data["transform"] = transform
         
-        logger.info(f"Sending RPC call: {method} with params: {params}")
+        logger.info(f"Sending RPC call: {method} with params: {loggable(params)} (timeout {timeout:.1f}s)")
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            response = await self.pool.call(rpc_data, timeout)
+        except RpcTimeout:
+            # The gateway's own deadline fires later, so slow calls end here. The
+            # elapsed time is a lower bound on the latency; recording it lets a
+            # method whose default shrank grow it again instead of timing out forever
+            self.timeouts.observe(method, loop.time() - started)
+            raise
+        self.timeouts.observe(method, loop.time() - started)
         
-        # Send RPC call
-        await self.sio.emit('message', rpc_data)
+        if response.get("type") == "rpc.error":
+            error = response.get("error", "Unknown error")
+            logger.error(f"RPC error for {rpc_data['id']}: {error}")
+            raise RuntimeError(error)
         
-        # For now, return a simple success response
-        # In a real implementation, you would wait for the actual response
-        return {
-            "success": True,
-            "message": f"RPC call {method} sent to gateway"
-        }
+        result = response.get("result", {})
+        logger.info(f"RPC result for {rpc_data['id']}: {loggable(result)}")
+        return result
 
     async def run(self):
         """Run the MCP server using SSE transport"""
@@ -200,10 +946,8 @@ class UIAutomatorMCPServer:
             logger.error(f"Error in run: {e}")
             raise
         finally:
-            # Disconnect from gateway if connected
-            if self.connected:
-                logger.info("Disconnecting from gateway...")
-                await self.disconnect_from_gateway()
+            # Close all pooled gateway connections
+            await self.disconnect_from_gateway()
 
 
 async def main():